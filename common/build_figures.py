@@ -0,0 +1,246 @@
+"""Incremental build of the failure probability figures.
+
+The figures are built in four stages, each stored in build/<scenario>/ under a key
+hashing its inputs (common.pipeline):
+
+    cell       N SquidASM trials at one (m, p)       config.yaml, application and failure code, N, mu, lam,
+                                                     state formalism
+    aggregate  failure probabilities and SEs         the cells of the figure
+    theory     exact failure probabilities           config.yaml, exact and noise model code
+    figure     the PNG in the scenario directory     aggregate, theory, figure style, this file
+
+Only stale stages are rebuilt: restyling a figure re-renders it from the stored
+aggregates in seconds, and extending a grid only simulates the new cells. Run it
+from the repository root:
+
+    python -m common.build_figures --scenario no_faulty node1_faulty
+"""
+import argparse
+import math
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+
+import matplotlib.pyplot as plt
+
+from common.config import load_config, select_formalism, set_formalism, set_gate_noise
+from common.criteria import no_faulty_failure, node1_faulty_failure, sender_faulty_failure
+from common.noise_model import round_distribution
+from common.pipeline import ROOT, Store, stage_key
+from common.planner import EXACT, load_application
+from common.telemetry import Telemetry, map_with_telemetry
+from common.trial_log import configure_trial_log, flush_trial_log
+
+CONFIG_PATH = os.path.join(ROOT, "config.yaml")
+mu, lam = 0.272, 0.94
+N = 1000  # Trials per cell
+NUM_CORES = cpu_count()
+
+
+SCENARIOS = {
+    "no_faulty": dict(title="No Faulty", is_failure=no_faulty_failure),
+    "node1_faulty": dict(title="R0 Faulty", is_failure=node1_faulty_failure),
+    "sender_faulty": dict(title="Sender Faulty", is_failure=sender_faulty_failure),
+}
+
+# One m sweep (noiseless) and one noise sweep (m = 300) per scenario, as the run_*.py scripts
+FIGURES = {
+    "no_faulty": [
+        dict(file="no_faulty_1000.png", m=list(range(20, 400, 20)), p=[0.]),
+        dict(file="no_faulty_noise_1000.png", m=[300], p=[p / 1000000 for p in range(0, 101, 5)]),
+    ],
+    "node1_faulty": [
+        dict(file="node1_faulty_1000.png", m=list(range(20, 400, 20)), p=[0.]),
+        dict(file="node1_faulty_noise_1000.png", m=[300], p=[p / 1000000 for p in range(0, 101, 5)]),
+    ],
+    "sender_faulty": [
+        dict(file="sender_faulty_1000.png", m=list(range(20, 400, 20)), p=[0.]),
+        dict(file="sender_faulty_noise_1000.png", m=[300], p=[p / 100000 for p in range(0, 31, 1)]),
+    ],
+}
+
+# Style of the figures, part of the figure key
+STYLE = dict(dpi=300, m_figsize=(6, 4), p_figsize=(8, 5), threshold=0.05)
+
+_applications = {}
+_formalism = None
+
+
+def configure_worker(formalism: str = None):
+    """Pool initializer: quiet trial log and the state formalism override of the sweep."""
+    global _formalism
+    configure_trial_log()
+    _formalism = formalism
+
+
+def simulate_chunk(args):
+    from common.config import to_network_config
+    from common.streaming import FailureCounter, run_streaming
+
+    scenario, m, p, chunk_size = args
+    if scenario not in _applications:
+        _applications[scenario] = load_application(scenario)
+    application = _applications[scenario]
+    sender_kwargs = dict(mu=mu, lam=lam) if scenario == "sender_faulty" else {}
+
+    config = set_gate_noise(load_config(CONFIG_PATH), p)
+    set_formalism(select_formalism(config, _formalism))
+    counter = FailureCounter(SCENARIOS[scenario]["is_failure"])
+    run_streaming(
+        config=to_network_config(config),
+        programs={
+            "Node1": application.Node1Program(m=m, mu=mu, lam=lam),
+            "Node2": application.Node2Program(m=m, mu=mu, lam=lam),
+            "Sender": application.SenderProgram(m=m, **sender_kwargs),
+        },
+        num_times=chunk_size,
+        reducers=[counter],
+    )
+
+    flush_trial_log()
+    return scenario, m, p, counter.failures, counter.runs
+
+
+def cell_key(scenario, m, p, formalism: str = None):
+    application = os.path.join(ROOT, scenario, "application.py")
+    # config.py builds the network config of every cell and is imported by the applications
+    code = [os.path.join(ROOT, "common", f)
+            for f in ("routines.py", "noise_model.py", "sender_strategy.py", "criteria.py", "streaming.py",
+                      "config.py", "trial_log.py")]
+    # With noise KET samples it on the ket while DM tracks the mixed state, so a noisy cell
+    # is not guaranteed the same under both: the formalism simulate_chunk uses is in the key
+    formalism = select_formalism(set_gate_noise(load_config(CONFIG_PATH), p), formalism)
+    return stage_key("cell", dict(scenario=scenario, m=m, p=p, N=N, mu=mu, lam=lam, formalism=formalism),
+                     files=[CONFIG_PATH, application] + code)
+
+
+def cell_name(m, p):
+    return f"cell-m{m}-p{p:.3e}"
+
+
+def build_cells(store, stale, pool, telemetry=None, formalism=None):
+    """Simulate the stale (scenario, m, p) cells, all chunks in one pool.
+
+    formalism is the override the pool was configured with (configure_worker).
+    """
+    tasks = []
+    for scenario, m, p in stale:
+        for i in range(NUM_CORES):
+            chunk = N // NUM_CORES + (1 if i < N % NUM_CORES else 0)
+            if chunk > 0:
+                tasks.append((scenario, m, p, chunk))
+
+    counts = {}
+    if telemetry is not None:
+        chunk_results = map_with_telemetry(pool, simulate_chunk, tasks, telemetry, lambda r: (r[:3], r[3], r[4]))
+    else:
+        chunk_results = pool.map(simulate_chunk, tasks)
+    for scenario, m, p, failures, runs in chunk_results:
+        cell = counts.setdefault((scenario, m, p), {"failures": 0, "runs": 0})
+        cell["failures"] += failures
+        cell["runs"] += runs
+    for (scenario, m, p), cell in counts.items():
+        store[scenario].save(cell_name(m, p), cell_key(scenario, m, p, formalism), cell)
+
+
+def aggregate(cells):
+    probs = [c["failures"] / c["runs"] for c in cells]
+    sems = [math.sqrt(prob * (1 - prob) / c["runs"]) for prob, c in zip(probs, cells)]
+    return {"prob": probs, "sem": sems}
+
+
+def theory(scenario, figure):
+    config = load_config(CONFIG_PATH)
+    return [
+        EXACT[scenario](round_distribution(set_gate_noise(config, p)), m, mu, lam)
+        for p in figure["p"] for m in figure["m"]
+    ]
+
+
+def render(scenario, figure, estimates, exact):
+    title = SCENARIOS[scenario]["title"]
+    path = os.path.join(ROOT, scenario, figure["file"])
+    if len(figure["p"]) == 1:
+        plt.figure(figsize=STYLE["m_figsize"])
+        plt.plot(
+            figure["m"], exact,
+            "o",
+            markerfacecolor="white",
+            markeredgecolor="green",
+            markeredgewidth=1.5,
+            linestyle="None",
+            label="Exact"
+        )
+        plt.errorbar(figure["m"], estimates["prob"], yerr=estimates["sem"], fmt='rx', label="Monte Carlo", capsize=5)
+        plt.xlabel("number of four-qubit singlet states, $m$")
+        plt.ylabel("failure probability")
+        plt.title(f"Failure Probabilities ({title}, N={N})")
+    else:
+        plt.figure(figsize=STYLE["p_figsize"])
+        plt.errorbar(figure["p"], estimates["prob"], yerr=estimates["sem"], fmt='o-', capsize=5,
+                     label="Failure Probability")
+        plt.plot(figure["p"], exact, 'g--', label="Exact")
+        plt.axhline(y=STYLE["threshold"], color='red', linestyle='--', label=f"{STYLE['threshold']:.0%} Threshold")
+        plt.xlabel("Gate Depolarizing Probability")
+        plt.ylabel("Failure Probability")
+        plt.title(f"Failure Probability vs Gate Depolarizing Probability ({title}, N={N}, m={figure['m'][0]})")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(path, dpi=STYLE["dpi"])
+    plt.close()
+    return {"file": figure["file"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the stale stages of the figures")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), nargs="+", default=sorted(SCENARIOS))
+    parser.add_argument("--dry-run", action="store_true", help="only list the stale stages")
+    parser.add_argument("--formalism", choices=["KET", "DM"], default=None,
+                        help="NetSquid state formalism, by default KET for noiseless cells and DM otherwise")
+    parser.add_argument("--telemetry", action="store_true",
+                        help="rewrite build/telemetry.json and build/telemetry.prom with the progress every few seconds")
+    parser.add_argument("--progress", action="store_true", help="with --telemetry, show a progress line")
+    args = parser.parse_args()
+
+    store = {s: Store(os.path.join(ROOT, "build", s)) for s in args.scenario}
+    stale = sorted({
+        (s, m, p)
+        for s in args.scenario for figure in FIGURES[s] for p in figure["p"] for m in figure["m"]
+        if not store[s].has(cell_name(m, p), cell_key(s, m, p, args.formalism))
+    })
+    print(f"{len(stale)} stale cells ({len(stale) * N} trials)")
+    if args.dry_run:
+        for scenario, m, p in stale:
+            print(f"  {scenario}: m = {m}, p = {p:.2e}")
+        sys.exit(0)
+    if stale:
+        with Pool(processes=NUM_CORES, initializer=configure_worker, initargs=(args.formalism,)) as pool:
+            telemetry = None
+            if args.telemetry:
+                telemetry = Telemetry({cell: N for cell in stale}, path=os.path.join(ROOT, "build", "telemetry"),
+                                      terminal=args.progress)
+            build_cells(store, stale, pool, telemetry, args.formalism)
+
+    for scenario in args.scenario:
+        exact_code = [os.path.join(ROOT, "common", f) for f in ("exact.py", "noise_model.py")]
+        for figure in FIGURES[scenario]:
+            name = os.path.splitext(figure["file"])[0]
+            grid = [(m, p) for p in figure["p"] for m in figure["m"]]
+            keys = [cell_key(scenario, m, p, args.formalism) for m, p in grid]
+            cells = [store[scenario].load(cell_name(m, p), key) for (m, p), key in zip(grid, keys)]
+            aggregate_key = stage_key("aggregate", {}, deps=keys)
+            estimates = store[scenario].cached(f"aggregate-{name}", aggregate_key, lambda: aggregate(cells))
+
+            theory_key = stage_key("theory", dict(scenario=scenario, m=figure["m"], p=figure["p"], mu=mu, lam=lam),
+                                   files=[CONFIG_PATH] + exact_code)
+            exact = store[scenario].cached(f"theory-{name}", theory_key, lambda: theory(scenario, figure))
+
+            figure_key = stage_key("figure", dict(figure, style=STYLE), files=[os.path.abspath(__file__)],
+                                   deps=[aggregate_key, theory_key])
+            path = os.path.join(ROOT, scenario, figure["file"])
+            if store[scenario].has(f"figure-{name}", figure_key) and os.path.exists(path):
+                print(f"{scenario}/{figure['file']} up to date")
+                continue
+            store[scenario].save(f"figure-{name}", figure_key, render(scenario, figure, estimates, exact))
+            print(f"{scenario}/{figure['file']} rendered")
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import yaml
+
+
+def load_config(path: str = "../config.yaml") -> dict:
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
+
+def stack_qdevice_cfg(config: dict, name: str) -> dict:
+    for stack in config.get("stacks", []):
+        if stack["name"] == name:
+            return stack["qdevice_cfg"]
+    raise KeyError(f"No stack named {name} in config")
+
+
+def link_cfg(config: dict, stack1: str, stack2: str) -> dict:
+    for link in config.get("links", []):
+        if {link["stack1"], link["stack2"]} == {stack1, stack2}:
+            return link["cfg"]
+    raise KeyError(f"No link between {stack1} and {stack2} in config")
+
+
+def set_qdevice_param(config: dict, key: str, value) -> dict:
+    """Set a qdevice_cfg parameter on every qdevice."""
+    config.get("qdevice_cfg", {})[key] = value
+    for stack in config.get("stacks", []):
+        if "qdevice_cfg" in stack:
+            stack["qdevice_cfg"][key] = value
+    return config
+
+
+def set_link_param(config: dict, key: str, value, links: str = "links") -> dict:
+    """Set a cfg parameter on every quantum link, or every classical link with links="clinks"."""
+    if links == "links":
+        config.get("link_cfg", {})[key] = value
+    for link in config.get(links, []):
+        link["cfg"][key] = value
+    return config
+
+
+def set_gate_noise(config: dict, p_value: float) -> dict:
+    """Set the single and two qubit gate depolarizing probability on every qdevice."""
+    set_qdevice_param(config, "single_qubit_gate_depolar_prob", p_value)
+    return set_qdevice_param(config, "two_qubit_gate_depolar_prob", p_value)
+
+
+def check_state_injection(config: dict, name: str = "Sender"):
+    """Raise ValueError unless the gates of stack name are noiseless.
+
+    Direct state injection skips the gates of prepare_state and with them their
+    noise, so it only reproduces the gate sequence without gate noise.
+    """
+    qdevice = stack_qdevice_cfg(config, name)
+    noise = {key: qdevice.get(key, 0.) for key in ("single_qubit_gate_depolar_prob", "two_qubit_gate_depolar_prob")}
+    if any(noise.values()):
+        raise ValueError(
+            f"inject_state is only valid without gate noise on {name}, got "
+            + ", ".join(f"{key} = {value}" for key, value in noise.items())
+        )
+
+
+def is_noise_key(key: str) -> bool:
+    """Whether a qdevice_cfg key is a noise parameter: a decoherence time (T1, T2,
+    electron_T2, ...), a depolarizing or dephasing probability or a readout error."""
+    return key.endswith(("T1", "T2")) or any(word in key for word in ("depolar", "dephas", "prob_error"))
+
+
+def is_noiseless(config: dict) -> bool:
+    """True if every qdevice is generic without noise and every quantum link is perfect.
+
+    Anything not known to be noiseless counts as noisy: a qdevice of another type, a
+    noise parameter of a generic qdevice that is not 0 (T1 = T2 = 0 disables
+    decoherence there), and a link that is neither perfect nor depolarise with
+    fidelity 1, such as a heralded link.
+    """
+    for stack in config.get("stacks", []):
+        if stack.get("qdevice_typ", "generic") != "generic":
+            return False
+        if any(value for key, value in stack.get("qdevice_cfg", {}).items() if is_noise_key(key)):
+            return False
+    for link in config.get("links", []):
+        perfect = link.get("typ") == "perfect" or (
+            link.get("typ") == "depolarise" and float(link.get("cfg", {}).get("fidelity", 1)) == 1)
+        if not perfect:
+            return False
+    return True
+
+
+def select_formalism(config: dict, override: str = None) -> str:
+    """NetSquid state formalism for config: "KET" when noiseless, "DM" otherwise, unless overridden."""
+    if override is not None:
+        if override not in ("KET", "DM"):
+            raise ValueError(f"Unknown formalism {override}")
+        return override
+    return "KET" if is_noiseless(config) else "DM"
+
+
+def set_formalism(formalism: str):
+    """Set the NetSquid state formalism of this process, call it before every run."""
+    import netsquid as ns
+
+    ns.set_qstate_formalism(getattr(ns.QFormalism, formalism))
+
+
+def to_network_config(config: dict):
+    """Build a StackNetworkConfig from a (modified) config dict via a temporary file."""
+    # Imported here so the exact evaluators can be used without SquidASM
+    from squidasm.run.stack.config import StackNetworkConfig
+
+    temp_file = tempfile.NamedTemporaryFile(mode="w+", suffix=".yaml", delete=False)
+    try:
+        yaml.dump(config, temp_file, sort_keys=False)
+        temp_file.flush()
+        temp_path = temp_file.name
+        temp_file.close()
+        return StackNetworkConfig.from_file(temp_path)
+    finally:
+        if os.path.exists(temp_file.name):
+            os.remove(temp_file.name)
@@ -0,0 +1,21 @@
+"""Failure predicates of the scenarios on the three node results of a trial.
+
+They are the only definitions: the run_simulation.py scripts and the sensitivity
+study import them, as do the shared tools (build_figures, failure_surface, the
+formalism benchmark). They are part of the key of every cached cell, so changing one
+here invalidates the cells that counted with it.
+"""
+
+
+def no_faulty_failure(sender_result, node1_result, node2_result):
+    y0, y1 = node1_result["y0"], node2_result["y1"]
+    return y0 is None or y1 is None or y0 != y1
+
+
+def node1_faulty_failure(sender_result, node1_result, node2_result):
+    return sender_result["xs"] != node2_result["y1"] or node1_result["y0"] is None
+
+
+def sender_faulty_failure(sender_result, node1_result, node2_result):
+    y0, y1 = node1_result["y0"], node2_result["y1"]
+    return int(y0 != y1 and None not in (y0, y1)) + int(sender_result["xs"] == -1)
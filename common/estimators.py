@@ -0,0 +1,55 @@
+import math
+
+STAT_KEYS = ["n", "sum_y", "sum_x", "sum_yy", "sum_xx", "sum_xy"]
+
+
+def trial_stats(ys, xs) -> dict:
+    """Sufficient statistics of paired per trial values (y: failure, x: control)."""
+    return {
+        "n": len(ys),
+        "sum_y": sum(ys),
+        "sum_x": sum(xs),
+        "sum_yy": sum(y * y for y in ys),
+        "sum_xx": sum(x * x for x in xs),
+        "sum_xy": sum(y * x for y, x in zip(ys, xs)),
+    }
+
+
+def add_trial(stats: dict, y: float, x: float) -> dict:
+    """Add one (y, x) pair to the sufficient statistics in place."""
+    for key, value in zip(STAT_KEYS, [1, y, x, y * y, x * x, y * x]):
+        stats[key] = stats.get(key, 0) + value
+    return stats
+
+
+def merge_stats(a: dict, b: dict) -> dict:
+    return {key: a.get(key, 0) + b.get(key, 0) for key in STAT_KEYS}
+
+
+def control_variate_estimate(stats: dict, mean_x: float):
+    """Control variate estimate of E[y] using a control x with known mean.
+
+    Returns (estimate, standard error, effective sample size gain), where the gain is
+    Var(y) / Var(y - beta x) = 1 / (1 - rho^2) for the estimated optimal beta.
+    """
+    n = stats["n"]
+    y_bar = stats["sum_y"] / n
+    x_bar = stats["sum_x"] / n
+    var_y = stats["sum_yy"] / n - y_bar ** 2
+    var_x = stats["sum_xx"] / n - x_bar ** 2
+    cov_xy = stats["sum_xy"] / n - x_bar * y_bar
+
+    if var_x <= 0:
+        return y_bar, math.sqrt(max(var_y, 0) / n), 1.
+    beta = cov_xy / var_x
+    estimate = y_bar - beta * (x_bar - mean_x)
+    var_residual = max(var_y - cov_xy ** 2 / var_x, 0)
+    gain = var_y / var_residual if var_residual > 0 else math.inf
+    return estimate, math.sqrt(var_residual / n), gain
+
+
+def indicator_correlation(n_a: int, n_b: int, n_ab: int, n: int) -> float:
+    """Pearson correlation of two 0/1 indicators from their counts over n trials."""
+    p_a, p_b, p_ab = n_a / n, n_b / n, n_ab / n
+    var = p_a * (1 - p_a) * p_b * (1 - p_b)
+    return (p_ab - p_a * p_b) / math.sqrt(var) if var > 0 else 0.
@@ -0,0 +1,173 @@
+"""Exact failure probabilities from a per round outcome distribution.
+
+Rounds are i.i.d., so every scenario only depends on how many rounds fall into
+each outcome class. `probs` is the (2, 2, 2, 2) array P[r0, r1, r2, r3] returned
+by noise_model.round_distribution, the failure criteria are the ones used in the
+run_simulation.py scripts of each scenario.
+"""
+import math
+
+import numpy as np
+from scipy.special import gammaln, xlog1py, xlogy
+
+
+def _ratio(a, b):
+    return a / b if b > 0 else 0.
+
+
+_log_factorial = gammaln(np.arange(1, 1025))
+
+
+def _binom_pmf(k, n, p):
+    """Vectorized binomial pmf for integer k and n, zero outside 0 <= k <= n."""
+    global _log_factorial
+    k, n = np.broadcast_arrays(np.asarray(k, dtype=int), np.asarray(n, dtype=int))
+    valid = (k >= 0) & (k <= n)
+    k = np.where(valid, k, 0)
+    n = np.where(valid, n, 0)
+    if n.size and n.max() >= len(_log_factorial):
+        _log_factorial = gammaln(np.arange(1, 2 * n.max() + 2))
+    log_pmf = _log_factorial[n] - _log_factorial[k] - _log_factorial[n - k] + xlogy(k, p) + xlog1py(n - k, -p)
+    return np.where(valid, np.exp(log_pmf), 0.)
+
+
+def _binom_tail_table(n_max: int, p: float) -> np.ndarray:
+    """table[n, j] = P(Bin(n, p) >= j) for 0 <= n <= n_max and 0 <= j <= n_max + 1."""
+    n = np.arange(n_max + 1)[:, None]
+    j = np.arange(n_max + 2)[None, :]
+    pmf = _binom_pmf(j, n, p)
+    return np.cumsum(pmf[:, ::-1], axis=1)[:, ::-1]
+
+
+def no_faulty_failure(probs: np.ndarray, m: int, mu: float) -> float:
+    """Failure probability with honest nodes.
+
+    The receivers agree on xs iff at least T rounds have r0 = r1 = xs and every one
+    of them has r2 = r3 = 1 - xs.
+    """
+    T = math.ceil(mu * m)
+    failure = 0.
+    for xs in (0, 1):
+        good = probs[xs, xs, 1 - xs, 1 - xs]
+        other = 1 - probs[xs, xs].sum()
+        tail = _binom_pmf(np.arange(T, m + 1), m, _ratio(good, good + other)).sum()
+        failure += 0.5 * (1 - (good + other) ** m * tail)
+    return float(failure)
+
+
+def checkset_shortfall_probability(probs: np.ndarray, m: int, mu: float) -> float:
+    """P(|checkset| < T) for an honest sender, the control variate of the honest runs.
+
+    Noiseless this is binom.cdf(T - 1, m, 1/3), the exact no faulty failure probability.
+    """
+    T = math.ceil(mu * m)
+    return float(sum(0.5 * _binom_pmf(np.arange(T), m, probs[xs, xs].sum()).sum() for xs in (0, 1)))
+
+
+def node1_faulty_failure(probs: np.ndarray, m: int, mu: float, lam: float) -> float:
+    """Failure probability with Node1 (R0) running the adversary strategy.
+
+    Per sent bit xs, each round falls in one of the categories
+      1/2: not in the checkset, r2 = 1 - xs (mXX10), with r3 = xs / r3 = 1 - xs
+      3:   in the checkset, r2 = 1 - xs, r3 = 1 - xs (m0011)
+      4:   in the checkset, r2 = xs, r3 = 1 - xs
+      5/6: not in the checkset, r2 = xs (mXX0X), with r3 = xs / r3 = 1 - xs
+    or makes Node2's check fail (in the checkset with r3 = xs). Node1 forges its
+    checkset from all a = n1 + n2 mXX10 rounds plus the first nmin = T - a rounds
+    of mXX0X, so only the class counts of those first nmin rounds matter and they
+    are independent of the remaining mXX0X rounds.
+    """
+    T = math.ceil(mu * m)
+    failure = 0.
+    for xs in (0, 1):
+        w = np.zeros(7)
+        for r0, r1, r2, r3 in np.ndindex(probs.shape):
+            p = probs[r0, r1, r2, r3]
+            in_checkset = r0 == xs and r1 == xs
+            if in_checkset and r3 == xs:
+                continue
+            if in_checkset:
+                w[3 if r2 != xs else 4] += p
+            elif r2 != xs:
+                w[1 if r3 == xs else 2] += p
+            else:
+                w[5 if r3 == xs else 6] += p
+
+        w_a = w[1] + w[2]
+        w_rest = w[3] + w[4] + w[5] + w[6]
+        w_g = w[4] + w[5] + w[6]
+        p_g = _ratio(w_g, w_rest)
+
+        pmf_a = _binom_pmf(np.arange(m + 1), m, _ratio(w_a, w_a + w_rest)) * (w_a + w_rest) ** m
+        # P(n1 >= j) for the opposite rounds in mXX10 and P(c >= j) for the checkset
+        # rounds outside the first nmin rounds of mXX0X
+        tail_opp = _binom_tail_table(m, _ratio(w[1], w_a))
+        tail_c = _binom_tail_table(m, _ratio(w[3] + w[4], w_rest))
+
+        success = 0.
+        for a in range(m + 1):
+            r = m - a
+            nmin = max(0, T - a)
+            # Terms below double precision of the result are skipped
+            if pmf_a[a] < 1e-18 or nmin > r:
+                continue
+            # Node2 overrules its own output iff n_opposite >= lam * T + |fake| - T
+            l_max = math.ceil(lam * T + max(a, T) - T) - 1
+            if nmin == 0:
+                success += pmf_a[a] * (1 - tail_opp[a, max(l_max + 1, 0)]) * tail_c[r, T]
+                continue
+
+            # (h, k): opposite and checkset rounds among the first nmin of mXX0X
+            h = np.arange(nmin + 1)[:, None]
+            k = np.arange(nmin + 1)[None, :]
+            first = _binom_pmf(h, nmin, _ratio(w[5], w_g)) * _binom_pmf(k, nmin - h, _ratio(w[4], w[4] + w[6]))
+            p_accept = 1 - tail_opp[a, np.clip(l_max + 1 - h, 0, a + 1)]
+            dist_k = (first * p_accept).sum(axis=0)
+
+            # d: rounds outside mXX0X before the nmin-th mXX0X round, which are all in
+            # the checkset; the r - nmin - d rounds after it are i.i.d.
+            d = np.arange(r - nmin + 1)[:, None]
+            pmf_d = p_g * _binom_pmf(nmin - 1, nmin - 1 + d, p_g)
+            needed = np.clip(T - k - d, 0, None)
+            p_checkset = (pmf_d * tail_c[r - nmin - d, np.minimum(needed, r - nmin - d + 1)]).sum(axis=0)
+            success += pmf_a[a] * (dist_k * p_checkset).sum()
+
+        failure += 0.5 * (1 - success)
+    return float(failure)
+
+
+def sender_faulty_failure(probs: np.ndarray, m: int, mu: float, lam: float) -> float:
+    """Failure probability with the sender running the x0 = 0, x1 = 1 attack.
+
+    Failure is either the sender giving up (too few rounds per class) or Node1
+    accepting 0 and Node2 accepting 1 without being convinced by Node1's checkset.
+    """
+    T = math.ceil(mu * m)
+    Q = T - math.ceil(T * lam) + 1
+
+    c1 = probs[0, 0].sum()
+    c3 = probs[1, 1].sum()
+    c2 = 1 - c1 - c3
+    # Node2's own check: r3 = 0 on every class_1100 round
+    beta = _ratio(probs[1, 1, :, 0].sum(), c3)
+
+    l3 = np.arange(m + 1)[:, None]
+    l1 = np.arange(m + 1)[None, :]
+    l2 = m - l1 - l3
+    joint = _binom_pmf(l3, m, c3) * _binom_pmf(l1, m - l3, _ratio(c1, c1 + c2))
+    feasible = (l3 >= T) & (l1 >= T - Q) & (l2 >= Q)
+    p_run = (joint * feasible).sum()
+    p_checks = (joint * feasible * beta ** l3.astype(float)).sum()
+
+    # Node1's check: r2 = 1 on its checkset, n_opposite counts r3 = 1 there
+    u = np.array([probs[0, 0, 1, 0], probs[0, 0, 1, 1]]) / c1 if c1 > 0 else np.zeros(2)
+    v = np.array([probs[0, 1, 1, 0] + probs[1, 0, 1, 0], probs[0, 1, 1, 1] + probs[1, 0, 1, 1]])
+    v = v / c2 if c2 > 0 else np.zeros(2)
+    n_opposite = np.array([1.])
+    for _ in range(T - Q):
+        n_opposite = np.convolve(n_opposite, u)
+    for _ in range(Q):
+        n_opposite = np.convolve(n_opposite, v)
+    p_unconvinced = n_opposite[:math.ceil(lam * T)].sum()
+
+    return float((1 - p_run) + p_checks * p_unconvinced)
@@ -0,0 +1,156 @@
+"""Adaptive (m, p) sweep of the iso-failure contour of a scenario.
+
+Starts from a coarse grid over m and the gate depolarizing probability p and refines
+it around the contour where the failure probability crosses --target
+(common.surface) until the bootstrap band of every crossing is at most --band wide in
+m, or its cells have --n-max trials. Writes the crossings m*(p) and m**(p) with their
+bands, and which of them are unresolved, to <scenario>/failure_surface.csv and a
+figure to <scenario>/failure_surface.png, and compares the trials spent with a full
+grid over the same columns, at the m resolution reached and with the trials per cell
+each column needed for its bands.
+Run it from the repository root:
+
+    python -m common.failure_surface --scenario no_faulty --target 0.05
+"""
+import argparse
+import csv
+import math
+import os
+from multiprocessing import Pool, cpu_count
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from common.build_figures import configure_worker, mu, lam, simulate_chunk
+from common.config import load_config, set_gate_noise
+from common.noise_model import round_distribution
+from common.pipeline import ROOT
+from common.planner import EXACT
+from common.surface import Surface, bracketing_cells, contour, crossings, refine, unresolved
+
+CHUNK = 50  # Trials per pool task
+NUM_CORES = cpu_count()
+
+
+def run_cells(pool, scenario, tasks, surface):
+    chunks = []
+    for m, p, n in tasks:
+        chunks += [(scenario, m, p, min(CHUNK, n - start)) for start in range(0, n, CHUNK)]
+    for _, m, p, failures, runs in pool.map(simulate_chunk, chunks):
+        surface.add(m, p, failures, runs)
+
+
+def bands_of(results) -> dict:
+    """p -> ((low, high) of m*, (low, high) of m**) from contour results."""
+    return {p: ((low0, high0), (low1, high1)) for p, _, low0, high0, _, low1, high1 in results}
+
+
+def full_grid_trials(surface, target, num_m: int) -> int:
+    """Trials of a full grid of num_m cells per column, with as many trials per cell as
+    the cells bracketing the crossings of that column have.
+
+    A grid does not know in advance where the crossings are, so every cell of a column
+    needs the trials that resolved its crossings to reach the same bands.
+    """
+    total = 0
+    for p, (ms, failures, runs) in surface.columns().items():
+        _, _, i, j = crossings(ms, failures, runs, target)
+        total += num_m * max(runs[k] for k in bracketing_cells(ms, i, j))
+    return total
+
+
+def exact_contour(scenario, ps, m_values, target):
+    """Crossings of the exact failure probability on the m_values grid."""
+    config = load_config(os.path.join(ROOT, "config.yaml"))
+    result = []
+    for p in ps:
+        probs = round_distribution(set_gate_noise(config, p))
+        exact = np.array([EXACT[scenario](probs, m, mu, lam) for m in m_values])
+        # Exact values as counts of a very large number of runs
+        result.append(crossings(np.array(m_values), exact * 1e9, np.full(len(m_values), 1e9), target)[:2])
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Adaptive iso-failure contour over (m, p)")
+    parser.add_argument("--scenario", choices=sorted(EXACT), default="no_faulty")
+    parser.add_argument("--target", type=float, default=0.05, help="failure probability of the contour")
+    parser.add_argument("--m-range", type=int, nargs=2, default=[20, 600])
+    parser.add_argument("--p-max", type=float, default=1e-4, help="largest gate depolarizing probability")
+    parser.add_argument("--coarse", type=int, nargs=2, default=[11, 5], help="coarse grid size in m and p")
+    parser.add_argument("--m-tol", type=int, default=10, help="resolution in m")
+    parser.add_argument("--p-levels", type=int, default=4, help="times the coarse p spacing may be halved")
+    parser.add_argument("--n-step", type=int, default=200, help="trials added to a cell at a time")
+    parser.add_argument("--n-max", type=int, default=20000, help="trials per cell at most")
+    parser.add_argument("--band", type=float, default=40.,
+                        help="width in m of the 95%% bootstrap band at which a crossing is resolved")
+    parser.add_argument("--bootstrap", type=int, default=200,
+                        help="bootstrap samples of the bands, per round and in the output")
+    parser.add_argument("--max-rounds", type=int, default=200, help="safety limit, refining normally stops earlier")
+    parser.add_argument("--exact", action="store_true", help="also plot the contour of the exact evaluator")
+    parser.add_argument("--formalism", choices=["KET", "DM"], default=None,
+                        help="NetSquid state formalism, by default KET for noiseless cells and DM otherwise")
+    args = parser.parse_args()
+
+    m_min, m_max = args.m_range
+    ms = np.unique(np.linspace(m_min, m_max, args.coarse[0]).astype(int)).tolist()
+    ps = np.linspace(0., args.p_max, args.coarse[1]).tolist()
+    # Slightly below the spacing after p_levels halvings, which is not exact in floating point
+    p_tol = 0.99 * args.p_max / (args.coarse[1] - 1) / 2 ** args.p_levels
+
+    surface = Surface()
+    tasks = [(m, p, args.n_step) for p in ps for m in ms]
+    with Pool(processes=NUM_CORES, initializer=configure_worker, initargs=(args.formalism,)) as pool:
+        for round_index in range(args.max_rounds):
+            if not tasks:
+                break
+            run_cells(pool, args.scenario, tasks, surface)
+            bands = bands_of(contour(surface, args.target, num_bootstrap=args.bootstrap))
+            print(f"Round {round_index + 1}: {len(tasks)} cells refined, "
+                  f"{len(surface.cells)} cells and {surface.trials} trials in total")
+            tasks = refine(surface, args.target, (m_min, m_max), args.m_tol, p_tol, args.n_step, args.n_max,
+                           bands, args.band)
+    if tasks:
+        print(f"Stopped after {args.max_rounds} rounds with {len(tasks)} cells left to refine")
+
+    results = contour(surface, args.target, num_bootstrap=args.bootstrap)
+    open_crossings = unresolved(surface, args.target, bands_of(results), args.band)
+    full_grid = full_grid_trials(surface, args.target, math.ceil((m_max - m_min) / args.m_tol + 1))
+    print(f"{surface.trials} trials, a full grid over the same columns with the trials per cell each column "
+          f"needed takes {full_grid} ({full_grid / surface.trials:.1f}x)")
+    for p, m_low, low0, high0, m_high, low1, high1 in results:
+        names = open_crossings[p]
+        print(f"p = {p:.2e}: m* = {m_low:.0f} [{low0:.0f}, {high0:.0f}], m** = {m_high:.0f} [{low1:.0f}, {high1:.0f}]"
+              + (f" ({' and '.join(names)} unresolved at --n-max)" if names else ""))
+
+    directory = os.path.join(ROOT, args.scenario)
+    with open(os.path.join(directory, "failure_surface.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["p", "m_star", "m_star_low", "m_star_high", "m_star_star", "m_star_star_low", "m_star_star_high",
+                         "unresolved"])
+        writer.writerows(list(r) + [" ".join(open_crossings[r[0]])] for r in results)
+
+    # Plotting, crossings beyond the largest m are left out
+    p_values = np.array([r[0] for r in results])
+    curves = np.array([r[1:] for r in results])
+    curves[~np.isfinite(curves)] = np.nan
+    plt.figure(figsize=(8, 5))
+    cells = np.array([(p, m, failures / runs) for (m, p), (failures, runs) in surface.cells.items()])
+    plt.scatter(cells[:, 0], cells[:, 1], c=cells[:, 2], s=8, cmap="viridis", label="Simulated cells")
+    plt.colorbar(label="failure probability")
+    plt.plot(p_values, curves[:, 0], 'r-', label=r"$m^*(p)$")
+    plt.fill_between(p_values, curves[:, 1], curves[:, 2], color='red', alpha=0.2)
+    plt.plot(p_values, curves[:, 3], 'm-', label=r"$m^{**}(p)$")
+    plt.fill_between(p_values, curves[:, 4], curves[:, 5], color='magenta', alpha=0.2)
+    if args.exact:
+        exact = np.array(exact_contour(args.scenario, p_values, list(range(m_min, m_max + 1, args.m_tol)),
+                                       args.target))
+        exact[~np.isfinite(exact)] = np.nan
+        plt.plot(p_values, exact[:, 0], 'g--', label="Exact")
+        plt.plot(p_values, exact[:, 1], 'g--')
+    plt.xlabel("Gate Depolarizing Probability")
+    plt.ylabel("number of four-qubit singlet states, $m$")
+    plt.title(f"Failure Probability {args.target:.0%} Contour ({args.scenario})")
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(os.path.join(directory, "failure_surface.png"), dpi=300)
@@ -0,0 +1,59 @@
+"""Trial throughput of the NetSquid state formalisms in every scenario.
+
+Times --trials trials per (scenario, noise, formalism) in a single process, on the
+noiseless config.yaml and with gate noise --p. KET is only exact for the noiseless
+config: with noise NetSquid samples the noise on the ket instead of tracking the
+mixed state, so the failure probabilities of the two can differ. That is why
+select_formalism picks DM there, and why build_figures keys its cells by formalism.
+Run it from the repository root:
+
+    python -m common.formalism_benchmark --m 100 --trials 50
+"""
+import argparse
+import os
+import time
+
+from common.build_figures import SCENARIOS, mu, lam
+from common.config import load_config, select_formalism, set_formalism, set_gate_noise, to_network_config
+from common.pipeline import ROOT
+from common.planner import load_application
+from common.streaming import FailureCounter, run_streaming
+
+
+def throughput(scenario, application, config, m, num_trials):
+    """Trials per second and failure probability of num_trials trials."""
+    sender_kwargs = dict(mu=mu, lam=lam) if scenario == "sender_faulty" else {}
+    counter = FailureCounter(SCENARIOS[scenario]["is_failure"])
+    start = time.perf_counter()
+    run_streaming(
+        config=to_network_config(config),
+        programs={
+            "Node1": application.Node1Program(m=m, mu=mu, lam=lam),
+            "Node2": application.Node2Program(m=m, mu=mu, lam=lam),
+            "Sender": application.SenderProgram(m=m, **sender_kwargs),
+        },
+        num_times=num_trials,
+        reducers=[counter],
+    )
+    return num_trials / (time.perf_counter() - start), counter.failures / counter.runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trial throughput per state formalism")
+    parser.add_argument("--m", type=int, default=100)
+    parser.add_argument("--trials", type=int, default=50, help="trials per measurement")
+    parser.add_argument("--p", type=float, default=1e-4, help="gate depolarizing probability of the noisy runs")
+    args = parser.parse_args()
+
+    for scenario in sorted(SCENARIOS):
+        application = load_application(scenario)
+        for p in (0., args.p):
+            config = set_gate_noise(load_config(os.path.join(ROOT, "config.yaml")), p)
+            rates = {}
+            for formalism in ("KET", "DM"):
+                set_formalism(formalism)
+                rates[formalism], failure_prob = throughput(scenario, application, config, args.m, args.trials)
+                print(f"{scenario}, p = {p:.1e}, {formalism}: {rates[formalism]:.2f} trials/s "
+                      f"(failure probability {failure_prob:.3f})")
+            print(f"{scenario}, p = {p:.1e}: KET {rates['KET'] / rates['DM']:.2f}x DM, "
+                  f"automatic choice {select_formalism(config)}")
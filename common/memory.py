@@ -0,0 +1,145 @@
+import json
+import math
+import os
+import resource
+import sys
+import tracemalloc
+from multiprocessing import Pool
+
+MB = 1024 * 1024
+
+
+def peak_rss() -> int:
+    """Lifetime high-water mark of the resident set size of this process in bytes.
+
+    It never decreases, so in a pool worker it is the largest footprint of any task
+    the worker has run so far, not of the current one.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryProfiledTask:
+    """Picklable wrapper recording the traced peak, the worker's RSS high-water mark and
+    the top tracemalloc allocations of every call in <directory>/worker_<pid>.jsonl."""
+
+    def __init__(self, func, directory: str = "memory", top: int = 10):
+        self.func = func
+        self.directory = directory
+        self.top = top
+
+    def __call__(self, *args):
+        result, record = measure_call(self.func, *args, top=self.top)
+        with open(os.path.join(self.directory, f"worker_{os.getpid()}.jsonl"), "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return result
+
+
+def measure_call(func, *args, top: int = 10):
+    """Result of func(*args) and its memory record.
+
+    traced_peak_mb is the peak of the memory allocated during this call, the
+    per task metric. worker_max_rss_mb is the lifetime RSS high-water mark of the
+    worker (peak_rss) and includes the tasks it ran before.
+    """
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        _, traced_peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    record = {
+        "task": list(args[0]) if args and isinstance(args[0], tuple) else list(args),
+        "pid": os.getpid(),
+        "traced_peak_mb": traced_peak / MB,
+        "worker_max_rss_mb": peak_rss() / MB,
+        "top_allocations": [
+            {"location": str(stat.traceback), "size_mb": stat.size / MB, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:top]
+        ],
+    }
+    return result, record
+
+
+def _measure_task(args):
+    func, task = args
+    # Run first in a fresh worker: the RSS so far is the interpreter itself
+    start_rss = peak_rss()
+    record = measure_call(func, task, top=0)[1]
+    record["start_rss_mb"] = start_rss / MB
+    return record
+
+
+class MemoryModel:
+    """Worker memory as base + min(chunk_size, batch_size) * (per_trial_a + per_trial_b * m) bytes.
+
+    Tasks that stream their trials in batches (common.streaming.run_streaming) only hold
+    the results of one batch at a time, so their memory stops growing with the chunk at
+    batch_size. batch_size None models a task holding all the trials of its chunk.
+    """
+
+    def __init__(self, base: float, per_trial_a: float, per_trial_b: float, batch_size: int = None):
+        self.base = base
+        self.per_trial_a = per_trial_a
+        self.per_trial_b = per_trial_b
+        self.batch_size = batch_size
+
+    def per_trial(self, m: int) -> float:
+        return max(self.per_trial_a + self.per_trial_b * m, 1.)
+
+    def held_trials(self, chunk_size: int) -> int:
+        return chunk_size if self.batch_size is None else min(chunk_size, self.batch_size)
+
+    def worker(self, m: int, chunk_size: int) -> float:
+        return self.base + self.held_trials(chunk_size) * self.per_trial(m)
+
+
+def calibrate(func, m_small: int, m_large: int, chunk_sizes=(1, 3), batch_size: int = None) -> MemoryModel:
+    """Fit a MemoryModel from tasks func((m, chunk_size)) run in fresh worker processes.
+
+    batch_size is the batch func streams its trials in, None if it holds them all. The
+    per trial memory is the growth of the traced peak between the two chunk sizes,
+    which have to be at most batch_size, measured at m_small and m_large. The base is the traced peak left at zero
+    trials (imports and setup, traced since they run in the first task of the worker)
+    plus the RSS of the fresh worker before the task, which tracemalloc does not see.
+    """
+    if batch_size is not None and max(chunk_sizes) > batch_size:
+        raise ValueError(f"Chunk sizes {chunk_sizes} exceed the batch size {batch_size}, memory stops growing there")
+    tasks = [(func, (m, c)) for m in (m_small, m_large) for c in chunk_sizes]
+    with Pool(processes=1, maxtasksperchild=1) as pool:
+        records = pool.map(_measure_task, tasks)
+
+    c_small, c_large = chunk_sizes
+    per_trial = {}
+    setup = {}
+    for m in (m_small, m_large):
+        by_chunk = {r["task"][1]: r for r in records if r["task"][0] == m}
+        growth = by_chunk[c_large]["traced_peak_mb"] - by_chunk[c_small]["traced_peak_mb"]
+        per_trial[m] = max(growth, 0) * MB / (c_large - c_small)
+        setup[m] = max(by_chunk[c_small]["traced_peak_mb"] * MB - c_small * per_trial[m], 0.)
+
+    b = (per_trial[m_large] - per_trial[m_small]) / (m_large - m_small) if m_large != m_small else 0.
+    a = per_trial[m_small] - b * m_small
+    interpreter = max(r["start_rss_mb"] for r in records) * MB
+    return MemoryModel(base=interpreter + max(setup.values()), per_trial_a=a, per_trial_b=b, batch_size=batch_size)
+
+
+def plan_workers(budget_mb: float, model: MemoryModel, m_max: int, n_per_cell: int, max_workers: int):
+    """Largest worker count, then largest chunk size, with all workers within budget_mb.
+
+    Once a whole batch fits, the chunk size is not limited by memory and each worker
+    gets an equal share of the n_per_cell trials of a cell.
+    """
+    budget = budget_mb * MB
+    for workers in range(max_workers, 0, -1):
+        chunk_size = math.floor((budget / workers - model.base) / model.per_trial(m_max))
+        if chunk_size >= 1:
+            if model.batch_size is not None and chunk_size >= model.batch_size:
+                chunk_size = math.inf
+            return workers, min(chunk_size, math.ceil(n_per_cell / workers))
+    raise ValueError(
+        f"A memory budget of {budget_mb} MB does not fit one worker "
+        f"({model.worker(m_max, 1) / MB:.0f} MB for one trial at m={m_max})"
+    )
@@ -0,0 +1,87 @@
+"""Two level (SquidASM / outcome model) estimation of the no faulty failure probability.
+
+The low fidelity model samples trials from the per round distribution P[r0, r1, r2, r3]
+of noise_model.round_distribution. The two levels are coupled through inputs drawn
+from a fixed distribution, independent of both simulators: the bit xs and one uniform
+per round. The model takes the sender's (r0, r1) of a round as the inverse transform
+of its uniform under the model, SquidASM measures the sender's q0 and q1 by inverse
+transform of the same uniform under the simulated state (routines.assign_measurement).
+The receivers' (r2, r3) are resampled from the model. The multifidelity Monte Carlo
+estimator (Peherstorfer, Willcox, Gunzburger 2016)
+
+    Y_hi(n) + alpha * (Y_lo(n + n_lo) - Y_lo(n))
+
+is unbiased for the SquidASM failure probability for any alpha, since the paired and
+the extra model trials are the same function of identically distributed inputs. Where
+the model is exact the sender outcomes of both levels agree, where it leaves out noise
+(decoherence, other link models) they drift apart, which only lowers the correlation
+and with it the gain.
+"""
+import math
+
+import numpy as np
+
+
+class OutcomeModel:
+    """Vectorized no faulty trials from P[r0, r1, r2, r3]."""
+
+    def __init__(self, probs: np.ndarray, m: int, mu: float):
+        self.probs = probs
+        self.m = m
+        self.T = math.ceil(mu * m)
+        # Sender outcome 2 * r0 + r1 and receivers' outcome 2 * r2 + r3 given it
+        self.p_sender = probs.sum(axis=(2, 3)).ravel()
+        self.p_receivers = probs.reshape(4, 4) / np.maximum(self.p_sender[:, None], 1e-300)
+
+    def sample_inputs(self, num_trials: int, rng: np.random.Generator):
+        """xs and one uniform per round, shape (num_trials, m), the inputs shared with SquidASM."""
+        return rng.integers(2, size=num_trials), rng.random((num_trials, self.m))
+
+    def sender_codes(self, uniforms: np.ndarray) -> np.ndarray:
+        """Sender's outcome codes 2 * r0 + r1 by inverse transform of the uniforms."""
+        cumulative = np.cumsum(self.p_sender) / self.p_sender.sum()
+        return np.minimum(np.searchsorted(cumulative, uniforms, side="right"), 3)
+
+    def failures(self, xs: np.ndarray, codes: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """0/1 failure per trial, resampling (r2, r3) given the sender's outcomes."""
+        cumulative = np.cumsum(self.p_receivers, axis=1)[codes]
+        receivers = (rng.random(codes.shape)[..., None] > cumulative[..., :3]).sum(axis=-1)
+        r2, r3 = receivers // 2, receivers % 2
+
+        # Honest nodes: both accept xs iff the checkset reaches T and has no round with
+        # their measurement equal to xs, the cross check never changes an accepted xs
+        in_checkset = codes == 3 * xs[:, None]
+        large_enough = in_checkset.sum(axis=1) >= self.T
+        accept1 = large_enough & ~(in_checkset & (r2 == xs[:, None])).any(axis=1)
+        accept2 = large_enough & ~(in_checkset & (r3 == xs[:, None])).any(axis=1)
+        return (~(accept1 & accept2)).astype(float)
+
+
+def optimal_ratio(rho: float, cost_hi: float, cost_lo: float) -> float:
+    """Low fidelity samples per high fidelity sample minimizing variance per CPU second.
+
+    cost_hi includes the paired low fidelity evaluation.
+    """
+    if rho ** 2 >= 1:
+        return math.inf
+    return math.sqrt(cost_hi * rho ** 2 / (cost_lo * (1 - rho ** 2)))
+
+
+def mfmc_estimate(y_hi: np.ndarray, g_paired: np.ndarray, extra_sum: float, n_lo: int):
+    """Multifidelity estimate from n paired (y_hi, g) samples and n_lo extra g samples.
+
+    The extra samples enter only through their sum extra_sum, so they can be generated
+    in batches without being kept. Returns (estimate, standard error, alpha) with the
+    variance optimal alpha.
+    """
+    n = len(y_hi)
+    var_lo = g_paired.var(ddof=1)
+    alpha = np.cov(y_hi, g_paired)[0, 1] / var_lo if var_lo > 0 else 0.
+    g_all = (g_paired.sum() + extra_sum) / (n + n_lo)
+    estimate = y_hi.mean() + alpha * (g_all - g_paired.mean())
+
+    # Var = var_hi / n - (1 / n - 1 / (n + n_lo)) * (2 alpha cov - alpha^2 var_lo)
+    var_hi = y_hi.var(ddof=1)
+    cov = alpha * var_lo
+    variance = var_hi / n - (1 / n - 1 / (n + n_lo)) * (2 * alpha * cov - alpha ** 2 * var_lo)
+    return float(estimate), math.sqrt(max(variance, 0.)), float(alpha)
@@ -0,0 +1,134 @@
+import numpy as np
+
+from common.config import link_cfg, stack_qdevice_cfg
+
+# Single qubit gates and projectors
+H = np.array([[1, 1], [1, -1]]) / np.sqrt(2)
+I2 = np.eye(2)
+X = np.array([[0, 1], [1, 0]])
+Y = np.array([[0, -1j], [1j, 0]])
+Z = np.diag([1, -1])
+P0 = np.diag([1, 0])
+P1 = np.diag([0, 1])
+
+
+def rot_Z(angle: float):
+    return np.array([[np.exp(-0.5j * angle), 0], [0, np.exp(0.5j * angle)]])
+
+
+def rot_Y(angle: float):
+    c, s = np.cos(angle / 2), np.sin(angle / 2)
+    return np.array([[c, -s], [s, c]])
+
+
+# Gate sequence of SenderProgram.prepare_state as (gate, qubits)
+PREPARE_STATE_CIRCUIT = [
+    (H, (0,)),
+    (H, (1,)),
+    (H, (2,)),
+    (rot_Z(-0.73304), (0,)),
+    (rot_Z(2.67908), (2,)),
+    ("cnot", (2, 0)),
+    (H, (2,)),
+    (rot_Y(-2.67908), (0,)),
+    ("cnot", (1, 0)),
+    ("cnot", (2, 3)),
+    (rot_Z(1.5708), (2,)),
+    ("cnot", (1, 3)),
+    ("cnot", (0, 2)),
+]
+
+NUM_QUBITS = 4
+
+
+def _on_qubits(*ops):
+    """Kronecker product of {qubit: op}-pairs, identity on the other qubits."""
+    ops = dict(ops)
+    full = np.eye(1)
+    for q in range(NUM_QUBITS):
+        full = np.kron(full, ops.get(q, I2))
+    return full
+
+
+def _gate_unitary(gate, qubits):
+    if isinstance(gate, str):
+        control, target = qubits
+        return _on_qubits((control, P0)) + _on_qubits((control, P1), (target, X))
+    return _on_qubits((qubits[0], gate))
+
+
+def _depolarize(rho, qubit, prob):
+    # rho -> (1 - prob) rho + prob * Tr_q(rho) x I/2, as NetSquid's depolarize()
+    if prob == 0:
+        return rho
+    twirl = sum(_on_qubits((qubit, P)) @ rho @ _on_qubits((qubit, P)).conj().T for P in (I2, X, Y, Z))
+    return (1 - prob) * rho + prob * twirl / 4
+
+
+def prepare_state_density_matrix(p1: float, p2: float):
+    """Density matrix of the four sender qubits after prepare_state.
+
+    Every gate is followed by depolarizing noise on the qubits it acted on, with
+    probability p1 for single qubit gates and p2 for the CNOTs, which is how the
+    generic qdevice applies single/two_qubit_gate_depolar_prob.
+    """
+    rho = np.zeros((2 ** NUM_QUBITS, 2 ** NUM_QUBITS), dtype=complex)
+    rho[0, 0] = 1
+    for gate, qubits in PREPARE_STATE_CIRCUIT:
+        U = _gate_unitary(gate, qubits)
+        rho = U @ rho @ U.conj().T
+        prob = p2 if len(qubits) == 2 else p1
+        for q in qubits:
+            rho = _depolarize(rho, q, prob)
+    return rho
+
+
+def prepare_state_vector():
+    """State vector of the four sender qubits after a noiseless prepare_state."""
+    ket = np.zeros(2 ** NUM_QUBITS, dtype=complex)
+    ket[0] = 1
+    for gate, qubits in PREPARE_STATE_CIRCUIT:
+        ket = _gate_unitary(gate, qubits) @ ket
+    return ket
+
+
+def teleport_flip_prob(p1_recv: float, p2_send: float, fidelity: float = 1.0) -> float:
+    """Probability that a teleported qubit reads out flipped in the Z basis.
+
+    Only X errors on the output matter for the receivers' Z measurement. They come
+    from the EPR pair (depolarise link), from depolarizing the EPR half in the
+    sender's CNOT (flips m2) and from the receiver's X and Z corrections, each
+    applied with probability 1/2.
+    """
+    p_mixed = 4 / 3 * (1 - float(fidelity))
+    flips = [p_mixed / 2, p2_send / 2, p1_recv / 4, p1_recv / 4]
+    f = 0.
+    for p in flips:
+        f = f * (1 - p) + p * (1 - f)
+    return f
+
+
+def round_distribution(config: dict) -> np.ndarray:
+    """Noisy per round distribution P[r0, r1, r2, r3] as a (2, 2, 2, 2) array.
+
+    r0 and r1 are the sender's measurements, r2 and r3 the outcomes measured by
+    Node1 and Node2 after teleportation. Decoherence (T1/T2) is not modelled.
+    """
+    sender = stack_qdevice_cfg(config, "Sender")
+    rho = prepare_state_density_matrix(
+        float(sender["single_qubit_gate_depolar_prob"]),
+        float(sender["two_qubit_gate_depolar_prob"]),
+    )
+    probs = np.real(np.diag(rho)).reshape((2,) * NUM_QUBITS)
+
+    for qubit, node in [(2, "Node1"), (3, "Node2")]:
+        receiver = stack_qdevice_cfg(config, node)
+        f = teleport_flip_prob(
+            float(receiver["single_qubit_gate_depolar_prob"]),
+            float(sender["two_qubit_gate_depolar_prob"]),
+            float(link_cfg(config, "Sender", node)["fidelity"]),
+        )
+        probs = (1 - f) * probs + f * np.flip(probs, axis=qubit)
+
+    probs = np.clip(probs, 0, None)
+    return probs / probs.sum()
@@ -0,0 +1,65 @@
+"""Content-hashed build stages.
+
+A stage output is stored under a key hashing everything it depends on: the stage
+parameters, the contents of its input files and the keys of the stages it is built
+from. An output whose key is already in the store is up to date; changing a file or
+parameter changes the key of every stage downstream of it, and only those are rebuilt.
+Outputs are JSON files named <stage>-<key>.json, so the store can be deleted at any
+time to force a full rebuild.
+"""
+import hashlib
+import json
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def stage_key(name: str, params: dict, files=(), deps=()) -> str:
+    """Key of a stage output from its parameters, input files and upstream keys."""
+    digest = hashlib.sha256(name.encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    for path in sorted(files):
+        # Relative paths, so that a moved checkout keeps its cache
+        digest.update(os.path.relpath(path, ROOT).encode())
+        digest.update(file_digest(path).encode())
+    for key in deps:
+        digest.update(key.encode())
+    return digest.hexdigest()[:16]
+
+
+class Store:
+    """Stage outputs of one pipeline, keyed by stage_key."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str, key: str) -> str:
+        return os.path.join(self.directory, f"{name}-{key}.json")
+
+    def has(self, name: str, key: str) -> bool:
+        return os.path.exists(self.path(name, key))
+
+    def load(self, name: str, key: str):
+        with open(self.path(name, key)) as f:
+            return json.load(f)
+
+    def save(self, name: str, key: str, value):
+        # Write then rename, so an interrupted build never leaves a partial output
+        path = self.path(name, key)
+        with open(path + ".tmp", "w") as f:
+            json.dump(value, f)
+        os.replace(path + ".tmp", path)
+
+    def cached(self, name: str, key: str, build):
+        """Output of a stage, calling build() only if it is stale."""
+        if self.has(name, key):
+            return self.load(name, key)
+        value = build()
+        self.save(name, key, value)
+        return value
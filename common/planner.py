@@ -0,0 +1,223 @@
+"""Dry run planner for failure probability sweeps.
+
+For every (m, p) cell of a sweep the planner predicts the failure probability from
+the exact evaluators, the N needed for a target confidence interval half width and
+the CPU time of those N trials from a calibration of seconds per trial. The calibration
+is cached in planner_calibration.json under a key of config.yaml, the application code,
+the grid and the state formalism of its points, and redone when any of them changes. Run it from the repository root:
+
+    python -m common.planner --scenario no_faulty --ci-width 0.01 --budget-hours 8
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import math
+import os
+import time
+from multiprocessing import cpu_count
+
+import numpy as np
+from scipy.stats import norm
+
+from common.config import load_config, select_formalism, set_formalism, set_gate_noise
+from common.exact import no_faulty_failure, node1_faulty_failure, sender_faulty_failure
+from common.noise_model import round_distribution
+from common.pipeline import ROOT, stage_key
+
+CALIBRATION_PATH = os.path.join(ROOT, "planner_calibration.json")
+
+EXACT = {
+    "no_faulty": lambda probs, m, mu, lam: no_faulty_failure(probs, m, mu),
+    "node1_faulty": node1_faulty_failure,
+    "sender_faulty": sender_faulty_failure,
+}
+
+
+def required_trials(prob: float, width: float, confidence: float = 0.95, relative: bool = False,
+                    n_min: int = 100) -> int:
+    """Trials for a normal approximation CI of half width `width` (relative to prob if set).
+
+    prob is floored at the half width, so cells with a tiny predicted probability still
+    get enough trials to bound it.
+    """
+    z = norm.ppf(0.5 + confidence / 2)
+    half_width = width * prob if relative else width
+    prob = min(max(prob, half_width), 1 - half_width)
+    if half_width <= 0:
+        return n_min
+    return max(n_min, math.ceil(z ** 2 * prob * (1 - prob) / half_width ** 2))
+
+
+class TrialCost:
+    """Seconds per trial as a + b * m + c * m * p / p_max, fit on calibration runs."""
+
+    def __init__(self, a: float, b: float, c: float, p_max: float):
+        self.a = a
+        self.b = b
+        self.c = c
+        self.p_max = p_max
+
+    def __call__(self, m: int, p: float) -> float:
+        scaled = p / self.p_max if self.p_max > 0 else 0.
+        return max(self.a + self.b * m + self.c * m * scaled, 1e-6)
+
+    @classmethod
+    def fit(cls, points: list, p_max: float):
+        """Least squares fit on (m, p, seconds per trial) points."""
+        m, p, seconds = (np.array(v, dtype=float) for v in zip(*points))
+        scaled = p / p_max if p_max > 0 else np.zeros_like(p)
+        features = np.column_stack([np.ones_like(m), m, m * scaled])
+        coefficients, *_ = np.linalg.lstsq(features, seconds, rcond=None)
+        return cls(*coefficients, p_max)
+
+    def to_dict(self) -> dict:
+        return {"a": float(self.a), "b": float(self.b), "c": float(self.c), "p_max": float(self.p_max)}
+
+
+def load_application(scenario: str):
+    path = os.path.join(ROOT, scenario, "application.py")
+    spec = importlib.util.spec_from_file_location(f"{scenario}_application", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def calibration_points(m_values: list, p_values: list) -> tuple:
+    """m and p values of the calibration runs: the corners and the middle of the sweep."""
+    return sorted({min(m_values), int(np.median(m_values)), max(m_values)}), sorted({min(p_values), max(p_values)})
+
+
+def calibrate(scenario: str, m_values: list, p_values: list, mu: float, lam: float,
+              num_trials: int = 5, formalism: str = None) -> TrialCost:
+    """Time num_trials SquidASM trials at the corners and the middle of the sweep.
+
+    Each point runs in the state formalism the sweep will use for it, select_formalism
+    with the formalism override.
+    """
+    from squidasm.run.stack.run import run
+
+    from common.config import to_network_config
+
+    application = load_application(scenario)
+    sender_kwargs = dict(mu=mu, lam=lam) if scenario == "sender_faulty" else {}
+    m_points, p_points = calibration_points(m_values, p_values)
+
+    points = []
+    for m in m_points:
+        for p in p_points:
+            config = set_gate_noise(load_config(os.path.join(ROOT, "config.yaml")), p)
+            cfg = to_network_config(config)
+            set_formalism(select_formalism(config, formalism))
+            start = time.perf_counter()
+            run(
+                config=cfg,
+                programs={
+                    "Node1": application.Node1Program(m=m, mu=mu, lam=lam),
+                    "Node2": application.Node2Program(m=m, mu=mu, lam=lam),
+                    "Sender": application.SenderProgram(m=m, **sender_kwargs),
+                },
+                num_times=num_trials,
+            )
+            points.append((m, p, (time.perf_counter() - start) / num_trials))
+    return TrialCost.fit(points, max(p_values))
+
+
+def calibration_key(scenario: str, m_values: list, p_values: list, mu: float, lam: float,
+                    formalism: str = None) -> str:
+    """Key of a calibration: the config and code the trials run, the grid it is fit on and
+    the state formalism of each calibration p."""
+    config = load_config(os.path.join(ROOT, "config.yaml"))
+    _, p_points = calibration_points(m_values, p_values)
+    formalisms = [select_formalism(set_gate_noise(config, p), formalism) for p in p_points]
+    application = os.path.join(ROOT, scenario, "application.py")
+    code = [os.path.join(ROOT, "common", f)
+            for f in ("routines.py", "sender_strategy.py", "config.py", "trial_log.py")]
+    return stage_key("calibration", dict(scenario=scenario, m=sorted(m_values), p=sorted(p_values), mu=mu, lam=lam,
+                                         formalism=formalisms),
+                     files=[os.path.join(ROOT, "config.yaml"), application] + code)
+
+
+def plan(scenario: str, m_values: list, p_values: list, mu: float, lam: float, cost: TrialCost,
+         width: float, confidence: float = 0.95, relative: bool = False) -> list:
+    """One dict per cell with the predicted probability, N and CPU seconds."""
+    config = load_config(os.path.join(ROOT, "config.yaml"))
+    cells = []
+    for p in p_values:
+        probs = round_distribution(set_gate_noise(config, p))
+        for m in m_values:
+            prob = EXACT[scenario](probs, m, mu, lam)
+            n = required_trials(prob, width, confidence, relative)
+            cells.append({"m": m, "p": p, "predicted": prob, "N": n,
+                          "seconds_per_trial": cost(m, p), "cpu_seconds": n * cost(m, p)})
+    return cells
+
+
+def trim(cells: list, budget_seconds: float, num_cores: int):
+    """Drop the most expensive cells until the wall time fits the budget.
+
+    Returns (kept, dropped).
+    """
+    kept = sorted(cells, key=lambda c: c["cpu_seconds"])
+    dropped = []
+    while kept and sum(c["cpu_seconds"] for c in kept) / num_cores > budget_seconds:
+        dropped.append(kept.pop())
+    order = {(c["m"], c["p"]): i for i, c in enumerate(cells)}
+    return sorted(kept, key=lambda c: order[(c["m"], c["p"])]), dropped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict N per cell and the runtime of a sweep")
+    parser.add_argument("--scenario", choices=sorted(EXACT), default="no_faulty")
+    parser.add_argument("--m", type=int, nargs="+", default=list(range(20, 400, 20)), help="m grid")
+    parser.add_argument("--p", type=float, nargs="+", default=[0.], help="gate depolarizing probability grid")
+    parser.add_argument("--mu", type=float, default=0.272)
+    parser.add_argument("--lam", type=float, default=0.94)
+    parser.add_argument("--ci-width", type=float, default=0.01, help="target CI half width")
+    parser.add_argument("--relative", action="store_true", help="--ci-width is relative to the probability")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--cores", type=int, default=cpu_count())
+    parser.add_argument("--budget-hours", type=float, default=None, help="trim cells to fit this wall time")
+    parser.add_argument("--formalism", choices=["KET", "DM"], default=None,
+                        help="NetSquid state formalism, by default KET for noiseless cells and DM otherwise")
+    parser.add_argument("--recalibrate", action="store_true",
+                        help="time SquidASM trials even if a calibration is cached")
+    args = parser.parse_args()
+
+    calibrations = {}
+    if os.path.exists(CALIBRATION_PATH):
+        with open(CALIBRATION_PATH) as f:
+            calibrations = json.load(f)
+    key = calibration_key(args.scenario, args.m, args.p, args.mu, args.lam, args.formalism)
+    cached = calibrations.get(args.scenario, {})
+    if args.recalibrate or cached.get("key") != key:
+        if cached:
+            print(f"Cached calibration of {args.scenario} is stale (config.yaml, code, grid or formalism changed)")
+        print(f"Calibrating seconds per trial for {args.scenario} ...")
+        cost = calibrate(args.scenario, args.m, args.p, args.mu, args.lam, formalism=args.formalism)
+        calibrations[args.scenario] = {"key": key, "cost": cost.to_dict()}
+        with open(CALIBRATION_PATH, "w") as f:
+            json.dump(calibrations, f, indent=2)
+    else:
+        cost = TrialCost(**cached["cost"])
+
+    cells = plan(args.scenario, args.m, args.p, args.mu, args.lam, cost,
+                 args.ci_width, args.confidence, args.relative)
+    dropped = []
+    if args.budget_hours is not None:
+        cells, dropped = trim(cells, args.budget_hours * 3600, args.cores)
+
+    with open(f"sweep_plan_{args.scenario}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["m", "p", "predicted", "N", "seconds_per_trial", "cpu_seconds"])
+        writer.writeheader()
+        writer.writerows(cells)
+
+    for cell in cells:
+        print(f"m = {cell['m']:4d}, p = {cell['p']:.2e}: predicted {cell['predicted']:.4f}, "
+              f"N = {cell['N']:7d}, {cell['cpu_seconds'] / 3600:.2f} CPU h")
+    cpu_seconds = sum(c["cpu_seconds"] for c in cells)
+    print(f"Total: {sum(c['N'] for c in cells)} trials, {cpu_seconds / 3600:.1f} CPU h, "
+          f"{cpu_seconds / args.cores / 3600:.1f} h wall on {args.cores} cores")
+    if dropped:
+        print(f"Dropped {len(dropped)} cells to fit {args.budget_hours} h: "
+              + ", ".join(f"(m={c['m']}, p={c['p']:.1e})" for c in dropped))
@@ -0,0 +1,106 @@
+import cProfile
+import glob
+import os
+import pstats
+
+_profiler = None
+
+
+class ProfiledTask:
+    """Picklable wrapper profiling every call of func in the pool worker running it.
+
+    The stats of all calls in a worker accumulate in one profiler, which is written
+    to <directory>/worker_<pid>.prof after each call.
+    """
+
+    def __init__(self, func, directory: str = "profile"):
+        self.func = func
+        self.directory = directory
+
+    def __call__(self, *args):
+        global _profiler
+        if _profiler is None:
+            _profiler = cProfile.Profile()
+        _profiler.enable()
+        try:
+            return self.func(*args)
+        finally:
+            _profiler.disable()
+            _profiler.dump_stats(os.path.join(self.directory, f"worker_{os.getpid()}.prof"))
+
+
+def prepare_profile_dir(directory: str = "profile"):
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "worker_*.prof")):
+        os.remove(path)
+
+
+def _label(func):
+    filename, line, name = func
+    return f"{os.path.basename(filename)}:{line}({name})" if line else name
+
+
+def collapsed_stacks(stats: pstats.Stats, max_depth: int = 40, min_fraction: float = 1e-4) -> list:
+    """Approximate collapsed stacks ("a;b;c <microseconds>") for flamegraph tooling.
+
+    cProfile only records caller -> callee edges, so the own time of a function is
+    spread over its call paths in proportion to the cumulative time of each edge.
+    Paths are followed upwards from every function while their share of its own time
+    is at least min_fraction of the total own time and they are shorter than
+    max_depth; the time of shorter shares stays on the stack reached so far, which
+    then starts below the root. Every followed path carries at least that share, so
+    the number of stacks is bounded by max_depth / min_fraction however many call
+    paths the profile has.
+    """
+    raw = stats.stats
+    threshold = sum(v[2] for v in raw.values()) * min_fraction
+    folded = {}
+
+    def emit(stack, seconds):
+        key = ";".join(_label(f) for f in reversed(stack))
+        folded[key] = folded.get(key, 0.) + seconds
+
+    for func, (_, _, tottime, _, _) in raw.items():
+        if tottime <= 0:
+            continue
+        # Stacks run from the function up to its callers
+        pending = [([func], tottime)]
+        while pending:
+            stack, seconds = pending.pop()
+            callers = {c: v for c, v in raw[stack[-1]][4].items() if c in raw and c not in stack}
+            total = sum(v[3] for v in callers.values())
+            if not callers or total <= 0 or len(stack) >= max_depth:
+                emit(stack, seconds)
+                continue
+            remainder = 0.
+            for caller, edge in callers.items():
+                share = seconds * edge[3] / total
+                if share >= threshold:
+                    pending.append((stack + [caller], share))
+                else:
+                    remainder += share
+            if remainder > 0:
+                emit(stack, remainder)
+
+    lines = []
+    for key, seconds in folded.items():
+        value = int(round(seconds * 1e6))
+        if value > 0:
+            lines.append(f"{key} {value}")
+    return lines
+
+
+def merge_profiles(scenario: str, directory: str = "profile", top: int = 20) -> pstats.Stats:
+    """Merge the worker profiles into <scenario>.prof and <scenario>.collapsed and rank
+    the hottest functions by own time."""
+    paths = sorted(glob.glob(os.path.join(directory, "worker_*.prof")))
+    if not paths:
+        raise FileNotFoundError(f"No worker profiles in {directory}")
+    stats = pstats.Stats(*paths)
+    stats.dump_stats(os.path.join(directory, f"{scenario}.prof"))
+    with open(os.path.join(directory, f"{scenario}.collapsed"), "w") as f:
+        f.write("\n".join(collapsed_stacks(stats)) + "\n")
+
+    print(f"Top {top} functions by own time ({scenario}, {len(paths)} workers):")
+    stats.sort_stats("tottime").print_stats(top)
+    return stats
@@ -0,0 +1,71 @@
+import netsquid as ns
+import numpy as np
+from netqasm.sdk.classical_communication.message import StructuredMessage
+from squidasm.sim.stack.globals import GlobalSimData
+
+
+def teleport_send_concurrent(qubits: dict, context):
+    """Teleport one qubit to each peer in {peer_name: qubit} within a single subroutine.
+
+    Unlike calling squidasm's teleport_send once per peer, the EPR pairs towards all
+    peers are requested before the subroutine is flushed, so their generation is not
+    separated by a host round trip. The corrections have the format teleport_recv
+    expects.
+    """
+    connection = context.connection
+    eprs = {peer: context.epr_sockets[peer].create_keep()[0] for peer in qubits}
+
+    corrections = {}
+    for peer, q in qubits.items():
+        epr = eprs[peer]
+        q.cnot(epr)
+        q.H()
+        corrections[peer] = (q.measure(), epr.measure())
+
+    yield from connection.flush()
+
+    for peer, (m1, m2) in corrections.items():
+        context.csockets[peer].send_structured(StructuredMessage("Correction", f"{int(m1)},{int(m2)}"))
+
+
+def assign_state(context, node_name: str, qubits: list, state):
+    """Set the joint state of allocated program qubits directly in NetSquid.
+
+    The qubits must already exist on the device, i.e. their allocation has been
+    flushed. Their virtual ids are mapped to physical positions through the node's
+    QNodeOS application memory and the state vector is assigned to the physical
+    qubits, the first qubit being the most significant one. No gates are executed,
+    so neither gate noise nor gate time is applied.
+    """
+    stack = GlobalSimData.get_network().stacks[node_name]
+    app_memory = stack.qnos.app_memories[context.app_id]
+    positions = [app_memory.phys_id_for(q.qubit_id) for q in qubits]
+    ns.qubits.qubitapi.assign_qstate(stack.qdevice.peek(positions), state)
+
+
+def assign_measurement(context, node_name: str, qubits: list, u: float) -> int:
+    """Choose the Z outcome of the first two of four qubits by inverse transform of u.
+
+    The four qubits must be allocated, flushed and entangled only with each other. The
+    outcome code 2 * r0 + r1 is the first whose cumulative probability in their
+    simulated state exceeds u, the first two qubits are assigned |r0 r1> and the other
+    two the post measurement state, so measuring the first two afterwards returns the
+    outcome. A uniform u shared with a model trial couples the two (common.multifidelity)
+    without changing the outcome distribution of the simulation.
+    """
+    stack = GlobalSimData.get_network().stacks[node_name]
+    app_memory = stack.qnos.app_memories[context.app_id]
+    positions = [app_memory.phys_id_for(q.qubit_id) for q in qubits]
+    physical = stack.qdevice.peek(positions)
+    rho = ns.qubits.qubitapi.reduced_dm(physical).reshape(4, 4, 4, 4)
+    probs = np.real(np.einsum("abab->a", rho))
+    code = min(int(np.searchsorted(np.cumsum(probs) / probs.sum(), u, side="right")), 3)
+
+    measured = np.zeros(4)
+    measured[code] = 1
+    rest = rho[code, :, code, :] / probs[code]
+    values, vectors = np.linalg.eigh(rest)
+    # A pure post measurement state is assigned as a ket, which KET requires
+    ns.qubits.qubitapi.assign_qstate(physical[:2], measured)
+    ns.qubits.qubitapi.assign_qstate(physical[2:], vectors[:, -1] if values[-1] > 1 - 1e-9 else rest)
+    return code
@@ -0,0 +1,143 @@
+"""Parameterized attacks of the faulty sender and a fast outcome model for them.
+
+The faulty sender sends x0 = 0 to Node1 and x1 = 1 to Node2, sorts its rounds by
+(r0, r1) into class_0011, class_mixed and class_1100 and picks a checkset for each
+receiver. Rounds are i.i.d., so which positions it picks within a class does not
+change the outcome distribution; a strategy is fully described by how many rounds
+of each class go into the two checksets and by what it does when a class is short.
+"""
+import math
+
+import numpy as np
+
+
+class SenderStrategy:
+    """Checkset composition of the x0 = 0, x1 = 1 attack.
+
+    checkset1 (Node1) holds Q + mixed_offset class_mixed rounds and the class_0011
+    rounds needed to reach T, plus extra_0011 more. checkset2 (Node2) holds the first
+    T + extra_1100 class_1100 rounds, or all of them if extra_1100 is None.
+
+    When a class has fewer rounds than its quota the sender abandons the attack
+    (xs = -1) if abandon is set. Otherwise it attacks anyway: checkset1 is filled up
+    from the other class and checkset2 with class_mixed rounds not in checkset1, as
+    far as the rounds go. The defaults are the original attack.
+    """
+
+    def __init__(self, mixed_offset: int = 0, extra_0011: int = 0, extra_1100: int = None, abandon: bool = True):
+        self.mixed_offset = mixed_offset
+        self.extra_0011 = extra_0011
+        self.extra_1100 = extra_1100
+        self.abandon = abandon
+
+    def quotas(self, T: int, Q: int):
+        """Number of (class_0011, class_mixed, class_1100) rounds the strategy asks for."""
+        n_mixed = max(Q + self.mixed_offset, 0)
+        n_0011 = max(T - n_mixed, 0) + self.extra_0011
+        n_1100 = T if self.extra_1100 is None else T + self.extra_1100
+        return n_0011, n_mixed, n_1100
+
+    def allocate(self, l1, l2, l3, T: int, Q: int):
+        """Rounds taken from each class given the class sizes l1, l2, l3.
+
+        Works elementwise on integers or numpy arrays. Returns (abort, a_0011,
+        a_mixed, b_1100, b_mixed), the last four being the class_0011 and class_mixed
+        rounds of checkset1 and the class_1100 and class_mixed rounds of checkset2.
+        """
+        n_0011, n_mixed, n_1100 = self.quotas(T, Q)
+        abort = np.logical_and((l1 < n_0011) | (l2 < n_mixed) | (l3 < n_1100), self.abandon)
+
+        a_mixed = np.minimum(n_mixed, l2)
+        a_0011 = np.minimum(n_0011, l1)
+        short = n_0011 + n_mixed - a_mixed - a_0011
+        fill = np.minimum(short, l1 - a_0011)
+        a_0011 = a_0011 + fill
+        a_mixed = a_mixed + np.minimum(short - fill, l2 - a_mixed)
+
+        b_1100 = l3 if self.extra_1100 is None else np.minimum(n_1100, l3)
+        b_mixed = np.clip(T - b_1100, 0, l2 - a_mixed)
+        return abort, a_0011, a_mixed, b_1100, b_mixed
+
+    def doomed(self, l1: int, l2: int, l3: int, remaining: int, T: int, Q: int) -> bool:
+        """True if the attack will be abandoned whatever the remaining rounds are."""
+        if not self.abandon:
+            return False
+        n_0011, n_mixed, n_1100 = self.quotas(T, Q)
+        deficit = max(n_0011 - l1, 0) + max(n_mixed - l2, 0) + max(n_1100 - l3, 0)
+        return deficit > remaining
+
+    def checksets(self, class_0011: list, class_mixed: list, class_1100: list, T: int, Q: int):
+        """(checkset1, checkset2) for the classified rounds, None if the attack is abandoned."""
+        abort, a_0011, a_mixed, b_1100, b_mixed = (
+            int(v) for v in self.allocate(len(class_0011), len(class_mixed), len(class_1100), T, Q)
+        )
+        if abort:
+            return None
+        checkset1 = set(class_0011[:a_0011] + class_mixed[:a_mixed])
+        checkset2 = class_1100[:b_1100] + class_mixed[a_mixed:a_mixed + b_mixed]
+        return checkset1, checkset2
+
+    def __repr__(self):
+        return (f"SenderStrategy(mixed_offset={self.mixed_offset}, extra_0011={self.extra_0011}, "
+                f"extra_1100={self.extra_1100}, abandon={self.abandon})")
+
+
+def strategy_space(mixed_offsets=range(-2, 7), extras_0011=(0, 1, 2, 4, 8, 16),
+                   extras_1100=(None, 0, 2, 4), abandon=(True, False)) -> list:
+    """Grid of strategies around the original attack."""
+    return [
+        SenderStrategy(mixed_offset, extra_0011, extra_1100, abandon_attack)
+        for mixed_offset in mixed_offsets
+        for extra_0011 in extras_0011
+        for extra_1100 in extras_1100
+        for abandon_attack in abandon
+    ]
+
+
+def simulate_outcomes(strategy: SenderStrategy, probs: np.ndarray, m: int, mu: float, lam: float,
+                      num_trials: int, rng: np.random.Generator) -> dict:
+    """Sample num_trials attacks from the per round distribution P[r0, r1, r2, r3].
+
+    Only the class sizes and the (r2, r3) counts within the two checksets matter, so
+    every trial costs a handful of multinomial draws instead of m rounds. Returns
+    the number of disagreements (y0 = 0, y1 = 1), of abandoned attacks and the
+    failures as counted by sender_faulty/run_simulation.py.
+    """
+    T = math.ceil(mu * m)
+    Q = T - math.ceil(T * lam) + 1
+
+    c = np.array([probs[0, 0].sum(), probs[0, 1].sum() + probs[1, 0].sum(), probs[1, 1].sum()])
+    counts = rng.multinomial(m, c / c.sum(), size=num_trials)
+    l1, l2, l3 = counts[:, 0], counts[:, 1], counts[:, 2]
+    abort, a_0011, a_mixed, b_1100, b_mixed = strategy.allocate(l1, l2, l3, T, Q)
+
+    # (r2, r3) outcomes within each class, flattened as 2 * r2 + r3
+    def within(cls):
+        p = cls.ravel()
+        return p / p.sum() if p.sum() > 0 else np.full(4, 0.25)
+
+    group_0011 = rng.multinomial(a_0011, within(probs[0, 0]))
+    group_mixed1 = rng.multinomial(a_mixed, within(probs[0, 1] + probs[1, 0]))
+    group_1100 = rng.multinomial(b_1100, within(probs[1, 1]))
+    group_mixed2 = rng.multinomial(b_mixed, within(probs[0, 1] + probs[1, 0]))
+
+    checkset1 = group_0011 + group_mixed1
+    checkset2 = group_1100 + group_mixed2
+    size1 = checkset1.sum(axis=1)
+    size2 = checkset2.sum(axis=1)
+
+    # Node1 accepts 0 iff no checkset1 round has r2 = 0, Node2 accepts 1 iff no
+    # checkset2 round has r3 = 1
+    node1_accepts = (size1 >= T) & (checkset1[:, 0] + checkset1[:, 1] == 0)
+    node2_accepts = (size2 >= T) & (checkset2[:, 1] + checkset2[:, 3] == 0)
+    # Node2 switches to 0 if enough of checkset1 has r3 = 1
+    n_opposite = checkset1[:, 1] + checkset1[:, 3]
+    convinced = n_opposite >= lam * T + size1 - T
+
+    disagreement = ~abort & node1_accepts & node2_accepts & ~convinced
+    return {
+        "disagreements": int(disagreement.sum()),
+        "aborts": int(abort.sum()),
+        "failures": int(disagreement.sum() + abort.sum()),
+        "runs": num_trials,
+    }
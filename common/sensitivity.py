@@ -0,0 +1,123 @@
+"""Space-filling designs over the noise parameters of config.yaml and global sensitivity indices.
+
+Two designs are supported. "sobol" is Saltelli's scheme on a scrambled Sobol sequence:
+N * (d + 2) evaluations give first order and total Sobol indices. "lhs" is a Latin
+hypercube of N points, summarized by standardized regression coefficients, which
+match the first order indices when the response is close to linear.
+"""
+import math
+
+import numpy as np
+from scipy.stats import qmc
+
+from common.config import set_link_param, set_qdevice_param
+
+
+class Parameter:
+    """One noise parameter, sampled uniformly on [low, high] or on a log scale."""
+
+    def __init__(self, name: str, section: str, low: float, high: float, log: bool = False):
+        self.name = name
+        self.section = section
+        self.low = low
+        self.high = high
+        self.log = log
+
+    def scale(self, u: np.ndarray) -> np.ndarray:
+        if self.log:
+            return np.exp(math.log(self.low) + u * (math.log(self.high) - math.log(self.low)))
+        return self.low + u * (self.high - self.low)
+
+
+# T1/T2 and times in ns, as in config.yaml. The T2 range stays below the T1 range so
+# that every point satisfies T2 <= T1
+PARAMETERS = [
+    Parameter("fidelity", "links", 0.9, 1.),
+    Parameter("prob_success", "links", 0.05, 0.9),
+    Parameter("t_cycle", "links", 1e4, 1e6, log=True),
+    Parameter("T1", "qdevice", 1e9, 1e11, log=True),
+    Parameter("T2", "qdevice", 1e7, 1e9, log=True),
+    Parameter("single_qubit_gate_time", "qdevice", 1e2, 1e4, log=True),
+    Parameter("two_qubit_gate_time", "qdevice", 1e4, 1e6, log=True),
+    Parameter("single_qubit_gate_depolar_prob", "qdevice", 0., 0.01),
+    Parameter("two_qubit_gate_depolar_prob", "qdevice", 0., 0.02),
+]
+
+
+def apply_parameters(config: dict, parameters: list, values) -> dict:
+    """Set one value per parameter on every qdevice or quantum link of config."""
+    for parameter, value in zip(parameters, values):
+        if parameter.section == "qdevice":
+            set_qdevice_param(config, parameter.name, float(value))
+        else:
+            set_link_param(config, parameter.name, float(value), links=parameter.section)
+    return config
+
+
+def design(parameters: list, num_points: int, method: str = "sobol", seed: int = 1) -> np.ndarray:
+    """Parameter values to evaluate, one row per point.
+
+    For "sobol" the rows are A (num_points), B (num_points) and AB_i for every
+    parameter i (num_points each), in that order, num_points should be a power of 2.
+    """
+    d = len(parameters)
+    if method == "sobol":
+        u = qmc.Sobol(2 * d, seed=seed).random(num_points)
+        a, b = u[:, :d], u[:, d:]
+        ab = []
+        for i in range(d):
+            ab_i = a.copy()
+            ab_i[:, i] = b[:, i]
+            ab.append(ab_i)
+        u = np.vstack([a, b] + ab)
+    elif method == "lhs":
+        u = qmc.LatinHypercube(d, seed=seed).random(num_points)
+    else:
+        raise ValueError(f"Unknown design {method}")
+    return np.column_stack([p.scale(u[:, i]) for i, p in enumerate(parameters)])
+
+
+def sobol_indices(y: np.ndarray, d: int, num_bootstrap: int = 200, seed: int = 1):
+    """First order and total Sobol indices from the outputs of a "sobol" design.
+
+    Uses the Saltelli (2010) first order and Jansen total estimators. Returns
+    (first, total, first_se, total_se), the standard errors from bootstrapping
+    the base points.
+    """
+    n = len(y) // (d + 2)
+    y_a, y_b = y[:n], y[n:2 * n]
+    y_ab = y[2 * n:].reshape(d, n)
+
+    def estimate(rows):
+        a, b, ab = y_a[rows], y_b[rows], y_ab[:, rows]
+        var = np.var(np.concatenate([a, b]))
+        if var == 0:
+            return np.zeros(d), np.zeros(d)
+        first = np.mean(b * (ab - a), axis=1) / var
+        total = 0.5 * np.mean((a - ab) ** 2, axis=1) / var
+        return first, total
+
+    first, total = estimate(np.arange(n))
+    rng = np.random.default_rng(seed)
+    samples = [estimate(rng.integers(n, size=n)) for _ in range(num_bootstrap)]
+    first_se = np.std([s[0] for s in samples], axis=0)
+    total_se = np.std([s[1] for s in samples], axis=0)
+    return first, total, first_se, total_se
+
+
+def regression_indices(x: np.ndarray, y: np.ndarray, parameters: list):
+    """Standardized regression coefficients of y on the (log scaled) parameters.
+
+    Returns (src, r2); src ** 2 approximates the first order indices if r2 is close to 1.
+    """
+    z = np.column_stack([
+        np.log(x[:, i]) if p.log else x[:, i] for i, p in enumerate(parameters)
+    ])
+    z = (z - z.mean(axis=0)) / z.std(axis=0)
+    y_std = y.std()
+    if y_std == 0:
+        return np.zeros(len(parameters)), 0.
+    y = (y - y.mean()) / y_std
+    coefficients, *_ = np.linalg.lstsq(np.column_stack([np.ones(len(y)), z]), y, rcond=None)
+    residual = y - np.column_stack([np.ones(len(y)), z]) @ coefficients
+    return coefficients[1:], 1 - residual.var() / y.var()
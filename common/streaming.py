@@ -0,0 +1,80 @@
+import json
+
+from squidasm.run.stack.run import run
+
+BATCH_SIZE = 10  # Trials per squidasm run() call of run_streaming
+
+
+class FailureCounter:
+    """Reducer counting the trials for which is_failure(sender, node1, node2) holds.
+
+    The counts are updated after every trial, so they can be read while the run is
+    still in progress.
+    """
+
+    def __init__(self, is_failure):
+        self.is_failure = is_failure
+        self.failures = 0
+        self.runs = 0
+
+    def __call__(self, sender_result: dict, node1_result: dict, node2_result: dict):
+        self.failures += int(self.is_failure(sender_result, node1_result, node2_result))
+        self.runs += 1
+
+
+class PrefixCounter:
+    """Reducer evaluating one trial recorded at the largest m for every m in m_values.
+
+    is_failure_at(sender, node1, node2, m) decides the trial from its first m rounds
+    only. All m values share the same trials, so failures are also counted jointly
+    for neighbouring m values to measure how correlated the points are.
+    """
+
+    def __init__(self, is_failure_at, m_values):
+        self.is_failure_at = is_failure_at
+        self.m_values = sorted(m_values)
+        self.failures = {m: 0 for m in self.m_values}
+        # joint_failures[m]: failure at m and at the previous m value
+        self.joint_failures = {m: 0 for m in self.m_values[1:]}
+        self.runs = 0
+
+    def __call__(self, sender_result: dict, node1_result: dict, node2_result: dict):
+        previous = False
+        for idx, m in enumerate(self.m_values):
+            failed = bool(self.is_failure_at(sender_result, node1_result, node2_result, m))
+            self.failures[m] += int(failed)
+            if idx > 0:
+                self.joint_failures[m] += int(failed and previous)
+            previous = failed
+        self.runs += 1
+
+
+class TraceAppender:
+    """Reducer appending every trial as one JSON line to a trace file."""
+
+    def __init__(self, path: str, **metadata):
+        self.path = path
+        self.metadata = metadata
+
+    def __call__(self, sender_result: dict, node1_result: dict, node2_result: dict):
+        record = dict(self.metadata, sender=sender_result, node1=node1_result, node2=node2_result)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record, default=sorted) + "\n")
+
+
+def run_streaming(config, programs: dict, num_times: int, reducers: list, batch_size: int = BATCH_SIZE):
+    """Run num_times trials and pass each trial's three node results to the reducers.
+
+    squidasm's run() only returns once all of its trials are done, so the trials are
+    run in batches of batch_size and the results of a batch are dropped after the
+    reducers have seen them. Memory therefore depends on batch_size, not num_times.
+    """
+    done = 0
+    while done < num_times:
+        batch = min(batch_size, num_times - done)
+        results = run(config=config, programs=programs, num_times=batch)
+        for i in range(batch):
+            for reducer in reducers:
+                reducer(results[0][i], results[1][i], results[2][i])
+        del results
+        done += batch
@@ -0,0 +1,257 @@
+"""Adaptive estimation of the iso-failure contour on the (m, p) plane.
+
+At a fixed gate depolarizing probability p the failure probability first decreases
+with m, as the checkset grows, and with noise increases again once noisy checkset
+rounds become likely. The m with failure probability at most a target level therefore
+form an interval [m*(p), m**(p)], which closes at a critical p. Both ends are where a
+unimodal (decreasing, then increasing) fit of the column of cells at p crosses the
+target. A coarse grid is refined only where it matters:
+
+- in every column, the cells bracketing a crossing are split at their midpoint until
+  they are at most m_tol apart, the new cell starting with the trials of the smaller of
+  the two, so that it is not the noisiest cell next to the crossing;
+- while the bootstrap band of a crossing is wider than the target band width, the cells
+  in the band (or bracketing it) whose bootstrap draws land on the other side of the
+  target with probability above (1 - confidence) / (2 n), n the cells of the column,
+  get more trials, doubling up to n_max per cell. Any cell of the column can cross the
+  target in a bootstrap sample and move the band, hence the Bonferroni division by n;
+- a finite interval [m*, m**] also needs a cell in it that a one-sided binomial test
+  puts below the target at level (1 - confidence) / (2 n). The minimum of the fit is
+  the lowest of the noisy cells, in the bootstrap as well, so with few trials per cell
+  a column whose failure probability stays just above the target shows a narrow band
+  around a crossing that does not exist, and the plug-in estimate of such a cell is
+  too optimistic to rule it out;
+- between neighbouring columns whose crossings differ by more than m_tol, a column is
+  added at the midpoint of p, at least p_tol from both, with cells only around the
+  crossings of its neighbours.
+
+The uncertainty of the crossings comes from a parametric bootstrap of the failure counts.
+Near the critical p the failure probability is flat around its minimum and a crossing
+can need far more trials than elsewhere; crossings still wider than the band when their
+cells reach n_max are left unresolved rather than refined forever.
+"""
+import math
+
+import numpy as np
+from scipy.stats import binom, norm
+
+
+class Surface:
+    """Failure counts on (m, p) cells."""
+
+    def __init__(self):
+        self.cells = {}
+
+    def add(self, m: int, p: float, failures: int, runs: int):
+        counts = self.cells.setdefault((m, p), [0, 0])
+        counts[0] += failures
+        counts[1] += runs
+
+    @property
+    def trials(self) -> int:
+        return sum(runs for _, runs in self.cells.values())
+
+    def columns(self) -> dict:
+        """p -> (m values, failures, runs), sorted by m."""
+        columns = {}
+        for (m, p), (failures, runs) in sorted(self.cells.items()):
+            ms, fs, rs = columns.setdefault(p, ([], [], []))
+            ms.append(m)
+            fs.append(failures)
+            rs.append(runs)
+        return {p: tuple(np.array(v) for v in column) for p, column in sorted(columns.items())}
+
+
+def decreasing_fit(values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Weighted least squares non-increasing fit (pool adjacent violators)."""
+    blocks = []  # [value, weight, count]
+    for value, weight in zip(values, weights):
+        blocks.append([float(value), float(weight), 1])
+        while len(blocks) > 1 and blocks[-2][0] < blocks[-1][0]:
+            v2, w2, c2 = blocks.pop()
+            v1, w1, c1 = blocks.pop()
+            blocks.append([(v1 * w1 + v2 * w2) / (w1 + w2), w1 + w2, c1 + c2])
+    return np.repeat([b[0] for b in blocks], [b[2] for b in blocks])
+
+
+def _prefix_errors(values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Weighted squared error of the non-increasing fit of values[:k], for every k.
+
+    Pool adjacent violators is online: the blocks after k values are the fit of the
+    first k, so all prefixes take one pass.
+    """
+    errors = np.zeros(len(values) + 1)
+    blocks = []  # [value, weight]
+    total = 0.
+    for k, (value, weight) in enumerate(zip(values, weights)):
+        blocks.append([float(value), float(weight)])
+        while len(blocks) > 1 and blocks[-2][0] < blocks[-1][0]:
+            v2, w2 = blocks.pop()
+            v1, w1 = blocks.pop()
+            # Error added by replacing both blocks with their weighted mean
+            total += w1 * w2 / (w1 + w2) * (v1 - v2) ** 2
+            blocks.append([(v1 * w1 + v2 * w2) / (w1 + w2), w1 + w2])
+        errors[k + 1] = total
+    return errors
+
+
+def unimodal_fit(values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Weighted least squares fit that is non-increasing, then non-decreasing."""
+    # The non-decreasing fit of values[k:] is the reversed non-increasing fit of values[k:][::-1]
+    errors = _prefix_errors(values, weights) + _prefix_errors(values[::-1], weights[::-1])[::-1]
+    k = int(np.argmin(errors))
+    return np.concatenate([
+        decreasing_fit(values[:k], weights[:k]),
+        decreasing_fit(values[k:][::-1], weights[k:][::-1])[::-1],
+    ])
+
+
+def crossings(ms: np.ndarray, failures: np.ndarray, runs: np.ndarray, target: float):
+    """(m*, m**, i, j): the fit is at most the target on ms[i..j].
+
+    m* is interpolated linearly in the fit between ms[i - 1] and ms[i], and m**
+    between ms[j] and ms[j + 1]. m* is ms[0] if the fit starts at or below the target
+    and m** is inf if it ends there. Both are inf if the fit never reaches the target,
+    with i = j the minimum of the fit, where it comes closest.
+    """
+    fit = unimodal_fit(failures / runs, runs)
+    below = np.flatnonzero(fit <= target)
+    if len(below) == 0:
+        k = int(np.argmin(fit))
+        return math.inf, math.inf, k, k
+    i, j = below[0], below[-1]
+    m_low, m_high = float(ms[0]), math.inf
+    if i > 0:
+        f0, f1 = fit[i - 1], fit[i]
+        m_low = float(ms[i - 1] + (f0 - target) / (f0 - f1) * (ms[i] - ms[i - 1]))
+    if j < len(ms) - 1:
+        f0, f1 = fit[j], fit[j + 1]
+        m_high = float(ms[j] + (target - f0) / (f1 - f0) * (ms[j + 1] - ms[j]))
+    return m_low, m_high, i, j
+
+
+def wilson_interval(failures: int, runs: int, confidence: float = 0.95):
+    z = norm.ppf(0.5 + confidence / 2)
+    prob = min(failures / runs, 1.)
+    center = (prob + z ** 2 / (2 * runs)) / (1 + z ** 2 / runs)
+    half_width = z * math.sqrt(prob * (1 - prob) / runs + z ** 2 / (4 * runs ** 2)) / (1 + z ** 2 / runs)
+    return center - half_width, center + half_width
+
+
+def flip_probability(failures: int, runs: int, target: float) -> float:
+    """Probability that a bootstrap draw of a cell lands on the other side of the target."""
+    prob = min(failures / runs, 1.)
+    threshold = math.floor(target * runs)
+    if prob > target:
+        return float(binom.cdf(threshold, runs, prob))
+    return float(binom.sf(threshold, runs, prob))
+
+
+def below_target(failures: int, runs: int, target: float, alpha: float) -> bool:
+    """One-sided binomial test of a cell being below the target at level alpha."""
+    return float(binom.cdf(failures, runs, target)) <= alpha
+
+
+def band_width(low: float, high: float) -> float:
+    """Width of a bootstrap band, 0 if the crossing is beyond the largest m in every sample."""
+    return 0. if low == math.inf else high - low
+
+
+def bracketing_cells(ms: np.ndarray, i: int, j: int) -> list:
+    """Indices of the cells bracketing the crossings (i, j) of a column."""
+    return sorted({k for k in (i - 1, i, j, j + 1) if 0 <= k < len(ms)})
+
+
+def column_resolved(ms: np.ndarray, failures: np.ndarray, runs: np.ndarray, target: float, column_bands,
+                    band: float, confidence: float = 0.95) -> list:
+    """Whether m* and m** of a column are resolved, given their bootstrap bands."""
+    m_low, _, i, j = crossings(ms, failures, runs, target)
+    alpha = (1 - confidence) / (2 * len(ms))
+    below = m_low == math.inf or any(below_target(failures[k], runs[k], target, alpha) for k in range(i, j + 1))
+    return [below and band_width(low, high) <= band for low, high in column_bands]
+
+
+def unresolved(surface: Surface, target: float, bands: dict, band: float, confidence: float = 0.95) -> dict:
+    """p -> names of the crossings of the column that are not resolved."""
+    result = {}
+    for p, (ms, failures, runs) in surface.columns().items():
+        flags = column_resolved(ms, failures, runs, target, bands[p], band, confidence)
+        result[p] = [name for name, done in zip(("m*", "m**"), flags) if not done]
+    return result
+
+
+def refine(surface: Surface, target: float, m_range: tuple, m_tol: int, p_tol: float,
+           n_step: int, n_max: int, bands: dict, band: float, confidence: float = 0.95) -> list:
+    """New (m, p, trials) tasks refining the surface around the target contour.
+
+    bands maps p to the ((low, high), (low, high)) bootstrap bands of m* and m** of
+    that column (contour), band is the width at which a crossing is resolved
+    (column_resolved).
+    """
+    tasks = {}
+    columns = surface.columns()
+    brackets = {}
+    for p, (ms, failures, runs) in columns.items():
+        m_low, m_high, i, j = crossings(ms, failures, runs, target)
+        n = len(ms)
+        alpha = (1 - confidence) / (2 * n)
+        column_bands = bands.get(p, ((0, math.inf),) * 2)
+        resolved = column_resolved(ms, failures, runs, target, column_bands, band, confidence)
+        # Cells around each crossing, or around the minimum, the bracket being (ms[a], ms[b])
+        bounds = []
+        for (a, b), (band_low, band_high), done in zip([(i - 1, i), (j, j + 1)], column_bands, resolved):
+            low = int(ms[a]) if a >= 0 else m_range[0]
+            high = int(ms[b]) if b < n else m_range[1]
+            bounds.append((low, high))
+            if a >= 0 and b < n and ms[b] - ms[a] > m_tol:
+                tasks[((low + high) // 2, p)] = max(n_step, min(runs[a], runs[b]))
+            if done:
+                continue
+            # More trials in the band where the cells cannot tell the side of the target, and
+            # between the crossings where they are not yet known to be below it
+            between = (np.arange(n) >= i) & (np.arange(n) <= j)
+            in_band = np.flatnonzero((ms >= min(band_low, low)) & (ms <= max(min(band_high, m_range[1]), high))
+                                     | between)
+            for k in in_band:
+                unsure = flip_probability(failures[k], runs[k], target) > alpha or (
+                    between[k] and not below_target(failures[k], runs[k], target, alpha))
+                if runs[k] < n_max and unsure:
+                    tasks[(int(ms[k]), p)] = min(max(n_step, runs[k]), n_max - runs[k])
+        brackets[p] = ([min(m_low, m_range[1]), min(m_high, m_range[1])], bounds)
+
+    # New columns between neighbours with distant crossings
+    ps = sorted(columns)
+    for p0, p1 in zip(ps, ps[1:]):
+        if (p1 - p0) / 2 < p_tol:
+            continue
+        (m0, bounds0), (m1, bounds1) = brackets[p0], brackets[p1]
+        if max(abs(a - b) for a, b in zip(m0, m1)) <= m_tol:
+            continue
+        ms = set()
+        for low, high in bounds0 + bounds1:
+            ms.update((low, (low + high) // 2, high))
+        for m in ms:
+            tasks.setdefault((m, (p0 + p1) / 2), n_step)
+    return [(m, p, n) for (m, p), n in sorted(tasks.items())]
+
+
+def contour(surface: Surface, target: float, num_bootstrap: int = 500, confidence: float = 0.95,
+            seed: int = 1) -> list:
+    """(p, m*, m* low, m* high, m**, m** low, m** high) per column.
+
+    The bands come from a parametric bootstrap, inf means beyond the largest m.
+    """
+    rng = np.random.default_rng(seed)
+    alpha = (1 - confidence) / 2
+    result = []
+    for p, (ms, failures, runs) in surface.columns().items():
+        m_low, m_high, _, _ = crossings(ms, failures, runs, target)
+        probs = np.minimum(failures / runs, 1.)
+        samples = np.array([
+            crossings(ms, rng.binomial(runs, probs), runs, target)[:2] for _ in range(num_bootstrap)
+        ])
+        # No interpolation between quantiles, samples may be inf
+        low = np.quantile(samples, alpha, axis=0, method="lower")
+        high = np.quantile(samples, 1 - alpha, axis=0, method="higher")
+        result.append((p, m_low, float(low[0]), float(high[0]), m_high, float(low[1]), float(high[1])))
+    return result
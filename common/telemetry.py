@@ -0,0 +1,201 @@
+"""Live progress and throughput of a sweep, fed by the workers as chunks complete.
+
+map_with_telemetry replaces pool.map: chunks are collected with imap_unordered, and
+every completed chunk updates the failure counts of its cell and the busy time of the
+worker that ran it. A background thread rewrites <path>.json and <path>.prom
+(OpenMetrics text) every interval seconds, and optionally a progress line on the
+terminal, so a sweep can be followed with cat, watch or a node exporter textfile
+collector without any network service. Workers only report completed chunks, so a
+hung worker shows up as a growing seconds_since_last_chunk.
+
+Throughput is reported over the last window seconds, so it follows the sweep as it
+moves to slower cells, and as a lifetime average, which the ETA is based on.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from common.surface import wilson_interval
+
+
+class TimedTask:
+    """Picklable wrapper returning (index, result, timing) for an (index, args) task."""
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, indexed_args):
+        index, args = indexed_args
+        start, cpu_start = time.perf_counter(), time.process_time()
+        result = self.func(args)
+        timing = dict(pid=os.getpid(), busy=time.perf_counter() - start, cpu=time.process_time() - cpu_start)
+        return index, result, timing
+
+
+class Telemetry:
+    """Running state of a sweep over cells (scenario, m, p) with planned trials per cell."""
+
+    def __init__(self, planned: dict, path: str = "telemetry", interval: float = 5., terminal: bool = False,
+                 confidence: float = 0.95, window: float = 60.):
+        self.planned = planned
+        self.path = path
+        self.interval = interval
+        self.terminal = terminal
+        self.confidence = confidence
+        self.window = window
+        self.start = time.perf_counter()
+        self.cells = {cell: {"failures": 0, "runs": 0} for cell in planned}
+        # (time, cell, runs) of the chunks completed in the last window seconds
+        self.recent = deque()
+        self.workers = {}
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, cell, failures: int, runs: int, timing: dict):
+        with self.lock:
+            counts = self.cells.setdefault(cell, {"failures": 0, "runs": 0})
+            counts["failures"] += failures
+            counts["runs"] += runs
+            worker = self.workers.setdefault(timing["pid"], {"busy": 0., "cpu": 0., "chunks": 0, "trials": 0})
+            worker["busy"] += timing["busy"]
+            worker["cpu"] += timing["cpu"]
+            worker["chunks"] += 1
+            worker["trials"] += runs
+            worker["last"] = time.perf_counter()
+            self.recent.append((worker["last"], cell, runs))
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            now = time.perf_counter()
+            elapsed = max(now - self.start, 1e-9)
+            done = sum(c["runs"] for c in self.cells.values())
+            total = sum(self.planned.values())
+            rate = done / elapsed
+
+            while self.recent and self.recent[0][0] < now - self.window:
+                self.recent.popleft()
+            window = min(self.window, elapsed)
+            rates = {}
+            for scenario, m, _ in self.cells:
+                rates.setdefault(scenario, {})[m] = 0.
+            for _, (scenario, m, _), runs in self.recent:
+                rates[scenario][m] += runs / window
+
+            cells = []
+            for (scenario, m, p), counts in sorted(self.cells.items()):
+                runs = counts["runs"]
+                estimate = counts["failures"] / runs if runs else None
+                ci = list(wilson_interval(counts["failures"], runs, self.confidence)) if runs else None
+                cells.append(dict(
+                    scenario=scenario, m=m, p=p, runs=runs, planned=self.planned.get((scenario, m, p), 0),
+                    estimate=estimate, ci=ci,
+                ))
+
+            workers = [
+                dict(pid=pid, chunks=w["chunks"], trials=w["trials"], busy_seconds=w["busy"], cpu_seconds=w["cpu"],
+                     utilization=w["busy"] / elapsed, seconds_since_last_chunk=now - w["last"])
+                for pid, w in sorted(self.workers.items())
+            ]
+            return dict(
+                elapsed_seconds=elapsed, trials_done=done, trials_planned=total,
+                trials_per_second_lifetime=rate, eta_seconds=(total - done) / rate if rate > 0 else None,
+                rate_window_seconds=self.window,
+                trials_per_second_window=sum(runs for _, _, runs in self.recent) / window,
+                trials_per_second_by_m={s: {str(m): r for m, r in sorted(by_m.items())} for s, by_m in rates.items()},
+                confidence=self.confidence, workers=workers, cells=cells,
+            )
+
+    def write(self):
+        state = self.snapshot()
+        # Write then rename, so readers never see a partial file
+        with open(self.path + ".json.tmp", "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+        with open(self.path + ".prom.tmp", "w") as f:
+            f.write(openmetrics(state))
+        os.replace(self.path + ".prom.tmp", self.path + ".prom")
+
+        if self.terminal:
+            eta = f"{state['eta_seconds']:.0f} s" if state["eta_seconds"] is not None else "?"
+            scenarios = ", ".join(
+                f"{s} {sum(by_m.values()):.1f}/s" for s, by_m in state["trials_per_second_by_m"].items()
+            )
+            sys.stderr.write(
+                f"\r{state['trials_done']}/{state['trials_planned']} trials "
+                f"({state['trials_done'] / max(state['trials_planned'], 1):.0%}), "
+                f"{state['trials_per_second_window']:.1f} trials/s over {self.window:.0f} s [{scenarios}], "
+                f"{state['trials_per_second_lifetime']:.1f} trials/s since the start, "
+                f"{len(state['workers'])} workers, ETA {eta}   "
+            )
+            sys.stderr.flush()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.write()
+        if self.terminal:
+            sys.stderr.write("\n")
+
+
+def openmetrics(state: dict) -> str:
+    lines = [
+        "# TYPE sweep_trials counter",
+        *(f'sweep_trials_total{{scenario="{c["scenario"]}",m="{c["m"]}",p="{c["p"]}"}} {c["runs"]}'
+          for c in state["cells"]),
+        "# TYPE sweep_trials_planned gauge",
+        *(f'sweep_trials_planned{{scenario="{c["scenario"]}",m="{c["m"]}",p="{c["p"]}"}} {c["planned"]}'
+          for c in state["cells"]),
+        "# TYPE sweep_trials_per_second gauge",
+        f"# HELP sweep_trials_per_second Trials per second over the last {state['rate_window_seconds']:.0f} s.",
+        *(f'sweep_trials_per_second{{scenario="{s}",m="{m}"}} {r}'
+          for s, by_m in state["trials_per_second_by_m"].items() for m, r in by_m.items()),
+        "# TYPE sweep_trials_per_second_lifetime gauge",
+        "# HELP sweep_trials_per_second_lifetime Trials per second averaged since the start of the sweep.",
+        f"sweep_trials_per_second_lifetime {state['trials_per_second_lifetime']}",
+        "# TYPE sweep_failure_probability gauge",
+        *(f'sweep_failure_probability{{scenario="{c["scenario"]}",m="{c["m"]}",p="{c["p"]}"}} {c["estimate"]}'
+          for c in state["cells"] if c["estimate"] is not None),
+        "# TYPE sweep_failure_probability_ci gauge",
+        f"# HELP sweep_failure_probability_ci Bounds of the {state['confidence']:.0%} Wilson interval "
+        "of the failure probability.",
+        *(f'sweep_failure_probability_ci{{scenario="{c["scenario"]}",m="{c["m"]}",p="{c["p"]}",bound="{bound}"}} '
+          f'{value}'
+          for c in state["cells"] if c["ci"] is not None for bound, value in zip(("low", "high"), c["ci"])),
+        "# TYPE sweep_worker_busy_seconds counter",
+        *(f'sweep_worker_busy_seconds_total{{pid="{w["pid"]}"}} {w["busy_seconds"]}' for w in state["workers"]),
+        "# TYPE sweep_worker_seconds_since_last_chunk gauge",
+        *(f'sweep_worker_seconds_since_last_chunk{{pid="{w["pid"]}"}} {w["seconds_since_last_chunk"]}'
+          for w in state["workers"]),
+        "# TYPE sweep_eta_seconds gauge",
+        f"sweep_eta_seconds {state['eta_seconds'] if state['eta_seconds'] is not None else 'NaN'}",
+        "# EOF",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def map_with_telemetry(pool, func, tasks: list, telemetry: Telemetry, describe) -> list:
+    """pool.map(func, tasks), recording every chunk in telemetry as soon as it completes.
+
+    describe(result) returns (cell, failures, runs) of a chunk result. The results are
+    returned in the order of tasks.
+    """
+    results = [None] * len(tasks)
+    with telemetry:
+        for index, result, timing in pool.imap_unordered(TimedTask(func), list(enumerate(tasks))):
+            results[index] = result
+            cell, failures, runs = describe(result)
+            telemetry.record(cell, failures, runs, timing)
+    return results
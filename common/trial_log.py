@@ -0,0 +1,49 @@
+import json
+import logging
+import os
+from logging.handlers import MemoryHandler
+
+logger = logging.getLogger("broadcast")
+logger.addHandler(logging.NullHandler())
+logger.setLevel(logging.WARNING)
+logger.propagate = False
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        fields = dict(level=record.levelname, time=record.created, pid=record.process, event=record.getMessage())
+        fields.update(getattr(record, "fields", {}))
+        return json.dumps(fields, default=sorted)
+
+
+def log_event(node: str, event: str, level: int = logging.DEBUG, **fields):
+    """Log a structured per trial event; dropped unless the level is enabled."""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": dict(node=node, **fields)})
+
+
+def configure_trial_log(debug: bool = False, directory: str = "."):
+    """Configure the log of this process, meant as Pool initializer.
+
+    By default nothing below WARNING is logged. In debug mode the events are kept in
+    memory and only written, as JSON lines to trial_log_<pid>.jsonl, on flush_trial_log().
+    """
+    for handler in logger.handlers[:]:
+        if isinstance(handler, MemoryHandler):
+            handler.close()
+        logger.removeHandler(handler)
+    if not debug:
+        logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.WARNING)
+        return
+
+    target = logging.FileHandler(os.path.join(directory, f"trial_log_{os.getpid()}.jsonl"))
+    target.setFormatter(JsonFormatter())
+    # Never flush on capacity or level, only explicitly per chunk
+    logger.addHandler(MemoryHandler(capacity=float("inf"), flushLevel=logging.CRITICAL + 1, target=target))
+    logger.setLevel(logging.DEBUG)
+
+
+def flush_trial_log():
+    for handler in logger.handlers:
+        handler.flush()
@@ -1,6 +1,10 @@
 import random
 import math
 
+import numpy as np
+
+import netsquid as ns
+
 from netqasm.sdk import Qubit
 from netqasm.sdk.classical_communication.message import StructuredMessage
 
@@ -10,12 +14,73 @@ from squidasm.util.routines import (
     distributed_CNOT_target, teleport_send, teleport_recv,
 )
 
+from common.config import check_state_injection
+from common.noise_model import prepare_state_vector
+from common.routines import assign_measurement, assign_state, teleport_send_concurrent
+from common.trial_log import log_event
+
+# State of the sender qubits after a noiseless prepare_state
+PREPARED_STATE = prepare_state_vector()
+
+
+def receive_rounds(context: ProgramContext, sender: str, num_rounds: int):
+    """Receive num_rounds teleported qubits from the sender and measure them."""
+    connection = context.connection
+    measurements = []
+    for idx in range(num_rounds):
+        #Receive qubit
+        q = yield from teleport_recv(context=context, peer_name=sender)
+
+        r = q.measure()
+        yield from connection.flush()
+        measurements.append(int(r))
+    return measurements
+
+
+def check(xj, measurements, checkset, m: int, mu: float):
+    """CHECK phase: accept xj iff the checkset is large enough and consistent."""
+    T = math.ceil(mu * m)
+    if len(checkset) >= T and all(measurements[i] != xj for i in checkset):
+        return xj
+    return None
+
+
+def cross_check(y_inter, measurements, r0_output, r0_checkset, m: int, mu: float, lam: float):
+    """CROSS-CHECK phase of Node2 given Node1's output and checkset."""
+    T = math.ceil(mu * m)
+    if r0_output != y_inter and r0_output is not None and y_inter is not None:
+        if len(r0_checkset) >= T:
+            n_opposite = sum(1 for i in r0_checkset if measurements[i] != r0_output)
+            threshold = lam * T + len(r0_checkset) - T
+            if n_opposite >= threshold:
+                return r0_output
+    return y_inter
+
+
 class SenderProgram(Program):
     PEER_NAME1 = "Node1"
     PEER_NAME2 = "Node2"
 
-    def __init__(self, m):
+    def __init__(self, m, concurrent_epr: bool = False, record_rounds: bool = False,
+                 inject_state: bool = False, config: dict = None, inputs: list = None):
         self.m = m
+        # (xs, uniforms) of every trial in turn: xs is sent instead of a random bit and
+        # round i measures q0 and q1 by inverse transform of uniforms[i], coupling the
+        # trial to a model trial on the same inputs (common.multifidelity)
+        self.inputs = inputs
+        self.trial = 0
+        # Return the measured (r0, r1) of every round, for prefix evaluation
+        self.record_rounds = record_rounds
+        # Request the EPR pairs to both receivers in one subroutine
+        self.concurrent_epr = concurrent_epr
+        # Skip the gates of prepare_state and assign the prepared state in NetSquid,
+        # only equivalent without gate noise, which is checked on the config the
+        # program runs on
+        if inject_state:
+            if config is None:
+                raise ValueError("inject_state requires the config, to check that the sender has no gate noise")
+            check_state_injection(config)
+        self.inject_state = inject_state
 
     def prepare_state(self, q0: Qubit, q1: Qubit, q2: Qubit, q3: Qubit):
         q0.H()
@@ -39,6 +104,47 @@ class SenderProgram(Program):
         q0.cnot(q2)
 
 
+    def prepare_round_state(self, context: ProgramContext, q0: Qubit, q1: Qubit, q2: Qubit, q3: Qubit):
+        """Run prepare_state, or with inject_state assign its output state directly."""
+        if self.inject_state:
+            # The qubits have to be allocated before their state can be assigned
+            yield from context.connection.flush()
+            assign_state(context, "Sender", [q0, q1, q2, q3], PREPARED_STATE)
+        else:
+            self.prepare_state(q0, q1, q2, q3)
+
+    def distribute_round(self, context: ProgramContext, u: float = None):
+        """Prepare one four-qubit state, measure q0 and q1 and teleport q2 and q3.
+
+        With u the outcome of q0 and q1 is chosen by inverse transform of u (assign_measurement).
+        """
+        connection = context.connection
+
+        #Implement the circuit
+        q0 = Qubit(connection)
+        q1 = Qubit(connection)
+        q2 = Qubit(connection)
+        q3 = Qubit(connection)
+
+        yield from self.prepare_round_state(context, q0, q1, q2, q3)
+        if u is not None:
+            yield from connection.flush()
+            assign_measurement(context, "Sender", [q0, q1, q2, q3], u)
+
+        #Measure Qubits
+        r0 = q0.measure()
+        r1 = q1.measure()
+
+        #Distribute the qubits, q2 and q3 are inactive now
+        if self.concurrent_epr:
+            yield from teleport_send_concurrent({self.PEER_NAME1: q2, self.PEER_NAME2: q3}, context=context)
+        else:
+            yield from teleport_send(q=q2,context=context, peer_name=self.PEER_NAME1)
+            yield from teleport_send(q=q3, context=context, peer_name=self.PEER_NAME2)
+        yield from connection.flush()
+
+        return int(r0), int(r1)
+
     @property
     def meta(self) -> ProgramMeta:
         return ProgramMeta(
@@ -50,40 +156,32 @@ class SenderProgram(Program):
 
     def run(self, context: ProgramContext):
 
+        start_time = ns.sim_time()
         csocket1 = context.csockets[self.PEER_NAME1]
         csocket2 = context.csockets[self.PEER_NAME2]
         connection = context.connection
 
         #Choose random bit of information
-        xs = random.choice([0, 1])
+        uniforms = [None] * self.m
+        if self.inputs is not None:
+            xs, uniforms = self.inputs[self.trial]
+            self.trial += 1
+        else:
+            xs = random.choice([0, 1])
         checkset = set()
+        rounds = []
 
         #Send bit of information
         csocket1.send(xs)
         csocket2.send(xs)
 
         for idx in range(self.m):
-            #Implement the circuit
-            q0 = Qubit(connection)
-            q1 = Qubit(connection)
-            q2 = Qubit(connection)
-            q3 = Qubit(connection)
-
-            self.prepare_state(q0,q1,q2,q3)
-
-            #Measure Qubits
-            r0 = q0.measure()
-            r1 = q1.measure()
-
-            #Distribute the qubits, q2 and q3 are inactive now
-            yield from teleport_send(q=q2,context=context, peer_name=self.PEER_NAME1)
-            yield from teleport_send(q=q3, context=context, peer_name=self.PEER_NAME2)
-            yield from connection.flush()
-
-
+            r0, r1 = yield from self.distribute_round(context, u=uniforms[idx])
 
             if r0==xs and r1==xs:
                 checkset.add(idx)
+            if self.record_rounds:
+                rounds.append((int(r0), int(r1)))
 
 
         #Send checkset
@@ -92,18 +190,22 @@ class SenderProgram(Program):
         yield from connection.flush()
 
         ys = xs
-        print(f"Sender result {ys}")
-        return {"xs": xs}
+        log_event("Sender", "result", ys=ys)
+        result = {"xs": xs, "checkset_size": len(checkset), "sim_duration": ns.sim_time() - start_time}
+        if self.record_rounds:
+            result["rounds"] = rounds
+        return result
 
 
 class Node1Program(Program):
     SENDER = "Sender"
     PEER_NAME = "Node2"
 
-    def __init__(self, m: int, mu: float, lam: float):
+    def __init__(self, m: int, mu: float, lam: float, record_rounds: bool = False):
         self.m = m
         self.mu = mu
         self.lam = lam
+        self.record_rounds = record_rounds
 
     @property
     def meta(self) -> ProgramMeta:
@@ -116,6 +218,7 @@ class Node1Program(Program):
 
     def run(self, context: ProgramContext):
 
+        start_time = ns.sim_time()
         csocket_s = context.csockets[self.SENDER]
         csocket_n = context.csockets[self.PEER_NAME]
         connection = context.connection
@@ -124,41 +227,34 @@ class Node1Program(Program):
         #Receive bit of information
         xj = yield from csocket_s.recv()
 
-        measurements = []
-        for idx in range(self.m):
-            #Receive qubit
-            q2 = yield from teleport_recv(context=context, peer_name=self.SENDER)
-
-            r2 = q2.measure()
-            yield from connection.flush()
-            measurements.append(int(r2))
+        measurements = yield from receive_rounds(context, self.SENDER, self.m)
 
         checkset = yield from csocket_s.recv()
 
         #CHECK PHASE
-        T = math.ceil(self.mu * self.m)
-        if len(checkset) >= T and all(measurements[i] != xj for i in checkset):
-            y0 = xj
-        else:
-            y0 = None
+        y0 = check(xj, measurements, checkset, self.m, self.mu)
 
         #CROSS-CALLING PHASE
         csocket_n.send(y0)
         csocket_n.send(checkset)
         connection.flush()
 
-        print(f"Node 1 result: {y0}")
+        log_event("Node1", "result", y0=y0)
 
-        return {"y0": y0}
+        result = {"y0": y0, "sim_duration": ns.sim_time() - start_time}
+        if self.record_rounds:
+            result["measurements"] = measurements
+        return result
 
 class Node2Program(Program):
     SENDER = "Sender"
     PEER_NAME = "Node1"
 
-    def __init__(self, m: int, mu: float, lam: float):
+    def __init__(self, m: int, mu: float, lam: float, record_rounds: bool = False):
         self.m = m
         self.mu = mu
         self.lam = lam
+        self.record_rounds = record_rounds
 
     @property
     def meta(self) -> ProgramMeta:
@@ -171,6 +267,7 @@ class Node2Program(Program):
 
     def run(self, context: ProgramContext):
 
+        start_time = ns.sim_time()
         csocket_s = context.csockets[self.SENDER]
         csocket_n = context.csockets[self.PEER_NAME]
         connection = context.connection
@@ -179,41 +276,168 @@ class Node2Program(Program):
         # Receive bit of information
         xj = yield from csocket_s.recv()
 
-        measurements = []
-        for idx in range(self.m):
-
-            q3= yield from teleport_recv(context=context, peer_name=self.SENDER)
-            r3 = q3.measure()
-            yield from connection.flush()
-            measurements.append(int(r3))
+        measurements = yield from receive_rounds(context, self.SENDER, self.m)
 
         checkset = yield from csocket_s.recv()
 
         #CHECK PHASE
-        T = math.ceil(self.mu * self.m)
-        if len(checkset) >= T and all(measurements[i] != xj for i in checkset):
-            y_inter = xj
-        else:
-            y_inter = None
+        y_inter = check(xj, measurements, checkset, self.m, self.mu)
 
         #CROSS-CALLING PHASE
         r0_output = yield from csocket_n.recv()
         r0_checkset = yield from csocket_n.recv()
 
         #CROSS-CHECK PHASE
-        if r0_output != y_inter and r0_output is not None and y_inter is not None:
-            if len(r0_checkset) >= T:
-                n_opposite = sum(1 for i in r0_checkset if measurements[i] != r0_output)
-                threshold = self.lam * T + len(r0_checkset) - T
-                if n_opposite >= threshold:
-                    y1 = r0_output
-                else:
-                    y1 = y_inter
-            else:
-                y1 = y_inter
-        else:
-            y1 = y_inter
+        y1 = cross_check(y_inter, measurements, r0_output, r0_checkset, self.m, self.mu, self.lam)
+
+        log_event("Node2", "result", y1=y1)
+        result = {"y1": y1, "sim_duration": ns.sim_time() - start_time}
+        if self.record_rounds:
+            result["measurements"] = measurements
+        return result
+
+
+class BatchSenderProgram(SenderProgram):
+    """Sender broadcasting k independent bits in one session, m rounds per bit.
+
+    The k * m rounds run back to back on the same network, the bits and the
+    checksets are sent as one list each.
+    """
+
+    def __init__(self, m: int, k: int, concurrent_epr: bool = False):
+        super().__init__(m, concurrent_epr=concurrent_epr)
+        self.k = k
+
+    def run(self, context: ProgramContext):
+
+        start_time = ns.sim_time()
+        csocket1 = context.csockets[self.PEER_NAME1]
+        csocket2 = context.csockets[self.PEER_NAME2]
+        connection = context.connection
 
+        xs = [random.choice([0, 1]) for _ in range(self.k)]
+        checksets = [set() for _ in range(self.k)]
+
+        csocket1.send(xs)
+        csocket2.send(xs)
+
+        num_rounds = self.k * self.m
+        for idx in range(num_rounds):
+            instance, round_idx = divmod(idx, self.m)
+            r0, r1 = yield from self.distribute_round(context)
+
+            if r0 == xs[instance] and r1 == xs[instance]:
+                checksets[instance].add(round_idx)
+
+        csocket1.send(checksets)
+        csocket2.send(checksets)
+        yield from connection.flush()
+
+        log_event("Sender", "result", ys=xs)
+        return {"xs": xs, "checkset_size": [len(c) for c in checksets], "sim_duration": ns.sim_time() - start_time}
+
+
+class BatchNode1Program(Node1Program):
+    """Node1 side of BatchSenderProgram, returns one decision per instance."""
+
+    def __init__(self, m: int, mu: float, lam: float, k: int):
+        super().__init__(m, mu, lam)
+        self.k = k
+
+    def run(self, context: ProgramContext):
+
+        start_time = ns.sim_time()
+        csocket_s = context.csockets[self.SENDER]
+        csocket_n = context.csockets[self.PEER_NAME]
+        connection = context.connection
+
+        xjs = yield from csocket_s.recv()
+        measurements = yield from receive_rounds(context, self.SENDER, self.k * self.m)
+        checksets = yield from csocket_s.recv()
+
+        y0s = [
+            check(xjs[i], measurements[i * self.m:(i + 1) * self.m], checksets[i], self.m, self.mu)
+            for i in range(self.k)
+        ]
+
+        csocket_n.send(y0s)
+        csocket_n.send(checksets)
+        yield from connection.flush()
+
+        log_event("Node1", "result", y0=y0s)
+        return {"y0": y0s, "sim_duration": ns.sim_time() - start_time}
+
+
+class BatchNode2Program(Node2Program):
+    """Node2 side of BatchSenderProgram, returns one decision per instance."""
+
+    def __init__(self, m: int, mu: float, lam: float, k: int):
+        super().__init__(m, mu, lam)
+        self.k = k
+
+    def run(self, context: ProgramContext):
+
+        start_time = ns.sim_time()
+        csocket_s = context.csockets[self.SENDER]
+        csocket_n = context.csockets[self.PEER_NAME]
+
+        xjs = yield from csocket_s.recv()
+        measurements = yield from receive_rounds(context, self.SENDER, self.k * self.m)
+        checksets = yield from csocket_s.recv()
+
+        r0_outputs = yield from csocket_n.recv()
+        r0_checksets = yield from csocket_n.recv()
+
+        y1s = []
+        for i in range(self.k):
+            instance_measurements = measurements[i * self.m:(i + 1) * self.m]
+            y_inter = check(xjs[i], instance_measurements, checksets[i], self.m, self.mu)
+            y1s.append(cross_check(
+                y_inter, instance_measurements, r0_outputs[i], r0_checksets[i], self.m, self.mu, self.lam
+            ))
+
+        log_event("Node2", "result", y1=y1s)
+        return {"y1": y1s, "sim_duration": ns.sim_time() - start_time}
+
+
+class RoundBlockSenderProgram(SenderProgram):
+    """Sender running only the rounds of a trial, for round-sharded trials.
+
+    Returns the class label of every round (0: r0 = r1 = 0, 1: mixed, 2: r0 = r1 = 1),
+    which is all the CHECK phase of any scenario needs from the sender.
+    """
+
+    def run(self, context: ProgramContext):
+
+        start_time = ns.sim_time()
+        labels = np.empty(self.m, dtype=np.uint8)
+        for idx in range(self.m):
+            r0, r1 = yield from self.distribute_round(context)
+            labels[idx] = r0 + r1
+
+        return {"labels": labels, "sim_duration": ns.sim_time() - start_time}
+
+
+class RoundBlockReceiverProgram(Program):
+    """Node1 or Node2 running only the rounds of a trial, returns its packed measurements."""
+    SENDER = "Sender"
+
+    def __init__(self, m: int, name: str):
+        self.m = m
+        self.name = name
+
+    @property
+    def meta(self) -> ProgramMeta:
+        return ProgramMeta(
+            name=self.name,
+            csockets=[self.SENDER],
+            epr_sockets=[self.SENDER],
+            max_qubits=2,
+        )
+
+    def run(self, context: ProgramContext):
 
-        print(f"Node 2 result: {y1}")
-        return {"y1": y1}
\ No newline at end of file
+        start_time = ns.sim_time()
+        measurements = yield from receive_rounds(context, self.SENDER, self.m)
+        return {"measurements": np.packbits(np.array(measurements, dtype=np.uint8)),
+                "sim_duration": ns.sim_time() - start_time}
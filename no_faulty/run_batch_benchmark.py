@@ -0,0 +1,60 @@
+import sys
+import time
+import matplotlib.pyplot as plt
+
+sys.path.append("..")
+from application import BatchNode1Program, BatchNode2Program, BatchSenderProgram
+from common.config import load_config, select_formalism, set_formalism
+from squidasm.run.stack.config import StackNetworkConfig
+from squidasm.run.stack.run import run
+
+# Amortized wall time per broadcast bit with k broadcasts per simulated session
+cfg = StackNetworkConfig.from_file("../config.yaml")
+mu, lam = 0.272, 0.94
+m = 100                             # Rounds per broadcast instance
+N = 16                              # Broadcast bits per value of k
+k_values = [1, 2, 4, 8, 16]
+FORMALISM = select_formalism(load_config("../config.yaml"))  # KET if noiseless, else DM; pass "KET" or "DM" to override
+
+
+def benchmark(k):
+    sessions = max(1, N // k)
+    set_formalism(FORMALISM)
+    start = time.perf_counter()
+    results = run(
+        config=cfg,
+        programs={
+            "Node1": BatchNode1Program(m=m, mu=mu, lam=lam, k=k),
+            "Node2": BatchNode2Program(m=m, mu=mu, lam=lam, k=k),
+            "Sender": BatchSenderProgram(m=m, k=k),
+        },
+        num_times=sessions
+    )
+    wall_time = time.perf_counter() - start
+
+    failures = 0
+    for i in range(sessions):
+        for y0, y1 in zip(results[1][i]["y0"], results[2][i]["y1"]):
+            if y0 is None or y1 is None or y0 != y1:
+                failures += 1
+    bits = sessions * k
+    return wall_time / bits, failures / bits
+
+
+if __name__ == "__main__":
+    wall_times = []
+    for k in k_values:
+        per_bit, failure_rate = benchmark(k)
+        wall_times.append(per_bit)
+        print(f"k = {k:3d}: {per_bit:.3f} s wall time per broadcast bit, failure rate {failure_rate:.3f}")
+
+    # Plotting
+    plt.figure(figsize=(6, 4))
+    plt.plot(k_values, wall_times, "o-")
+    plt.xscale("log", base=2)
+    plt.xlabel("broadcast instances per session, $k$")
+    plt.ylabel("wall time per broadcast bit [s]")
+    plt.title(f"Batched Broadcast (No Faulty, m={m})")
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig("batch_benchmark.png", dpi=300)
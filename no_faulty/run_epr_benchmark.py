@@ -0,0 +1,69 @@
+import sys
+import time
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.append("..")
+from application import Node1Program, Node2Program, SenderProgram
+from common.config import load_config, select_formalism, set_formalism, to_network_config
+from squidasm.run.stack.run import run
+
+# Compare sequential teleportation with concurrent EPR generation to both receivers
+mu, lam = 0.272, 0.94
+N = 20                               # Runs per (mode, m)
+m_values = list(range(20, 400, 60))  # Range of m values
+FORMALISM = None  # None: KET if noiseless, else DM, per configuration; pass "KET" or "DM" to override
+modes = {
+    "sequential": dict(),
+    "concurrent": dict(concurrent_epr=True),
+}
+
+
+def benchmark(m, mode_kwargs):
+    config = load_config("../config.yaml")
+    cfg = to_network_config(config)
+    set_formalism(select_formalism(config, FORMALISM))
+
+    start = time.perf_counter()
+    results = run(
+        config=cfg,
+        programs={
+            "Node1": Node1Program(m=m, mu=mu, lam=lam),
+            "Node2": Node2Program(m=m, mu=mu, lam=lam),
+            "Sender": SenderProgram(m=m, **mode_kwargs),
+        },
+        num_times=N
+    )
+    wall_time = (time.perf_counter() - start) / N
+
+    # The protocol completes when the last of the three programs finishes
+    sim_times = [max(results[node][i]["sim_duration"] for node in range(3)) for i in range(N)]
+    return np.mean(sim_times), np.std(sim_times), wall_time
+
+
+if __name__ == "__main__":
+    measurements = {mode: [] for mode in modes}
+    for m in m_values:
+        for mode, mode_kwargs in modes.items():
+            sim_mean, sim_std, wall_time = benchmark(m, mode_kwargs)
+            measurements[mode].append((sim_mean, sim_std, wall_time))
+            print(f"m = {m:4d} {mode:22s} simulated {sim_mean / 1e9:.4f} s (std {sim_std / 1e9:.4f}), "
+                  f"wall {wall_time:.3f} s per trial")
+
+    # Plotting
+    fig, (ax_sim, ax_wall) = plt.subplots(1, 2, figsize=(11, 4))
+    for mode in modes:
+        sim_mean = [r[0] / 1e9 for r in measurements[mode]]
+        sim_std = [r[1] / 1e9 for r in measurements[mode]]
+        ax_sim.errorbar(m_values, sim_mean, yerr=sim_std, fmt='o-', capsize=3, label=mode)
+        ax_wall.plot(m_values, [r[2] for r in measurements[mode]], 'o-', label=mode)
+    ax_sim.set_xlabel("number of four-qubit singlet states, $m$")
+    ax_sim.set_ylabel("simulated completion time [s]")
+    ax_wall.set_xlabel("number of four-qubit singlet states, $m$")
+    ax_wall.set_ylabel("wall time per trial [s]")
+    for ax in (ax_sim, ax_wall):
+        ax.grid(True)
+        ax.legend()
+    fig.suptitle(f"EPR generation: sequential vs concurrent (No Faulty, N={N})")
+    fig.tight_layout()
+    fig.savefig("epr_benchmark.png", dpi=300)
@@ -0,0 +1,84 @@
+import sys
+import time
+import numpy as np
+from scipy.stats import chi2_contingency
+
+sys.path.append("..")
+from application import Node1Program, Node2Program, SenderProgram
+from common.config import (
+    check_state_injection, load_config, select_formalism, set_formalism, to_network_config,
+)
+from common.noise_model import prepare_state_density_matrix, prepare_state_vector, round_distribution
+from squidasm.run.stack.run import run
+
+# Compare the 13 gates of prepare_state with assigning the prepared state directly,
+# on the noiseless gate configuration where both are equivalent
+mu, lam = 0.272, 0.94
+N = 200                       # Runs per (mode, m)
+m_values = [20, 100, 300]     # Range of m values
+FORMALISM = None  # None: KET if noiseless, else DM, per configuration; pass "KET" or "DM" to override
+modes = {
+    "gates": dict(),
+    "injected": dict(inject_state=True),
+}
+
+
+def benchmark(config, m, mode_kwargs):
+    cfg = to_network_config(config)
+    set_formalism(select_formalism(config, FORMALISM))
+
+    start = time.perf_counter()
+    results = run(
+        config=cfg,
+        programs={
+            "Node1": Node1Program(m=m, mu=mu, lam=lam, record_rounds=True),
+            "Node2": Node2Program(m=m, mu=mu, lam=lam, record_rounds=True),
+            "Sender": SenderProgram(m=m, record_rounds=True, config=config, **mode_kwargs),
+        },
+        num_times=N
+    )
+    wall_time = (time.perf_counter() - start) / N
+
+    # Histogram of the per round outcomes, flattened as r0 r1 r2 r3
+    counts = np.zeros(16, dtype=int)
+    for i in range(N):
+        rounds = results[0][i]["rounds"]
+        r2s = results[1][i]["measurements"]
+        r3s = results[2][i]["measurements"]
+        for (r0, r1), r2, r3 in zip(rounds, r2s, r3s):
+            counts[8 * r0 + 4 * r1 + 2 * r2 + r3] += 1
+    failures = sum(
+        y0 is None or y1 is None or y0 != y1
+        for y0, y1 in ((results[1][i]["y0"], results[2][i]["y1"]) for i in range(N))
+    )
+    sim_time = np.mean([max(results[node][i]["sim_duration"] for node in range(3)) for i in range(N)])
+    return counts, failures / N, sim_time, wall_time
+
+
+if __name__ == "__main__":
+    # The injected state is the noiseless output of the gate sequence
+    ket = prepare_state_vector()
+    deviation = np.abs(np.outer(ket, ket.conj()) - prepare_state_density_matrix(0, 0)).max()
+    print(f"Injected state vs noiseless gate sequence: max density matrix deviation {deviation:.1e}")
+
+    config = load_config("../config.yaml")
+    # Fails before any trial if config.yaml has been changed to a noisy sender
+    check_state_injection(config)
+    expected = round_distribution(config).ravel()
+
+    for m in m_values:
+        measured = {mode: benchmark(config, m, mode_kwargs) for mode, mode_kwargs in modes.items()}
+
+        # Same outcome statistics: both histograms against each other and against the model
+        table = np.array([measured[mode][0] for mode in modes])
+        table = table[:, table.sum(axis=0) > 0]
+        _, p_value, _, _ = chi2_contingency(table)
+        print(f"m = {m}: outcome histograms gates vs injected, chi-square p-value {p_value:.3f}")
+        for mode in modes:
+            counts, failure_prob, sim_time, wall_time = measured[mode]
+            tv_distance = 0.5 * np.abs(counts / counts.sum() - expected).sum()
+            print(f"  {mode:9s} failure {failure_prob:.3f}, distance to model {tv_distance:.4f}, "
+                  f"simulated {sim_time / 1e9:.4f} s, wall {wall_time:.4f} s per trial")
+
+        gates, injected = measured["gates"], measured["injected"]
+        print(f"  speedup per trial: wall {gates[3] / injected[3]:.2f}x, simulated time {gates[2] / injected[2]:.2f}x")
@@ -0,0 +1,122 @@
+import copy
+import csv
+import sys
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.append("..")
+from application import Node1Program, Node2Program, SenderProgram
+from common.config import (
+    load_config, select_formalism, set_formalism, set_link_param, set_qdevice_param, to_network_config,
+)
+from multiprocessing import Pool, cpu_count
+from squidasm.run.stack.run import run
+
+# Parameters
+mu, lam = 0.272, 0.94
+N = 200                             # Runs per configuration
+m = 300                             # Value of m
+NUM_CORES = cpu_count()
+FORMALISM = None  # None: KET if noiseless, else DM, per configuration; pass "KET" or "DM" to override
+NODES = ["Sender", "Node1", "Node2"]
+
+# Configuration variants as (section, key, value) changes to config.yaml
+variants = {
+    "baseline": [],
+    "prob_success=0.1": [("links", "prob_success", 0.1)],
+    "prob_success=0.6": [("links", "prob_success", 0.6)],
+    "t_cycle=1e4": [("links", "t_cycle", 1e4)],
+    "t_cycle=1e6": [("links", "t_cycle", 1e6)],
+    "clink delay x10": [("clinks", "delay", 10)],
+    "two_qubit_gate_time=1e4": [("qdevice", "two_qubit_gate_time", 10_000)],
+    "two_qubit_gate_time=1e6": [("qdevice", "two_qubit_gate_time", 1_000_000)],
+}
+
+
+def variant_config(changes):
+    config = copy.deepcopy(load_config("../config.yaml"))
+    for section, key, value in changes:
+        if section == "qdevice":
+            set_qdevice_param(config, key, value)
+        elif section == "clinks":
+            # Scale the classical delays, they differ per link
+            for clink in config["clinks"]:
+                clink["cfg"][key] = float(clink["cfg"][key]) * value
+        else:
+            set_link_param(config, key, value, links=section)
+    return config
+
+
+def simulate_chunk(args):
+    name, chunk_size = args
+    config = variant_config(variants[name])
+    cfg = to_network_config(config)
+    set_formalism(select_formalism(config, FORMALISM))
+
+    results = run(
+        config=cfg,
+        programs={
+            "Node1": Node1Program(m=m, mu=mu, lam=lam),
+            "Node2": Node2Program(m=m, mu=mu, lam=lam),
+            "Sender": SenderProgram(m=m),
+        },
+        num_times=chunk_size
+    )
+
+    # Simulated running time (ns) of each node per trial
+    durations = [[results[node][i]["sim_duration"] for node in range(3)] for i in range(chunk_size)]
+    return name, durations
+
+
+if __name__ == "__main__":
+    tasks = []
+    for name in variants:
+        base_chunk = N // NUM_CORES
+        remainder = N % NUM_CORES
+        for i in range(NUM_CORES):
+            chunk = base_chunk + (1 if i < remainder else 0)
+            if chunk > 0:
+                tasks.append((name, chunk))
+
+    with Pool(processes=NUM_CORES) as pool:
+        chunk_results = pool.map(simulate_chunk, tasks)
+
+    durations_by_variant = {name: [] for name in variants}
+    for name, durations in chunk_results:
+        durations_by_variant[name].extend(durations)
+
+    # Latency of a broadcast is the time until the last node has its output
+    rows = []
+    latencies = {}
+    for name, durations in durations_by_variant.items():
+        per_node = np.array(durations) / 1e9
+        latency = per_node.max(axis=1)
+        latencies[name] = latency
+        p50, p90, p99 = np.percentile(latency, [50, 90, 99])
+        row = {
+            "variant": name,
+            "mean_s": latency.mean(),
+            "p50_s": p50,
+            "p90_s": p90,
+            "p99_s": p99,
+            "broadcasts_per_sim_s": 1 / latency.mean(),
+        }
+        row.update({f"mean_{node}_s": per_node[:, i].mean() for i, node in enumerate(NODES)})
+        rows.append(row)
+        print(f"{name:25s} mean {row['mean_s']:.4f} s  p50 {p50:.4f}  p90 {p90:.4f}  p99 {p99:.4f}  "
+              f"{row['broadcasts_per_sim_s']:.2f} broadcasts/s")
+
+    with open("latency_study.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    # Plotting
+    plt.figure(figsize=(9, 5))
+    plt.boxplot(list(latencies.values()), whis=(1, 99), showfliers=False)
+    plt.xticks(range(1, len(latencies) + 1), list(latencies.keys()), rotation=30, ha="right")
+    plt.ylabel("simulated broadcast latency [s]")
+    plt.title(f"Broadcast Latency per Configuration (No Faulty, N={N}, m={m})")
+    plt.grid(True, axis="y")
+    plt.tight_layout()
+    plt.savefig("latency_study.png", dpi=300)
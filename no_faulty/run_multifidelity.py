@@ -0,0 +1,122 @@
+"""Multifidelity estimate of the no faulty failure probability for a CPU budget.
+
+A pilot of SquidASM trials, each paired with an outcome model trial on the same
+inputs (xs and one uniform per round, common.multifidelity), measures the
+correlation between the levels and the CPU cost per trial of both. The split of the
+remaining budget between the levels follows from those
+(common.multifidelity.optimal_ratio). The estimate is compared with the exact model
+value and with the standard error SquidASM alone would reach.
+"""
+import argparse
+import math
+import sys
+import time
+import numpy as np
+sys.path.append("..")
+from application import Node1Program, Node2Program, SenderProgram
+from common.config import load_config, select_formalism, set_formalism
+from common.exact import no_faulty_failure
+from common.multifidelity import OutcomeModel, mfmc_estimate, optimal_ratio
+from common.noise_model import round_distribution
+from common.streaming import run_streaming
+from common.trial_log import configure_trial_log, flush_trial_log
+from multiprocessing import Pool, cpu_count
+from squidasm.run.stack.config import StackNetworkConfig
+
+# Fixed config
+cfg = StackNetworkConfig.from_file("../config.yaml")
+mu, lam = 0.272, 0.94
+
+m = 300            # Value of m
+N_PILOT = 100      # SquidASM trials of the pilot
+BATCH = 10_000     # Model trials generated at a time
+NUM_CORES = cpu_count()
+FORMALISM = select_formalism(load_config("../config.yaml"))  # KET if noiseless, else DM; pass "KET" or "DM" to override
+
+
+def simulate_chunk(inputs):
+    """Failures of one SquidASM trial per (xs, uniforms) in inputs, and the CPU seconds."""
+    set_formalism(FORMALISM)
+    trials = []
+
+    def record(sender_result, node1_result, node2_result):
+        y0, y1 = node1_result["y0"], node2_result["y1"]
+        trials.append(float(y0 is None or y1 is None or y0 != y1))
+
+    start = time.process_time()
+    run_streaming(
+        config=cfg,
+        programs={
+            "Node1": Node1Program(m=m, mu=mu, lam=lam),
+            "Node2": Node2Program(m=m, mu=mu, lam=lam),
+            "Sender": SenderProgram(m=m, inputs=inputs),
+        },
+        num_times=len(inputs),
+        reducers=[record],
+    )
+
+    flush_trial_log()
+    return trials, time.process_time() - start
+
+
+def simulate_hi(pool, xs, uniforms):
+    """Failures and CPU seconds of one SquidASM trial per row of inputs, in order."""
+    inputs = [(int(x), u.tolist()) for x, u in zip(xs, uniforms)]
+    tasks = [inputs[i::NUM_CORES] for i in range(NUM_CORES)]
+    chunk_results = pool.map(simulate_chunk, [chunk for chunk in tasks if chunk])
+    y = np.empty(len(inputs))
+    for i, (failures, _) in enumerate(chunk_results):
+        y[i::NUM_CORES] = failures
+    return y, sum(cpu for _, cpu in chunk_results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=3600., help="total CPU seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    config = load_config("../config.yaml")
+    probs_per_round = round_distribution(config)
+    model = OutcomeModel(probs_per_round, m, mu)
+
+    with Pool(processes=NUM_CORES, initializer=configure_trial_log) as pool:
+        # Pilot: correlation of the levels and cost per trial
+        xs, uniforms = model.sample_inputs(N_PILOT, rng)
+        y_hi, cpu_hi = simulate_hi(pool, xs, uniforms)
+        start = time.process_time()
+        g_paired = model.failures(xs, model.sender_codes(uniforms), rng)
+        cost_pair = time.process_time() - start
+        start = time.process_time()
+        pilot_xs, pilot_uniforms = model.sample_inputs(10 * N_PILOT, rng)
+        model.failures(pilot_xs, model.sender_codes(pilot_uniforms), rng)
+        cost_lo = (time.process_time() - start) / (10 * N_PILOT)
+        cost_hi = (cpu_hi + cost_pair) / N_PILOT
+
+        rho = np.corrcoef(y_hi, g_paired)[0, 1] if y_hi.std() > 0 and g_paired.std() > 0 else 0.
+        ratio = optimal_ratio(rho, cost_hi, cost_lo)
+        n_hi = max(N_PILOT, int(args.budget / (cost_hi + min(ratio, 1e9) * cost_lo)))
+        n_lo = max(int(min(ratio * n_hi, (args.budget - n_hi * cost_hi) / cost_lo)), 0)
+        print(f"Pilot: correlation {rho:.3f}, {cost_hi:.3f} CPU s per SquidASM trial, "
+              f"{cost_lo * 1e6:.1f} CPU us per model trial")
+        print(f"Budget {args.budget:.0f} CPU s: {n_hi} SquidASM trials, {n_lo} model trials "
+              f"({n_hi * cost_hi / args.budget:.0%} of the CPU time in SquidASM)")
+
+        if n_hi > N_PILOT:
+            more_xs, more_uniforms = model.sample_inputs(n_hi - N_PILOT, rng)
+            more_y, _ = simulate_hi(pool, more_xs, more_uniforms)
+            y_hi = np.concatenate([y_hi, more_y])
+            g_paired = np.concatenate([g_paired, model.failures(more_xs, model.sender_codes(more_uniforms), rng)])
+
+    # Model trials in batches, only their sum is kept
+    extra_sum = 0.
+    for start in range(0, n_lo, BATCH):
+        batch_xs, batch_uniforms = model.sample_inputs(min(BATCH, n_lo - start), rng)
+        extra_sum += model.failures(batch_xs, model.sender_codes(batch_uniforms), rng).sum()
+
+    estimate, se, alpha = mfmc_estimate(y_hi, g_paired, extra_sum, n_lo)
+    se_hi_only = math.sqrt(y_hi.var(ddof=1) / (args.budget / (cpu_hi / N_PILOT)))
+    print(f"m = {m}: multifidelity {estimate:.4f} +- {se:.4f} (alpha {alpha:.2f}), "
+          f"SquidASM alone {se_hi_only:.4f} for the same budget, "
+          f"model {no_faulty_failure(probs_per_round, m, mu):.4f}")
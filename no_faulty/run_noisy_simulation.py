@@ -1,15 +1,27 @@
+import argparse
+import math
 import os
+import sys
+import time
 import tempfile
 import yaml
 import matplotlib.pyplot as plt
 import numpy as np
 
 from squidasm.run.stack.config import StackNetworkConfig
+sys.path.append("..")
+from common.profiling import ProfiledTask, merge_profiles, prepare_profile_dir
+from common.trial_log import configure_trial_log, flush_trial_log
 from application import Node1Program, Node2Program, SenderProgram
 from multiprocessing import Pool, cpu_count
 from squidasm.run.stack.run import run
 from collections import defaultdict
 
+from common.config import load_config, select_formalism, set_formalism, set_gate_noise
+from common.estimators import control_variate_estimate, merge_stats, trial_stats
+from common.exact import checkset_shortfall_probability, no_faulty_failure
+from common.noise_model import round_distribution
+
 # Parameters
 mu, lam = 0.272, 0.94
 N = 1000                            # Total number of runs per probability value
@@ -17,9 +29,11 @@ m = 300                             # Value of m
 CHUNKS_PER_P = cpu_count()         # Divide per probability for full CPU utilization
 prob_values = list(range(0, 101, 5)) # 0 to 20 inclusive, step 1
 div = 1000000
+FORMALISM = None  # None: KET if noiseless, else DM, for every p; pass "KET" or "DM" to override
 def simulate_chunk(args):
     p, n_runs = args
     p_value = p / div
+    set_formalism(select_formalism(set_gate_noise(load_config("../config.yaml"), p_value), FORMALISM))
 
     # Initialize programs
     node1_program = Node1Program(m=m, mu=mu, lam=lam)
@@ -62,20 +76,34 @@ def simulate_chunk(args):
         )
 
         failures = 0
+        # Control variate: checkset smaller than T, with a known expectation
+        T = math.ceil(mu * m)
+        ys, xs = [], []
         for i in range(n_runs):
             sender_output = results[0][i]["xs"]
             node1_output = results[1][i]["y0"]
             node2_output = results[2][i]["y1"]
-            if node1_output != node2_output or (node1_output is None or node2_output is None):
+            failed = node1_output != node2_output or (node1_output is None or node2_output is None)
+            if failed:
                 failures += 1
+            ys.append(int(failed))
+            xs.append(int(results[0][i]["checkset_size"] < T))
 
     finally:
         if os.path.exists(temp_path):
             os.remove(temp_path)
 
-    return failures, n_runs, p  # Return p for grouping
+    flush_trial_log()
+    return failures, n_runs, p, trial_stats(ys, xs)  # Return p for grouping
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--debug-log", action="store_true",
+                        help="buffer per trial events and write them per chunk to trial_log_<pid>.jsonl")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile every worker with cProfile and merge the stats into profile/")
+    args = parser.parse_args()
+
     base_chunk = N // CHUNKS_PER_P
     remainder = N % CHUNKS_PER_P
 
@@ -87,20 +115,30 @@ if __name__ == "__main__":
     for p in prob_values:
         tasks.extend([(p, chunk_sizes[i]) for i in range(CHUNKS_PER_P)])
 
-    with Pool(processes=cpu_count()) as pool:
-        chunk_results = pool.map(simulate_chunk, tasks)
+    if args.profile:
+        prepare_profile_dir()
+    sweep_start = time.perf_counter()
+    with Pool(processes=cpu_count(), initializer=configure_trial_log, initargs=(args.debug_log,)) as pool:
+        chunk_results = pool.map(ProfiledTask(simulate_chunk) if args.profile else simulate_chunk, tasks)
+    print(f"Sweep wall time: {time.perf_counter() - sweep_start:.1f} s (debug log {'enabled' if args.debug_log else 'disabled'})")
+    if args.profile:
+        merge_profiles("no_faulty_noise")
 
     # Aggregate results
     failure_counts = defaultdict(int)
     total_counts = defaultdict(int)
+    cv_stats = defaultdict(dict)
 
-    for failures, n_runs, p in chunk_results:
+    for failures, n_runs, p, stats in chunk_results:
         failure_counts[p] += failures
         total_counts[p] += n_runs
+        cv_stats[p] = merge_stats(cv_stats[p], stats)
 
     failure_probs = []
     error_bars = []
     p_values = []
+    cv_probs = []
+    cv_error_bars = []
 
     for p in prob_values:
         failures = failure_counts[p]
@@ -111,9 +149,25 @@ if __name__ == "__main__":
         error_bars.append(sem)
         p_values.append(p / div)
 
+        probs_per_round = round_distribution(set_gate_noise(load_config("../config.yaml"), p / div))
+        cv_prob, cv_sem, gain = control_variate_estimate(
+            cv_stats[p], checkset_shortfall_probability(probs_per_round, m, mu)
+        )
+        cv_probs.append(cv_prob)
+        cv_error_bars.append(cv_sem)
+        print(f"p = {p / div}: Monte Carlo {prob:.4f} +- {sem:.4f}, control variate {cv_prob:.4f} +- {cv_sem:.4f}, "
+              f"effective sample size gain {gain:.1f}")
+
     # Plotting with error bars
     plt.figure(figsize=(8, 5))
     plt.errorbar(p_values, failure_probs, yerr=error_bars, fmt='o-', capsize=5, label="Failure Probability")
+    # Exact curve from the per round outcome distribution
+    exact_probs = [
+        no_faulty_failure(round_distribution(set_gate_noise(load_config("../config.yaml"), p_value)), m, mu)
+        for p_value in p_values
+    ]
+    plt.errorbar(p_values, cv_probs, yerr=cv_error_bars, fmt='b+', capsize=3, label="Control variate")
+    plt.plot(p_values, exact_probs, 'g--', label="Exact")
     plt.axhline(y=0.05, color='red', linestyle='--', label="5% Threshold")
     plt.xlabel("Gate Depolarizing Probability")
     plt.ylabel("Failure Probability")
@@ -0,0 +1,102 @@
+"""Global sensitivity of the no faulty failure probability to the noise parameters.
+
+The parameters of common.sensitivity.PARAMETERS are sampled with a Sobol (Saltelli)
+or Latin hypercube design, the failure probability of every point is estimated
+with N trials in parallel and the sensitivity indices are printed and plotted. The
+Monte Carlo error of the points adds to the output variance, so indices below
+about Var(MC) / Var(Y) are not resolved.
+"""
+import argparse
+import csv
+import math
+import sys
+import time
+import matplotlib.pyplot as plt
+import numpy as np
+sys.path.append("..")
+from application import Node1Program, Node2Program, SenderProgram
+from common.config import load_config, select_formalism, set_formalism, to_network_config
+from common.criteria import no_faulty_failure as is_failure
+from common.sensitivity import PARAMETERS, apply_parameters, design, regression_indices, sobol_indices
+from common.streaming import FailureCounter, run_streaming
+from common.trial_log import configure_trial_log, flush_trial_log
+from multiprocessing import Pool, cpu_count
+
+# Parameters
+mu, lam = 0.272, 0.94
+N = 100          # Runs per design point
+m = 100          # Value of m
+NUM_CORES = cpu_count()
+FORMALISM = None  # None: KET if noiseless, else DM, per configuration; pass "KET" or "DM" to override
+
+
+def simulate_point(values):
+    config = apply_parameters(load_config("../config.yaml"), PARAMETERS, values)
+    cfg = to_network_config(config)
+    set_formalism(select_formalism(config, FORMALISM))
+
+    counter = FailureCounter(is_failure)
+    run_streaming(
+        config=cfg,
+        programs={
+            "Node1": Node1Program(m=m, mu=mu, lam=lam),
+            "Node2": Node2Program(m=m, mu=mu, lam=lam),
+            "Sender": SenderProgram(m=m),
+        },
+        num_times=N,
+        reducers=[counter],
+    )
+
+    flush_trial_log()
+    return counter.failures / counter.runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--design", choices=["sobol", "lhs"], default="sobol")
+    parser.add_argument("--points", type=int, default=64,
+                        help="base points, the Sobol design evaluates points * (d + 2) configurations")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    x = design(PARAMETERS, args.points, args.design, args.seed)
+    print(f"{args.design} design: {len(x)} configurations of {len(PARAMETERS)} parameters, {N} runs each")
+
+    start = time.perf_counter()
+    with Pool(processes=NUM_CORES, initializer=configure_trial_log) as pool:
+        y = np.array(pool.map(simulate_point, list(x)))
+    print(f"Study wall time: {time.perf_counter() - start:.1f} s")
+
+    with open(f"sensitivity_{args.design}.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([p.name for p in PARAMETERS] + ["failure_probability"])
+        writer.writerows([list(row) + [value] for row, value in zip(x, y)])
+
+    # Share of the output variance that is Monte Carlo noise
+    mc_var = np.mean(y * (1 - y)) / N
+    print(f"Monte Carlo share of the output variance: {mc_var / y.var() if y.var() > 0 else math.nan:.2f}")
+
+    names = [p.name for p in PARAMETERS]
+    fig, ax = plt.subplots(figsize=(8, 4))
+    positions = np.arange(len(names))
+    if args.design == "sobol":
+        first, total, first_se, total_se = sobol_indices(y, len(PARAMETERS))
+        for name, s, s_se, st, st_se in sorted(zip(names, first, first_se, total, total_se), key=lambda r: -r[3]):
+            print(f"{name:32s} first order {s:6.3f} +- {s_se:.3f}, total {st:6.3f} +- {st_se:.3f}")
+        ax.bar(positions - 0.2, first, 0.4, yerr=first_se, capsize=3, label="first order")
+        ax.bar(positions + 0.2, total, 0.4, yerr=total_se, capsize=3, label="total")
+        ax.set_ylabel("Sobol index")
+    else:
+        src, r2 = regression_indices(x, y, PARAMETERS)
+        print(f"Linear model R^2 = {r2:.2f}")
+        for name, coefficient in sorted(zip(names, src), key=lambda r: -abs(r[1])):
+            print(f"{name:32s} standardized regression coefficient {coefficient:6.3f}")
+        ax.bar(positions, src ** 2, 0.6, label=f"SRC$^2$ ($R^2$ = {r2:.2f})")
+        ax.set_ylabel("squared standardized regression coefficient")
+    ax.set_xticks(positions)
+    ax.set_xticklabels(names, rotation=30, ha="right")
+    ax.set_title(f"Sensitivity of the failure probability (No Faulty, m={m}, N={N})")
+    ax.grid(True, axis="y")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(f"sensitivity_{args.design}.png", dpi=300)
@@ -0,0 +1,86 @@
+"""Single trials with a very large m, with the rounds sharded over worker processes.
+
+Rounds are independent, so the m rounds of one logical trial are split into blocks
+that are simulated in parallel, each worker with its own seed. Every block returns
+the sender's class labels and the receivers' packed measurements. The blocks are
+concatenated and CHECK / CROSS-CHECK run once on the whole trial. The simulated
+time of a sharded trial is not meaningful, only its outcome is.
+"""
+import argparse
+import random
+import sys
+import time
+import netsquid as ns
+import numpy as np
+sys.path.append("..")
+from application import RoundBlockReceiverProgram, RoundBlockSenderProgram, check, cross_check
+from common.config import load_config, select_formalism, set_formalism
+from multiprocessing import Pool, cpu_count
+from squidasm.run.stack.config import StackNetworkConfig
+from squidasm.run.stack.run import run
+
+# Fixed config
+cfg = StackNetworkConfig.from_file("../config.yaml")
+mu, lam = 0.272, 0.94
+
+M = 4000  # Rounds of the logical trial
+NUM_CORES = cpu_count()
+FORMALISM = select_formalism(load_config("../config.yaml"))  # KET if noiseless, else DM; pass "KET" or "DM" to override
+
+
+def simulate_block(args):
+    num_rounds, seed = args
+    # Independent streams per block for the programs (random) and NetSquid
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    ns.set_random_state(seed=seed % 2 ** 32)
+    set_formalism(FORMALISM)
+
+    results = run(
+        config=cfg,
+        programs={
+            "Sender": RoundBlockSenderProgram(m=num_rounds),
+            "Node1": RoundBlockReceiverProgram(m=num_rounds, name="node1_program"),
+            "Node2": RoundBlockReceiverProgram(m=num_rounds, name="node2_program"),
+        },
+        num_times=1,
+    )
+    sender, node1, node2 = results[0][0], results[1][0], results[2][0]
+    return num_rounds, sender["labels"], node1["measurements"], node2["measurements"]
+
+
+def sharded_trial(m, num_blocks, pool, seed):
+    """Outcome (y0, y1) of one no faulty trial with m rounds split into num_blocks blocks."""
+    sizes = [m // num_blocks + (1 if i < m % num_blocks else 0) for i in range(num_blocks)]
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(num_blocks)]
+    blocks = pool.map(simulate_block, [(size, s) for size, s in zip(sizes, seeds) if size > 0])
+
+    labels = np.concatenate([b[1] for b in blocks])
+    measurements1 = np.concatenate([np.unpackbits(b[2], count=b[0]) for b in blocks])
+    measurements2 = np.concatenate([np.unpackbits(b[3], count=b[0]) for b in blocks])
+
+    # The honest sender's checkset are the rounds with r0 = r1 = xs
+    xs = random.Random(seed).choice([0, 1])
+    checkset = set(np.flatnonzero(labels == 2 * xs).tolist())
+    y0 = check(xs, measurements1, checkset, m, mu)
+    y_inter = check(xs, measurements2, checkset, m, mu)
+    y1 = cross_check(y_inter, measurements2, y0, checkset, m, mu, lam)
+    return xs, y0, y1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--m", type=int, default=M, help="rounds of the trial")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Latency of one trial as a function of the number of workers
+    worker_counts = sorted({1, 2, 4, NUM_CORES} & set(range(1, NUM_CORES + 1)))
+    latencies = {}
+    for num_workers in worker_counts:
+        with Pool(processes=num_workers) as pool:
+            start = time.perf_counter()
+            xs, y0, y1 = sharded_trial(args.m, num_workers, pool, args.seed)
+            latencies[num_workers] = time.perf_counter() - start
+        print(f"m = {args.m}, {num_workers:3d} workers: xs = {xs}, y0 = {y0}, y1 = {y1}, "
+              f"{latencies[num_workers]:.1f} s, speedup {latencies[1] / latencies[num_workers]:.2f}x")
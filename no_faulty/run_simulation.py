@@ -1,10 +1,25 @@
+import argparse
+import os
 import matplotlib.pyplot as plt
 import math
 from scipy.stats import binom
+import sys
+import time
+sys.path.append("..")
+from common.memory import MemoryProfiledTask, calibrate, plan_workers
+from common.profiling import ProfiledTask, merge_profiles, prepare_profile_dir
+from common.telemetry import Telemetry, map_with_telemetry
+from common.trial_log import configure_trial_log, flush_trial_log
 from application import Node1Program, Node2Program, SenderProgram
 from multiprocessing import Pool, cpu_count
 from squidasm.run.stack.config import StackNetworkConfig
-from squidasm.run.stack.run import run
+
+from common.config import load_config, select_formalism, set_formalism
+from common.criteria import no_faulty_failure as is_failure
+from common.estimators import add_trial, control_variate_estimate, merge_stats
+from common.exact import checkset_shortfall_probability
+from common.noise_model import round_distribution
+from common.streaming import BATCH_SIZE, TraceAppender, run_streaming
 
 # Fixed config
 cfg = StackNetworkConfig.from_file("../config.yaml")
@@ -13,60 +28,107 @@ mu, lam = 0.272, 0.94
 N = 1000  # Total number of simulations per m
 m_values = list(range(20, 400, 20))  # Range of m values
 NUM_CORES = cpu_count()
+TRACE_PATH = None  # Set to a file name to append every trial as a JSON line
+FORMALISM = select_formalism(load_config("../config.yaml"))  # KET if noiseless, else DM; pass "KET" or "DM" to override
 
 
 def simulate_chunk(args):
 
     m, chunk_size = args
+    set_formalism(FORMALISM)
     node1_program = Node1Program(m=m, mu=mu, lam=lam)
     node2_program = Node2Program(m=m, mu=mu, lam=lam)
     sender_program = SenderProgram(m=m)
 
-    results = run(
+    # Control variate: checkset smaller than T, with a known expectation. The failures
+    # are the sum of y in stats, so is_failure runs once per trial
+    T = math.ceil(mu * m)
+    stats = {}
+    reducers = [lambda s, n1, n2: add_trial(stats, int(is_failure(s, n1, n2)), int(s["checkset_size"] < T))]
+    if TRACE_PATH is not None:
+        reducers.append(TraceAppender(TRACE_PATH, m=m))
+
+    run_streaming(
         config=cfg,
         programs={"Node1": node1_program, "Node2": node2_program, "Sender": sender_program},
-        num_times=chunk_size
+        num_times=chunk_size,
+        reducers=reducers,
     )
 
-    failures = 0
-    for i in range(chunk_size):
-        sender_output = results[0][i]["xs"]
-        node1_output = results[1][i]["y0"]
-        node2_output = results[2][i]["y1"]
-        if node1_output is None or node2_output is None or node1_output != node2_output:
-            failures += 1
-
-    return m, failures, chunk_size
+    flush_trial_log()
+    return m, stats.get("sum_y", 0), chunk_size, stats
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--debug-log", action="store_true",
+                        help="buffer per trial events and write them per chunk to trial_log_<pid>.jsonl")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile every worker with cProfile and merge the stats into profile/")
+    parser.add_argument("--memory-profile", action="store_true",
+                        help="record peak RSS and top allocations of every task in memory/")
+    parser.add_argument("--telemetry", action="store_true",
+                        help="rewrite telemetry.json and telemetry.prom with the progress every few seconds")
+    parser.add_argument("--progress", action="store_true", help="with --telemetry, show a progress line")
+    parser.add_argument("--memory-budget", type=float, default=None,
+                        help="total memory budget in MB, sets the number of workers and the chunk size")
+    args = parser.parse_args()
+
+    num_workers, num_chunks = NUM_CORES, NUM_CORES
+    if args.memory_budget is not None:
+        # Per trial memory as a function of m, measured on small chunks, held for one batch at a time
+        model = calibrate(simulate_chunk, min(m_values), max(m_values), batch_size=BATCH_SIZE)
+        num_workers, chunk_size = plan_workers(args.memory_budget, model, max(m_values), N, NUM_CORES)
+        num_chunks = math.ceil(N / chunk_size)
+        print(f"Memory budget {args.memory_budget:.0f} MB: {num_workers} workers, chunks of {chunk_size} trials "
+              f"({model.worker(max(m_values), chunk_size) / 2 ** 20:.0f} MB per worker at m={max(m_values)})")
+
     # Prepare tasks: split N simulations into chunks per m
     tasks = []
     for m in m_values:
-        base_chunk = N // NUM_CORES
-        remainder = N % NUM_CORES
-        for i in range(NUM_CORES):
+        base_chunk = N // num_chunks
+        remainder = N % num_chunks
+        for i in range(num_chunks):
             chunk = base_chunk + (1 if i < remainder else 0)
             if chunk > 0:
                 tasks.append((m, chunk))
 
     # Run all chunks in parallel
-    with Pool(processes=NUM_CORES) as pool:
-        chunk_results = pool.map(simulate_chunk, tasks)
+    if args.profile:
+        prepare_profile_dir()
+    task = ProfiledTask(simulate_chunk) if args.profile else simulate_chunk
+    if args.memory_profile:
+        os.makedirs("memory", exist_ok=True)
+        task = MemoryProfiledTask(task)
+    sweep_start = time.perf_counter()
+    with Pool(processes=num_workers, initializer=configure_trial_log, initargs=(args.debug_log,)) as pool:
+        if args.telemetry:
+            telemetry = Telemetry({("no_faulty", m, 0.): N for m in m_values}, terminal=args.progress)
+            chunk_results = map_with_telemetry(pool, task, tasks, telemetry,
+                                               lambda r: (("no_faulty", r[0], 0.), r[1], r[2]))
+        else:
+            chunk_results = pool.map(task, tasks)
+    print(f"Sweep wall time: {time.perf_counter() - sweep_start:.1f} s (debug log {'enabled' if args.debug_log else 'disabled'})")
+    if args.profile:
+        merge_profiles("no_faulty")
 
     # Aggregate results by m
     results_by_m = {}
-    for m, failures, runs in chunk_results:
+    for m, failures, runs, stats in chunk_results:
         if m not in results_by_m:
-            results_by_m[m] = {"failures": 0, "runs": 0}
+            results_by_m[m] = {"failures": 0, "runs": 0, "stats": {}}
         results_by_m[m]["failures"] += failures
         results_by_m[m]["runs"] += runs
+        results_by_m[m]["stats"] = merge_stats(results_by_m[m]["stats"], stats)
 
     # Prepare plot data
     m_values_sorted = sorted(results_by_m.keys())
     failure_probs = []
     sems = []
     exact_probs = []
+    cv_probs = []
+    cv_sems = []
+    probs_per_round = round_distribution(load_config("../config.yaml"))
 
     for m in m_values_sorted:
         failures = results_by_m[m]["failures"]
@@ -79,6 +141,14 @@ if __name__ == "__main__":
         T = math.ceil(mu * m)
         exact_probs.append(binom.cdf(T - 1, m, 1 / 3))
 
+        cv_prob, cv_sem, gain = control_variate_estimate(
+            results_by_m[m]["stats"], checkset_shortfall_probability(probs_per_round, m, mu)
+        )
+        cv_probs.append(cv_prob)
+        cv_sems.append(cv_sem)
+        print(f"m = {m}: Monte Carlo {prob:.4f} +- {sem:.4f}, control variate {cv_prob:.4f} +- {cv_sem:.4f}, "
+              f"effective sample size gain {gain:.1f}")
+
     # Plotting
     plt.figure(figsize=(6, 4))
     plt.plot(
@@ -94,6 +164,10 @@ if __name__ == "__main__":
         m_values_sorted, failure_probs, yerr=sems,
         fmt='rx', label="Monte Carlo", capsize=5
     )
+    plt.errorbar(
+        m_values_sorted, cv_probs, yerr=cv_sems,
+        fmt='b+', label="Control variate", capsize=3
+    )
     plt.xlabel("number of four-qubit singlet states, $m$")
     plt.ylabel("failure probability")
     plt.title(f"Failure Probabilities (No Faulty, N={N})")
@@ -1,6 +1,8 @@
 import random
 import math
 
+import netsquid as ns
+
 from netqasm.sdk import Qubit
 from netqasm.sdk.classical_communication.message import StructuredMessage
 
@@ -10,12 +12,80 @@ from squidasm.util.routines import (
     distributed_CNOT_target, teleport_send, teleport_recv,
 )
 
+from common.config import check_state_injection
+from common.noise_model import prepare_state_vector
+from common.routines import assign_state, teleport_send_concurrent
+from common.trial_log import log_event
+
+# State of the sender qubits after a noiseless prepare_state
+PREPARED_STATE = prepare_state_vector()
+
+
+def check(xj, measurements, checkset, m: int, mu: float):
+    """CHECK phase: accept xj iff the checkset is large enough and consistent."""
+    T = math.ceil(mu * m)
+    if len(checkset) >= T and all(measurements[i] != xj for i in checkset):
+        return xj
+    return None
+
+
+def cross_check(y_inter, measurements, r0_output, r0_checkset, m: int, mu: float, lam: float):
+    """CROSS-CHECK phase of Node2 given Node1's output and checkset."""
+    T = math.ceil(mu * m)
+    if r0_output != y_inter and r0_output is not None and y_inter is not None:
+        if len(r0_checkset) >= T:
+            n_opposite = sum(1 for i in r0_checkset if measurements[i] != r0_output)
+            threshold = lam * T + len(r0_checkset) - T
+            if n_opposite >= threshold:
+                return r0_output
+    return y_inter
+
+
+def forge_checkset(xj, measurements, checkset, m: int, mu: float):
+    """Adversary strategy of Node1: claim 1 - xj with a forged checkset.
+
+    The forged checkset holds every round outside the real checkset that is
+    consistent with 1 - xj, padded with rounds measured as xj until it reaches T.
+    Returns (y0, fake_checkset), y0 is None when there are too few rounds.
+    """
+    m_consistent, m_padding = [], []
+    for i in range(m):
+        if measurements[i] == 1 - xj and i in checkset:
+            continue
+        elif measurements[i] == 1 - xj:
+            m_consistent.append(i)
+        else:
+            m_padding.append(i)
+
+    fake_checkset = list(m_consistent)
+    T = math.ceil(mu * m)
+
+    nmin = max(0, T - len(m_consistent))
+    if nmin <= len(m_padding):
+        fake_checkset.extend(m_padding[:nmin])
+        return 1 - xj, fake_checkset
+    return None, fake_checkset
+
+
 class SenderProgram(Program):
     PEER_NAME1 = "Node1"
     PEER_NAME2 = "Node2"
 
-    def __init__(self, m):
+    def __init__(self, m, concurrent_epr: bool = False, record_rounds: bool = False,
+                 inject_state: bool = False, config: dict = None):
         self.m = m
+        # Return the measured (r0, r1) of every round, for prefix evaluation
+        self.record_rounds = record_rounds
+        # Request the EPR pairs to both receivers in one subroutine
+        self.concurrent_epr = concurrent_epr
+        # Skip the gates of prepare_state and assign the prepared state in NetSquid,
+        # only equivalent without gate noise, which is checked on the config the
+        # program runs on
+        if inject_state:
+            if config is None:
+                raise ValueError("inject_state requires the config, to check that the sender has no gate noise")
+            check_state_injection(config)
+        self.inject_state = inject_state
 
     def prepare_state(self, q0: Qubit, q1: Qubit, q2: Qubit, q3: Qubit):
         q0.H()
@@ -39,6 +109,15 @@ class SenderProgram(Program):
         q0.cnot(q2)
 
 
+    def prepare_round_state(self, context: ProgramContext, q0: Qubit, q1: Qubit, q2: Qubit, q3: Qubit):
+        """Run prepare_state, or with inject_state assign its output state directly."""
+        if self.inject_state:
+            # The qubits have to be allocated before their state can be assigned
+            yield from context.connection.flush()
+            assign_state(context, "Sender", [q0, q1, q2, q3], PREPARED_STATE)
+        else:
+            self.prepare_state(q0, q1, q2, q3)
+
     @property
     def meta(self) -> ProgramMeta:
         return ProgramMeta(
@@ -50,6 +129,7 @@ class SenderProgram(Program):
 
     def run(self, context: ProgramContext):
 
+        start_time = ns.sim_time()
         csocket1 = context.csockets[self.PEER_NAME1]
         csocket2 = context.csockets[self.PEER_NAME2]
         connection = context.connection
@@ -57,6 +137,7 @@ class SenderProgram(Program):
         #Choose random bit of information
         xs = random.choice([0, 1])
         checkset = set()
+        rounds = []
 
         #Send bit of information
         csocket1.send(xs)
@@ -69,21 +150,26 @@ class SenderProgram(Program):
             q2 = Qubit(connection)
             q3 = Qubit(connection)
 
-            self.prepare_state(q0,q1,q2,q3)
+            yield from self.prepare_round_state(context, q0, q1, q2, q3)
 
             #Measure Qubits
             r0 = q0.measure()
             r1 = q1.measure()
 
             #Distribute the qubits, q2 and q3 are inactive now
-            yield from teleport_send(q=q2,context=context, peer_name=self.PEER_NAME1)
-            yield from teleport_send(q=q3, context=context, peer_name=self.PEER_NAME2)
+            if self.concurrent_epr:
+                yield from teleport_send_concurrent({self.PEER_NAME1: q2, self.PEER_NAME2: q3}, context=context)
+            else:
+                yield from teleport_send(q=q2,context=context, peer_name=self.PEER_NAME1)
+                yield from teleport_send(q=q3, context=context, peer_name=self.PEER_NAME2)
             yield from connection.flush()
 
 
 
             if r0==xs and r1==xs:
                 checkset.add(idx)
+            if self.record_rounds:
+                rounds.append((int(r0), int(r1)))
 
 
         #Send checkset
@@ -92,18 +178,22 @@ class SenderProgram(Program):
         yield from connection.flush()
 
         ys = xs
-        print(f"Sender result {ys}")
-        return {"xs": xs}
+        log_event("Sender", "result", ys=ys)
+        result = {"xs": xs, "sim_duration": ns.sim_time() - start_time}
+        if self.record_rounds:
+            result["rounds"] = rounds
+        return result
 
 
 class Node1Program(Program):
     SENDER = "Sender"
     PEER_NAME = "Node2"
 
-    def __init__(self, m: int, mu: float, lam: float):
+    def __init__(self, m: int, mu: float, lam: float, record_rounds: bool = False):
         self.m = m
         self.mu = mu
         self.lam = lam
+        self.record_rounds = record_rounds
 
     @property
     def meta(self) -> ProgramMeta:
@@ -116,6 +206,7 @@ class Node1Program(Program):
 
     def run(self, context: ProgramContext):
 
+        start_time = ns.sim_time()
         csocket_s = context.csockets[self.SENDER]
         csocket_n = context.csockets[self.PEER_NAME]
         connection = context.connection
@@ -135,65 +226,29 @@ class Node1Program(Program):
 
         #Implement the adversary strategy
         checkset = yield from csocket_s.recv()
-        if xj == 0:
-            m0011, mXX10, mXX0X = [], [], []
-            for i in range(self.m):
-                if measurements[i] == 1 and i in checkset:
-                    m0011.append(i)
-                elif measurements[i] == 1 and i not in checkset:
-                    mXX10.append(i)
-                else:
-                    mXX0X.append(i)
-
-            fake_checkset = []
-            fake_checkset.extend(mXX10)
-            T = math.ceil(self.mu * self.m)
-
-            nmin = max(0, T - len(mXX10))
-            if nmin <= len(mXX0X):
-                fake_checkset.extend(mXX0X[:nmin])
-                y0 = 1
-            else:
-                y0 = None
-        else: #Identical but for different received bit
-            m1100, mXX01, mXX1X = [], [], []
-            for i in range(self.m):
-                if measurements[i] == 0 and i in checkset:
-                    m1100.append(i)
-                elif measurements[i] == 0 and i not in checkset:
-                    mXX01.append(i)
-                else:
-                    mXX1X.append(i)
-
-            fake_checkset = []
-            fake_checkset.extend(mXX01)
-            T = math.ceil(self.mu * self.m)
-
-            nmin = max(0, T - len(mXX01))
-            if nmin <= len(mXX1X):
-                fake_checkset.extend(mXX1X[:nmin])
-                y0 = 0
-            else:
-                y0 = None
-
+        y0, fake_checkset = forge_checkset(xj, measurements, checkset, self.m, self.mu)
 
         #CROSS-CALLING PHASE
         csocket_n.send(y0)
         csocket_n.send(fake_checkset)
         connection.flush()
 
-        print(f"Node 1 result: {y0}")
+        log_event("Node1", "result", y0=y0)
 
-        return {"y0": y0}
+        result = {"y0": y0, "sim_duration": ns.sim_time() - start_time}
+        if self.record_rounds:
+            result["measurements"] = measurements
+        return result
 
 class Node2Program(Program):
     SENDER = "Sender"
     PEER_NAME = "Node1"
 
-    def __init__(self, m: int, mu: float, lam: float):
+    def __init__(self, m: int, mu: float, lam: float, record_rounds: bool = False):
         self.m = m
         self.mu = mu
         self.lam = lam
+        self.record_rounds = record_rounds
 
     @property
     def meta(self) -> ProgramMeta:
@@ -206,6 +261,7 @@ class Node2Program(Program):
 
     def run(self, context: ProgramContext):
 
+        start_time = ns.sim_time()
         csocket_s = context.csockets[self.SENDER]
         csocket_n = context.csockets[self.PEER_NAME]
         connection = context.connection
@@ -225,30 +281,17 @@ class Node2Program(Program):
         checkset = yield from csocket_s.recv()
 
         #CHECK PHASE
-        T = math.ceil(self.mu * self.m)
-        if len(checkset) >= T and all(measurements[i] != xj for i in checkset):
-            y_inter = xj
-        else:
-            y_inter = None
+        y_inter = check(xj, measurements, checkset, self.m, self.mu)
 
         #CROSS-CALLING PHASE
         r0_output = yield from csocket_n.recv()
         r0_checkset = yield from csocket_n.recv()
 
         #CROSS-CHECK PHASE
-        if r0_output != y_inter and r0_output is not None and y_inter is not None:
-            if len(r0_checkset) >= T:
-                n_opposite = sum(1 for i in r0_checkset if measurements[i] != r0_output)
-                threshold = self.lam * T + len(r0_checkset) - T
-                if n_opposite >= threshold:
-                    y1 = r0_output
-                else:
-                    y1 = y_inter
-            else:
-                y1 = y_inter
-        else:
-            y1 = y_inter
-
+        y1 = cross_check(y_inter, measurements, r0_output, r0_checkset, self.m, self.mu, self.lam)
 
-        print(f"Node 2 result: {y1}")
-        return {"y1": y1}
\ No newline at end of file
+        log_event("Node2", "result", y1=y1)
+        result = {"y1": y1, "sim_duration": ns.sim_time() - start_time}
+        if self.record_rounds:
+            result["measurements"] = measurements
+        return result
@@ -0,0 +1,138 @@
+"""Failure probability for every m from one simulation at the largest m.
+
+Each trial runs max(m_values) rounds and records the sender's (r0, r1) and the
+receivers' measurements. The decisions for a smaller m are the ones the nodes
+would have taken after the first m rounds: the checkset only holds rounds below
+m, T = ceil(mu * m) and Node1 forges its checkset from the same prefix. This
+costs N * max(m_values) rounds instead of N * sum(m_values), about 10x less for
+the default grid.
+
+All m values are evaluated on the same trials, so the points of the curve are
+positively correlated: each one is an unbiased estimate with the usual standard
+error, but neighbouring points move together and the curve looks smoother than
+independent estimates would. The correlation between neighbouring m values is
+printed at the end.
+"""
+import argparse
+import math
+import sys
+import time
+import matplotlib.pyplot as plt
+sys.path.append("..")
+from common.trial_log import configure_trial_log, flush_trial_log
+from application import Node1Program, Node2Program, SenderProgram, check, cross_check, forge_checkset
+from multiprocessing import Pool, cpu_count
+from squidasm.run.stack.config import StackNetworkConfig
+
+from common.config import load_config, select_formalism, set_formalism
+from common.estimators import indicator_correlation
+from common.exact import node1_faulty_failure
+from common.noise_model import round_distribution
+from common.streaming import PrefixCounter, run_streaming
+
+# Fixed config
+cfg = StackNetworkConfig.from_file("../config.yaml")
+mu, lam = 0.272, 0.94
+
+N = 1000  # Total number of simulations, shared by all m
+m_values = list(range(20, 400, 20))  # Range of m values
+NUM_CORES = cpu_count()
+FORMALISM = select_formalism(load_config("../config.yaml"))  # KET if noiseless, else DM; pass "KET" or "DM" to override
+
+
+def is_failure_at(sender_result, node1_result, node2_result, m):
+    """Failure of the trial had the protocol stopped after m rounds."""
+    xs = sender_result["xs"]
+    checkset = {i for i, (r0, r1) in enumerate(sender_result["rounds"][:m]) if r0 == xs and r1 == xs}
+    measurements1 = node1_result["measurements"][:m]
+    measurements2 = node2_result["measurements"][:m]
+
+    node1_output, fake_checkset = forge_checkset(xs, measurements1, checkset, m, mu)
+    y_inter = check(xs, measurements2, checkset, m, mu)
+    node2_output = cross_check(y_inter, measurements2, node1_output, fake_checkset, m, mu, lam)
+    return xs != node2_output or node1_output is None
+
+
+def simulate_chunk(chunk_size):
+
+    set_formalism(FORMALISM)
+    m_max = max(m_values)
+    node1_program = Node1Program(m=m_max, mu=mu, lam=lam, record_rounds=True)
+    node2_program = Node2Program(m=m_max, mu=mu, lam=lam, record_rounds=True)
+    sender_program = SenderProgram(m=m_max, record_rounds=True)
+
+    counter = PrefixCounter(is_failure_at, m_values)
+    run_streaming(
+        config=cfg,
+        programs={"Node1": node1_program, "Node2": node2_program, "Sender": sender_program},
+        num_times=chunk_size,
+        reducers=[counter],
+    )
+
+    flush_trial_log()
+    return counter.failures, counter.joint_failures, counter.runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--debug-log", action="store_true",
+                        help="buffer per trial events and write them per chunk to trial_log_<pid>.jsonl")
+    args = parser.parse_args()
+
+    # Split the N trials into one chunk per core
+    tasks = [N // NUM_CORES + (1 if i < N % NUM_CORES else 0) for i in range(NUM_CORES)]
+    tasks = [chunk for chunk in tasks if chunk > 0]
+
+    sweep_start = time.perf_counter()
+    with Pool(processes=NUM_CORES, initializer=configure_trial_log, initargs=(args.debug_log,)) as pool:
+        chunk_results = pool.map(simulate_chunk, tasks)
+    print(f"Sweep wall time: {time.perf_counter() - sweep_start:.1f} s for {N * max(m_values)} rounds "
+          f"({N * sum(m_values)} rounds with one simulation per m)")
+
+    # Aggregate the chunks
+    failures = {m: 0 for m in m_values}
+    joint_failures = {m: 0 for m in m_values[1:]}
+    runs = 0
+    for chunk_failures, chunk_joint, chunk_runs in chunk_results:
+        for m in m_values:
+            failures[m] += chunk_failures[m]
+        for m in m_values[1:]:
+            joint_failures[m] += chunk_joint[m]
+        runs += chunk_runs
+
+    failure_probs = []
+    sems = []
+    exact_probs = []
+    probs_per_round = round_distribution(load_config("../config.yaml"))
+    for m in m_values:
+        prob = failures[m] / runs
+        failure_probs.append(prob)
+        sems.append(math.sqrt(prob * (1 - prob) / runs))
+        exact_probs.append(node1_faulty_failure(probs_per_round, m, mu, lam))
+
+    for previous, m in zip(m_values, m_values[1:]):
+        rho = indicator_correlation(failures[previous], failures[m], joint_failures[m], runs)
+        print(f"m = {previous} -> {m}: correlation of the failure indicators {rho:.2f}")
+
+    # Plotting
+    plt.figure(figsize=(6, 4))
+    plt.plot(
+        m_values, exact_probs,
+        "o",
+        markerfacecolor="white",
+        markeredgecolor="green",
+        markeredgewidth=1.5,
+        linestyle="None",
+        label="Exact"
+    )
+    plt.errorbar(
+        m_values, failure_probs, yerr=sems,
+        fmt='rx', label="Monte Carlo (prefixes, correlated)", capsize=5
+    )
+    plt.xlabel("number of four-qubit singlet states, $m$")
+    plt.ylabel("failure probability")
+    plt.title(f"Failure Probabilities (R0 Faulty, N={N}, one run at m={max(m_values)})")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig("node1_faulty_prefix_1000.png", dpi=300)
@@ -1,9 +1,20 @@
+import argparse
+import os
 import math
 import matplotlib.pyplot as plt
+import sys
+import time
+sys.path.append("..")
+from common.memory import MemoryProfiledTask, calibrate, plan_workers
+from common.profiling import ProfiledTask, merge_profiles, prepare_profile_dir
+from common.telemetry import Telemetry, map_with_telemetry
+from common.trial_log import configure_trial_log, flush_trial_log
 from application import Node1Program, Node2Program, SenderProgram
 from multiprocessing import Pool, cpu_count
 from squidasm.run.stack.config import StackNetworkConfig
-from squidasm.run.stack.run import run
+from common.config import load_config, select_formalism, set_formalism
+from common.criteria import node1_faulty_failure as is_failure
+from common.streaming import BATCH_SIZE, FailureCounter, TraceAppender, run_streaming
 from math import comb
 
 # Fixed config
@@ -12,6 +23,8 @@ mu, lam = 0.272, 0.94
 
 N = 1000  # Total simulations per m value
 NUM_CORES = cpu_count()
+TRACE_PATH = None  # Set to a file name to append every trial as a JSON line
+FORMALISM = select_formalism(load_config("../config.yaml"))  # KET if noiseless, else DM; pass "KET" or "DM" to override
 m_values = list(range(20, 400, 20))  # Range of m values
 
 
@@ -51,41 +64,79 @@ def upper_bound_failure_probability(m, mu, lam):
 
 def simulate_chunk(args):
     m, chunk_size = args
+    set_formalism(FORMALISM)
     node1_program = Node1Program(m=m, mu=mu, lam=lam)
     node2_program = Node2Program(m=m, mu=mu, lam=lam)
     sender_program = SenderProgram(m=m)
 
-    results = run(
+    counter = FailureCounter(is_failure)
+    reducers = [counter]
+    if TRACE_PATH is not None:
+        reducers.append(TraceAppender(TRACE_PATH, m=m))
+
+    run_streaming(
         config=cfg,
         programs={"Node1": node1_program, "Node2": node2_program, "Sender": sender_program},
-        num_times=chunk_size
+        num_times=chunk_size,
+        reducers=reducers,
     )
 
-    failures = 0
-    for i in range(chunk_size):
-        sender_output = results[0][i]["xs"]
-        node1_output = results[1][i]["y0"]
-        node2_output = results[2][i]["y1"]
-        if sender_output != node2_output or node1_output is None:
-            failures += 1
-
-    return m, failures, chunk_size
+    flush_trial_log()
+    return m, counter.failures, chunk_size
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--debug-log", action="store_true",
+                        help="buffer per trial events and write them per chunk to trial_log_<pid>.jsonl")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile every worker with cProfile and merge the stats into profile/")
+    parser.add_argument("--memory-profile", action="store_true",
+                        help="record peak RSS and top allocations of every task in memory/")
+    parser.add_argument("--telemetry", action="store_true",
+                        help="rewrite telemetry.json and telemetry.prom with the progress every few seconds")
+    parser.add_argument("--progress", action="store_true", help="with --telemetry, show a progress line")
+    parser.add_argument("--memory-budget", type=float, default=None,
+                        help="total memory budget in MB, sets the number of workers and the chunk size")
+    args = parser.parse_args()
+
+    num_workers, num_chunks = NUM_CORES, NUM_CORES
+    if args.memory_budget is not None:
+        # Per trial memory as a function of m, measured on small chunks, held for one batch at a time
+        model = calibrate(simulate_chunk, min(m_values), max(m_values), batch_size=BATCH_SIZE)
+        num_workers, chunk_size = plan_workers(args.memory_budget, model, max(m_values), N, NUM_CORES)
+        num_chunks = math.ceil(N / chunk_size)
+        print(f"Memory budget {args.memory_budget:.0f} MB: {num_workers} workers, chunks of {chunk_size} trials "
+              f"({model.worker(max(m_values), chunk_size) / 2 ** 20:.0f} MB per worker at m={max(m_values)})")
+
     # Prepare chunked simulation tasks
     tasks = []
     for m in m_values:
-        base_chunk = N // NUM_CORES
-        remainder = N % NUM_CORES
-        for i in range(NUM_CORES):
+        base_chunk = N // num_chunks
+        remainder = N % num_chunks
+        for i in range(num_chunks):
             chunk = base_chunk + (1 if i < remainder else 0)
             if chunk > 0:
                 tasks.append((m, chunk))
 
     # Run parallel chunks
-    with Pool(processes=NUM_CORES) as pool:
-        chunk_results = pool.map(simulate_chunk, tasks)
+    if args.profile:
+        prepare_profile_dir()
+    task = ProfiledTask(simulate_chunk) if args.profile else simulate_chunk
+    if args.memory_profile:
+        os.makedirs("memory", exist_ok=True)
+        task = MemoryProfiledTask(task)
+    sweep_start = time.perf_counter()
+    with Pool(processes=num_workers, initializer=configure_trial_log, initargs=(args.debug_log,)) as pool:
+        if args.telemetry:
+            telemetry = Telemetry({("node1_faulty", m, 0.): N for m in m_values}, terminal=args.progress)
+            chunk_results = map_with_telemetry(pool, task, tasks, telemetry,
+                                               lambda r: (("node1_faulty", r[0], 0.), r[1], r[2]))
+        else:
+            chunk_results = pool.map(task, tasks)
+    print(f"Sweep wall time: {time.perf_counter() - sweep_start:.1f} s (debug log {'enabled' if args.debug_log else 'disabled'})")
+    if args.profile:
+        merge_profiles("node1_faulty")
 
     # Aggregate failures per m
     results_by_m = {}
@@ -1,6 +1,8 @@
 import random
 import math
 
+import netsquid as ns
+
 from netqasm.sdk import Qubit
 from netqasm.sdk.classical_communication.message import StructuredMessage
 
@@ -10,14 +12,47 @@ from squidasm.util.routines import (
     distributed_CNOT_target, teleport_send, teleport_recv,
 )
 
+from common.config import check_state_injection
+from common.noise_model import prepare_state_vector
+from common.routines import assign_state, teleport_send_concurrent
+from common.sender_strategy import SenderStrategy
+from common.trial_log import log_event
+
+# State of the sender qubits after a noiseless prepare_state
+PREPARED_STATE = prepare_state_vector()
+
+
+def abort_checkpoint(idx: int, m: int, interval: int) -> bool:
+    """Whether the sender tells the receivers after round idx if the trial goes on."""
+    return (idx + 1) % interval == 0 and idx < m - 1
+
+
 class SenderProgram(Program):
     PEER_NAME1 = "Node1"
     PEER_NAME2 = "Node2"
 
-    def __init__(self, m: int, mu: float, lam: float):
+    def __init__(self, m: int, mu: float, lam: float, concurrent_epr: bool = False,
+                 strategy: SenderStrategy = None, inject_state: bool = False, config: dict = None,
+                 early_abort: bool = False, abort_interval: int = 10):
         self.m = m
         self.mu = mu
         self.lam = lam
+        # Every abort_interval rounds, stop the trial once the attack can no longer
+        # be carried out (the receivers need the same settings)
+        self.early_abort = early_abort
+        self.abort_interval = abort_interval
+        # Checkset composition of the attack, the original one by default
+        self.strategy = strategy if strategy is not None else SenderStrategy()
+        # Request the EPR pairs to both receivers in one subroutine
+        self.concurrent_epr = concurrent_epr
+        # Skip the gates of prepare_state and assign the prepared state in NetSquid,
+        # only equivalent without gate noise, which is checked on the config the
+        # program runs on
+        if inject_state:
+            if config is None:
+                raise ValueError("inject_state requires the config, to check that the sender has no gate noise")
+            check_state_injection(config)
+        self.inject_state = inject_state
 
     def prepare_state(self, q0: Qubit, q1: Qubit, q2: Qubit, q3: Qubit):
         q0.H()
@@ -41,6 +76,15 @@ class SenderProgram(Program):
         q0.cnot(q2)
 
 
+    def prepare_round_state(self, context: ProgramContext, q0: Qubit, q1: Qubit, q2: Qubit, q3: Qubit):
+        """Run prepare_state, or with inject_state assign its output state directly."""
+        if self.inject_state:
+            # The qubits have to be allocated before their state can be assigned
+            yield from context.connection.flush()
+            assign_state(context, "Sender", [q0, q1, q2, q3], PREPARED_STATE)
+        else:
+            self.prepare_state(q0, q1, q2, q3)
+
     @property
     def meta(self) -> ProgramMeta:
         return ProgramMeta(
@@ -52,6 +96,7 @@ class SenderProgram(Program):
 
     def run(self, context: ProgramContext):
 
+        start_time = ns.sim_time()
         csocket1 = context.csockets[self.PEER_NAME1]
         csocket2 = context.csockets[self.PEER_NAME2]
         connection = context.connection
@@ -70,22 +115,28 @@ class SenderProgram(Program):
         class_0011 = []
         class_mixed = []
         class_1100 = []
+        T = math.ceil(self.m * self.mu)
+        Q = T - math.ceil(T*self.lam) + 1
         for idx in range(self.m):
+            at_checkpoint = self.early_abort and abort_checkpoint(idx, self.m, self.abort_interval)
             #Implement the circuit
             q0 = Qubit(connection)
             q1 = Qubit(connection)
             q2 = Qubit(connection)
             q3 = Qubit(connection)
 
-            self.prepare_state(q0,q1,q2,q3)
+            yield from self.prepare_round_state(context, q0, q1, q2, q3)
 
             #Measure Qubits
             r0 = q0.measure()
             r1 = q1.measure()
 
             #Distribute the qubits, q2 and q3 are inactive now
-            yield from teleport_send(q=q2,context=context, peer_name=self.PEER_NAME1)
-            yield from teleport_send(q=q3, context=context, peer_name=self.PEER_NAME2)
+            if self.concurrent_epr:
+                yield from teleport_send_concurrent({self.PEER_NAME1: q2, self.PEER_NAME2: q3}, context=context)
+            else:
+                yield from teleport_send(q=q2,context=context, peer_name=self.PEER_NAME1)
+                yield from teleport_send(q=q3, context=context, peer_name=self.PEER_NAME2)
             yield from connection.flush()
 
             # classify to correct class
@@ -96,16 +147,21 @@ class SenderProgram(Program):
             else:
                 class_mixed.append(idx)
 
-        l1 = len(class_0011)
-        l2 = len(class_mixed)
-        l3 = len(class_1100)
-
-        T = math.ceil(self.m * self.mu)
-        Q = T - math.ceil(T*self.lam) + 1
-
-        if T- Q <= l1 and Q <=l2 and T<=l3:
-            checkset1 = set(class_0011[:T - Q] + class_mixed[:Q])
-            checkset2 = class_1100
+            if at_checkpoint:
+                doomed = self.strategy.doomed(
+                    len(class_0011), len(class_mixed), len(class_1100), self.m - idx - 1, T, Q
+                )
+                csocket1.send(doomed)
+                csocket2.send(doomed)
+                if doomed:
+                    #ASSUME FAILURE, the receivers stop as well
+                    yield from connection.flush()
+                    log_event("Sender", "aborted", round=idx, x0=x0, x1=x1, xs=-1)
+                    return {"xs": -1, "aborted_round": idx, "sim_duration": ns.sim_time() - start_time}
+
+        checksets = self.strategy.checksets(class_0011, class_mixed, class_1100, T, Q)
+        if checksets is not None:
+            checkset1, checkset2 = checksets
         else:
             #ASSUME FAILURE
             xs = -1
@@ -115,18 +171,21 @@ class SenderProgram(Program):
         csocket2.send(checkset2)
         yield from connection.flush()
 
-        print(f"Sender sent x0 = {x0} to Node1 and x1 = {x1} to Node2 and it's output is {xs}")
-        return {"xs": xs}
+        log_event("Sender", "result", x0=x0, x1=x1, xs=xs)
+        return {"xs": xs, "sim_duration": ns.sim_time() - start_time}
 
 
 class Node1Program(Program):
     SENDER = "Sender"
     PEER_NAME = "Node2"
 
-    def __init__(self, m: int, mu: float, lam: float):
+    def __init__(self, m: int, mu: float, lam: float, early_abort: bool = False, abort_interval: int = 10):
         self.m = m
         self.mu = mu
         self.lam = lam
+        # Must match the sender's settings
+        self.early_abort = early_abort
+        self.abort_interval = abort_interval
 
     @property
     def meta(self) -> ProgramMeta:
@@ -139,6 +198,7 @@ class Node1Program(Program):
 
     def run(self, context: ProgramContext):
 
+        start_time = ns.sim_time()
         csocket_s = context.csockets[self.SENDER]
         csocket_n = context.csockets[self.PEER_NAME]
         connection = context.connection
@@ -156,6 +216,12 @@ class Node1Program(Program):
             yield from connection.flush()
             measurements.append(int(r2))
 
+            if self.early_abort and abort_checkpoint(idx, self.m, self.abort_interval):
+                aborted = yield from csocket_s.recv()
+                if aborted:
+                    log_event("Node1", "aborted", round=idx)
+                    return {"y0": None, "sim_duration": ns.sim_time() - start_time}
+
         checkset = yield from csocket_s.recv()
 
         #CHECK PHASE
@@ -170,18 +236,21 @@ class Node1Program(Program):
         csocket_n.send(checkset)
         connection.flush()
 
-        print(f"Node 1 result: {y0}")
+        log_event("Node1", "result", y0=y0)
 
-        return {"y0": y0}
+        return {"y0": y0, "sim_duration": ns.sim_time() - start_time}
 
 class Node2Program(Program):
     SENDER = "Sender"
     PEER_NAME = "Node1"
 
-    def __init__(self, m: int, mu: float, lam: float):
+    def __init__(self, m: int, mu: float, lam: float, early_abort: bool = False, abort_interval: int = 10):
         self.m = m
         self.mu = mu
         self.lam = lam
+        # Must match the sender's settings
+        self.early_abort = early_abort
+        self.abort_interval = abort_interval
 
     @property
     def meta(self) -> ProgramMeta:
@@ -194,6 +263,7 @@ class Node2Program(Program):
 
     def run(self, context: ProgramContext):
 
+        start_time = ns.sim_time()
         csocket_s = context.csockets[self.SENDER]
         csocket_n = context.csockets[self.PEER_NAME]
         connection = context.connection
@@ -210,6 +280,12 @@ class Node2Program(Program):
             yield from connection.flush()
             measurements.append(int(r3))
 
+            if self.early_abort and abort_checkpoint(idx, self.m, self.abort_interval):
+                aborted = yield from csocket_s.recv()
+                if aborted:
+                    log_event("Node2", "aborted", round=idx)
+                    return {"y1": None, "sim_duration": ns.sim_time() - start_time}
+
         checkset = yield from csocket_s.recv()
 
         #CHECK PHASE
@@ -238,5 +314,5 @@ class Node2Program(Program):
             y1 = y_inter
 
 
-        print(f"Node 2 result: {y1}")
-        return {"y1": y1}
\ No newline at end of file
+        log_event("Node2", "result", y1=y1)
+        return {"y1": y1, "sim_duration": ns.sim_time() - start_time}
\ No newline at end of file
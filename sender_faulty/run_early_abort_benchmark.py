@@ -0,0 +1,97 @@
+import sys
+import time
+import math
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.append("..")
+from application import Node1Program, Node2Program, SenderProgram, abort_checkpoint
+from common.config import load_config, select_formalism, set_formalism
+from common.noise_model import round_distribution
+from common.sender_strategy import SenderStrategy
+from squidasm.run.stack.config import StackNetworkConfig
+from squidasm.run.stack.run import run
+
+# Compare full sender faulty trials with trials stopped once the attack is doomed
+cfg = StackNetworkConfig.from_file("../config.yaml")
+mu, lam = 0.272, 0.94
+N = 100                              # Runs per (mode, m)
+m_values = list(range(20, 400, 60))  # Range of m values
+FORMALISM = select_formalism(load_config("../config.yaml"))  # KET if noiseless, else DM; pass "KET" or "DM" to override
+ABORT_INTERVAL = 10
+modes = {
+    "full": dict(),
+    "early abort": dict(early_abort=True, abort_interval=ABORT_INTERVAL),
+}
+
+
+def expected_rounds(m, num_trials=100_000, seed=1):
+    """Mean number of simulated rounds with early abort, from sampled round classes."""
+    probs = round_distribution(load_config("../config.yaml"))
+    c = [probs[0, 0].sum(), probs[0, 1].sum() + probs[1, 0].sum(), probs[1, 1].sum()]
+    T = math.ceil(mu * m)
+    Q = T - math.ceil(T * lam) + 1
+    n_0011, n_mixed, n_1100 = SenderStrategy().quotas(T, Q)
+
+    classes = np.random.default_rng(seed).choice(3, size=(num_trials, m), p=np.array(c) / sum(c))
+    l1 = np.cumsum(classes == 0, axis=1)
+    l2 = np.cumsum(classes == 1, axis=1)
+    l3 = np.cumsum(classes == 2, axis=1)
+    remaining = m - 1 - np.arange(m)
+    deficit = np.maximum(n_0011 - l1, 0) + np.maximum(n_mixed - l2, 0) + np.maximum(n_1100 - l3, 0)
+    checkpoints = np.array([abort_checkpoint(idx, m, ABORT_INTERVAL) for idx in range(m)])
+    doomed = (deficit > remaining) & checkpoints
+    stop = np.where(doomed.any(axis=1), doomed.argmax(axis=1) + 1, m)
+    return stop.mean()
+
+
+def benchmark(m, mode_kwargs):
+    set_formalism(FORMALISM)
+    start = time.perf_counter()
+    results = run(
+        config=cfg,
+        programs={
+            "Node1": Node1Program(m=m, mu=mu, lam=lam, **mode_kwargs),
+            "Node2": Node2Program(m=m, mu=mu, lam=lam, **mode_kwargs),
+            "Sender": SenderProgram(m=m, mu=mu, lam=lam, **mode_kwargs),
+        },
+        num_times=N
+    )
+    wall_time = (time.perf_counter() - start) / N
+
+    # Same failure criterion as run_simulation.py
+    failures = 0
+    for i in range(N):
+        y0, y1 = results[1][i]["y0"], results[2][i]["y1"]
+        failures += int(y0 != y1 and y0 is not None and y1 is not None) + int(results[0][i]["xs"] == -1)
+    return failures / N, wall_time
+
+
+if __name__ == "__main__":
+    measurements = {mode: [] for mode in modes}
+    for m in m_values:
+        for mode, mode_kwargs in modes.items():
+            measurements[mode].append(benchmark(m, mode_kwargs))
+        (full_prob, full_wall), (abort_prob, abort_wall) = measurements["full"][-1], measurements["early abort"][-1]
+        print(f"m = {m:4d}: failure {full_prob:.3f} / {abort_prob:.3f} (full / early abort), "
+              f"wall {full_wall:.3f} / {abort_wall:.3f} s per trial, saving {1 - abort_wall / full_wall:.0%}, "
+              f"expected rounds simulated {expected_rounds(m) / m:.0%}")
+
+    # Plotting
+    fig, (ax_wall, ax_saving) = plt.subplots(1, 2, figsize=(11, 4))
+    for mode in modes:
+        ax_wall.plot(m_values, [r[1] for r in measurements[mode]], 'o-', label=mode)
+    ax_saving.plot(
+        m_values, [1 - a[1] / f[1] for f, a in zip(measurements["full"], measurements["early abort"])],
+        'o-', label="measured"
+    )
+    ax_saving.plot(m_values, [1 - expected_rounds(m) / m for m in m_values], 'g--', label="rounds skipped (model)")
+    ax_wall.set_ylabel("wall time per trial [s]")
+    ax_saving.set_ylabel("wall time saving")
+    for ax in (ax_wall, ax_saving):
+        ax.set_xlabel("number of four-qubit singlet states, $m$")
+        ax.grid(True)
+        ax.legend()
+    fig.suptitle(f"Early abort of doomed trials (Sender Faulty, N={N})")
+    fig.tight_layout()
+    fig.savefig("early_abort_benchmark.png", dpi=300)
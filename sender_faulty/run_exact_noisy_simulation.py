@@ -0,0 +1,43 @@
+import sys
+import time
+import matplotlib.pyplot as plt
+
+sys.path.append("..")
+from common.config import load_config, set_gate_noise
+from common.exact import sender_faulty_failure
+from common.noise_model import round_distribution
+
+# Parameters, same grid as run_noisy_simulation.py
+mu, lam = 0.272, 0.94
+m = 300                             # Value of m
+prob_values = list(range(0, 31, 1))  # 0 to 30 inclusive, step 1
+div = 100000  # For precision in gate depolarizing prob
+
+
+def exact_failure_prob(p):
+    config = set_gate_noise(load_config("../config.yaml"), p / div)
+    probs = round_distribution(config)
+    return sender_faulty_failure(probs, m, mu, lam)
+
+
+if __name__ == "__main__":
+    p_values = []
+    failure_probs = []
+    for p in prob_values:
+        start = time.perf_counter()
+        failure_probs.append(exact_failure_prob(p))
+        elapsed = time.perf_counter() - start
+        p_values.append(p / div)
+        print(f"p = {p / div:.6f}: failure probability {failure_probs[-1]:.6f} ({elapsed * 1000:.1f} ms)")
+
+    # Plotting
+    plt.figure(figsize=(8, 5))
+    plt.plot(p_values, failure_probs, 'o-', label="Exact")
+    plt.axhline(y=0.05, color='red', linestyle='--', label="5% Threshold")
+    plt.xlabel("Gate Depolarizing Probability")
+    plt.ylabel("Failure Probability")
+    plt.title(f"Exact Failure Probability vs Gate Depolarizing Probability (Sender Faulty, m={m})")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig("sender_faulty_noise_exact.png", dpi=300)
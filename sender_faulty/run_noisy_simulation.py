@@ -1,23 +1,35 @@
+import argparse
 import os
+import sys
+import time
 import tempfile
 import yaml
 import matplotlib.pyplot as plt
 import numpy as np
 
 from squidasm.run.stack.config import StackNetworkConfig
+sys.path.append("..")
+from common.profiling import ProfiledTask, merge_profiles, prepare_profile_dir
+from common.trial_log import configure_trial_log, flush_trial_log
 from application import Node1Program, Node2Program, SenderProgram
 from multiprocessing import Pool, cpu_count
 from squidasm.run.stack.run import run
 
+from common.config import load_config, select_formalism, set_formalism, set_gate_noise
+from common.exact import sender_faulty_failure
+from common.noise_model import round_distribution
+
 # Parameters
 mu, lam = 0.272, 0.94
 N = 1000  # Total number of runs per probability value
 m = 300
 div = 100000  # For precision in gate depolarizing prob
+FORMALISM = None  # None: KET if noiseless, else DM, for every p; pass "KET" or "DM" to override
 prob_values = list(range(0, 31, 1))  # 0 to 30 inclusive, step 1
 
 def simulate_failure_prob(p):
     p_value = p / div
+    set_formalism(select_formalism(set_gate_noise(load_config("../config.yaml"), p_value), FORMALISM))
 
     # Initialize programs
     node1_program = Node1Program(m=m, mu=mu, lam=lam)
@@ -74,11 +86,25 @@ def simulate_failure_prob(p):
         if os.path.exists(temp_path):
             os.remove(temp_path)
 
+    flush_trial_log()
     return failure_prob, sem, p
 
 if __name__ == "__main__":
-    with Pool(processes=cpu_count()) as pool:
-        results = pool.map(simulate_failure_prob, prob_values)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--debug-log", action="store_true",
+                        help="buffer per trial events and write them per chunk to trial_log_<pid>.jsonl")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile every worker with cProfile and merge the stats into profile/")
+    args = parser.parse_args()
+
+    if args.profile:
+        prepare_profile_dir()
+    sweep_start = time.perf_counter()
+    with Pool(processes=cpu_count(), initializer=configure_trial_log, initargs=(args.debug_log,)) as pool:
+        results = pool.map(ProfiledTask(simulate_failure_prob) if args.profile else simulate_failure_prob, prob_values)
+    print(f"Sweep wall time: {time.perf_counter() - sweep_start:.1f} s (debug log {'enabled' if args.debug_log else 'disabled'})")
+    if args.profile:
+        merge_profiles("sender_faulty_noise")
 
     # Sort results by p
     results.sort(key=lambda x: x[2])
@@ -89,6 +115,12 @@ if __name__ == "__main__":
     # Plotting
     plt.figure(figsize=(8, 5))
     plt.errorbar(p_values, failure_probs, yerr=error_bars, fmt='o-', capsize=5, label="Failure Probability")
+    # Exact curve from the per round outcome distribution
+    exact_probs = [
+        sender_faulty_failure(round_distribution(set_gate_noise(load_config("../config.yaml"), p_value)), m, mu, lam)
+        for p_value in p_values
+    ]
+    plt.plot(p_values, exact_probs, 'g--', label="Exact")
     plt.axhline(y=0.05, color='red', linestyle='--', label="5% Threshold")
     plt.xlabel("Gate Depolarizing Probability")
     plt.ylabel("Failure Probability")
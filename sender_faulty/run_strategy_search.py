@@ -0,0 +1,144 @@
+"""Search the faulty sender's strategy space for the worst case attack.
+
+Every strategy of common.sender_strategy.strategy_space() is scored per m with the
+fast outcome model on the noisy per round distribution of config.yaml, all
+strategies of one m sharing their random numbers. The top strategies per m are
+then confirmed with SquidASM, which also models what the outcome model leaves out
+(decoherence). Results are written to strategy_search.csv.
+"""
+import argparse
+import csv
+import math
+import sys
+import time
+import numpy as np
+sys.path.append("..")
+from common.trial_log import configure_trial_log, flush_trial_log
+from application import Node1Program, Node2Program, SenderProgram
+from multiprocessing import Pool, cpu_count
+from squidasm.run.stack.config import StackNetworkConfig
+
+from common.config import load_config, select_formalism, set_formalism
+from common.noise_model import round_distribution
+from common.sender_strategy import SenderStrategy, simulate_outcomes, strategy_space
+from common.streaming import FailureCounter, run_streaming
+
+# Fixed config
+cfg = StackNetworkConfig.from_file("../config.yaml")
+mu, lam = 0.272, 0.94
+
+m_values = [100, 200, 300]
+FAST_TRIALS = 200_000  # Outcome model trials per strategy and m
+N = 1000  # SquidASM trials per confirmed strategy
+TOP = 3  # Strategies confirmed per m
+SEED = 1
+NUM_CORES = cpu_count()
+FORMALISM = select_formalism(load_config("../config.yaml"))  # KET if noiseless, else DM; pass "KET" or "DM" to override
+
+probs_per_round = round_distribution(load_config("../config.yaml"))
+
+
+def is_disagreement(sender_result, node1_result, node2_result):
+    node1_output = node1_result["y0"]
+    node2_output = node2_result["y1"]
+    return node1_output != node2_output and node1_output is not None and node2_output is not None
+
+
+def is_abort(sender_result, node1_result, node2_result):
+    return sender_result["xs"] == -1
+
+
+def score_strategy(args):
+    m, strategy_idx = args
+    strategy = strategy_space()[strategy_idx]
+    # Same seed for every strategy of one m (common random numbers)
+    rng = np.random.default_rng([SEED, m])
+    return m, strategy_idx, simulate_outcomes(strategy, probs_per_round, m, mu, lam, FAST_TRIALS, rng)
+
+
+def confirm_chunk(args):
+    m, strategy_idx, chunk_size = args
+    set_formalism(FORMALISM)
+    strategy = strategy_space()[strategy_idx]
+    node1_program = Node1Program(m=m, mu=mu, lam=lam)
+    node2_program = Node2Program(m=m, mu=mu, lam=lam)
+    sender_program = SenderProgram(m=m, mu=mu, lam=lam, strategy=strategy)
+
+    disagreements = FailureCounter(is_disagreement)
+    aborts = FailureCounter(is_abort)
+    run_streaming(
+        config=cfg,
+        programs={"Node1": node1_program, "Node2": node2_program, "Sender": sender_program},
+        num_times=chunk_size,
+        reducers=[disagreements, aborts],
+    )
+
+    flush_trial_log()
+    return m, strategy_idx, disagreements.failures, aborts.failures, chunk_size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skip-confirm", action="store_true",
+                        help="only run the outcome model search")
+    args = parser.parse_args()
+
+    strategies = strategy_space()
+
+    # Shortlist with the outcome model
+    search_start = time.perf_counter()
+    with Pool(processes=NUM_CORES) as pool:
+        scores = pool.map(score_strategy, [(m, i) for m in m_values for i in range(len(strategies))])
+    print(f"Scored {len(strategies)} strategies at {len(m_values)} values of m "
+          f"in {time.perf_counter() - search_start:.1f} s")
+
+    shortlist = {}
+    for m in m_values:
+        ranked = sorted((s for s in scores if s[0] == m), key=lambda s: -s[2]["disagreements"])
+        shortlist[m] = ranked[:TOP]
+        baseline = simulate_outcomes(SenderStrategy(), probs_per_round, m, mu, lam, FAST_TRIALS,
+                                     np.random.default_rng([SEED, m]))
+        print(f"m = {m}: original attack disagreement {baseline['disagreements'] / FAST_TRIALS:.4f}")
+        for _, idx, outcome in shortlist[m]:
+            print(f"  {strategies[idx]}: disagreement {outcome['disagreements'] / FAST_TRIALS:.4f}, "
+                  f"abandoned {outcome['aborts'] / FAST_TRIALS:.4f}")
+
+    # Confirm the shortlist in SquidASM
+    confirmed = {}
+    if not args.skip_confirm:
+        tasks = []
+        for m in m_values:
+            for _, idx, _ in shortlist[m]:
+                for i in range(NUM_CORES):
+                    chunk = N // NUM_CORES + (1 if i < N % NUM_CORES else 0)
+                    if chunk > 0:
+                        tasks.append((m, idx, chunk))
+
+        confirm_start = time.perf_counter()
+        with Pool(processes=NUM_CORES, initializer=configure_trial_log) as pool:
+            chunk_results = pool.map(confirm_chunk, tasks)
+        print(f"Confirmed {sum(len(v) for v in shortlist.values())} strategies "
+              f"in {time.perf_counter() - confirm_start:.1f} s")
+
+        for m, idx, disagreements, aborts, runs in chunk_results:
+            total = confirmed.setdefault((m, idx), {"disagreements": 0, "aborts": 0, "runs": 0})
+            total["disagreements"] += disagreements
+            total["aborts"] += aborts
+            total["runs"] += runs
+
+    with open("strategy_search.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["m", "strategy", "model_disagreement", "model_abandoned",
+                         "squidasm_disagreement", "squidasm_sem", "squidasm_abandoned"])
+        for m in m_values:
+            for _, idx, outcome in shortlist[m]:
+                row = [m, repr(strategies[idx]), outcome["disagreements"] / FAST_TRIALS,
+                       outcome["aborts"] / FAST_TRIALS]
+                if (m, idx) in confirmed:
+                    total = confirmed[(m, idx)]
+                    prob = total["disagreements"] / total["runs"]
+                    sem = math.sqrt(prob * (1 - prob) / total["runs"])
+                    row += [prob, sem, total["aborts"] / total["runs"]]
+                    print(f"m = {m}, {strategies[idx]}: SquidASM disagreement {prob:.4f} +- {sem:.4f} "
+                          f"(model {outcome['disagreements'] / FAST_TRIALS:.4f})")
+                writer.writerow(row)
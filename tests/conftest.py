@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scripts put the repository root on the path with sys.path.append(".."), do the same here
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+from common import build_figures, pipeline
+
+
+@pytest.mark.parametrize("name", ["criteria.py", "streaming.py", "config.py", "trial_log.py"])
+def test_cell_key_hashes_the_failure_code(monkeypatch, name):
+    key = build_figures.cell_key("no_faulty", 100, 0.)
+    file_digest = pipeline.file_digest
+    # As if the file had been edited
+    monkeypatch.setattr(pipeline, "file_digest",
+                        lambda path: "edited" if os.path.basename(path) == name else file_digest(path))
+    assert build_figures.cell_key("no_faulty", 100, 0.) != key
+
+
+def test_cell_key_includes_the_formalism():
+    # Noiseless cells default to KET, noisy cells to DM
+    assert build_figures.cell_key("no_faulty", 100, 0.) == build_figures.cell_key("no_faulty", 100, 0., "KET")
+    assert build_figures.cell_key("no_faulty", 100, 1e-4) == build_figures.cell_key("no_faulty", 100, 1e-4, "DM")
+    assert build_figures.cell_key("no_faulty", 100, 1e-4) != build_figures.cell_key("no_faulty", 100, 1e-4, "KET")
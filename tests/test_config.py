@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from common.config import (
+    check_state_injection, is_noiseless, load_config, set_gate_noise, set_link_param, set_qdevice_param,
+)
+from common.pipeline import ROOT
+
+CONFIG_PATH = os.path.join(ROOT, "config.yaml")
+
+
+def test_state_injection_needs_noiseless_sender_gates():
+    check_state_injection(set_gate_noise(load_config(CONFIG_PATH), 0.))
+    with pytest.raises(ValueError, match="two_qubit_gate_depolar_prob = 1e-05"):
+        check_state_injection(set_qdevice_param(load_config(CONFIG_PATH), "two_qubit_gate_depolar_prob", 1e-5))
+    with pytest.raises(ValueError):
+        check_state_injection(set_gate_noise(load_config(CONFIG_PATH), 1e-4))
+
+
+def test_only_known_noiseless_configs_are_noiseless():
+    config = load_config(CONFIG_PATH)
+    assert is_noiseless(config)
+    assert not is_noiseless(set_qdevice_param(load_config(CONFIG_PATH), "T2", 1e9))
+    assert not is_noiseless(set_link_param(load_config(CONFIG_PATH), "fidelity", 0.99))
+
+    # A heralded link has no fidelity key, but is not perfect
+    heralded = load_config(CONFIG_PATH)
+    heralded["links"][0]["typ"] = "heralded"
+    heralded["links"][0]["cfg"] = {"length": 10}
+    assert not is_noiseless(heralded)
+
+    nv = load_config(CONFIG_PATH)
+    nv["stacks"][0]["qdevice_typ"] = "nv"
+    assert not is_noiseless(nv)
@@ -0,0 +1,39 @@
+from common.memory import MB, calibrate, measure_call, plan_workers
+
+# Bytes allocated per trial and per unit of m by allocate
+PER_M = 10_000
+
+
+def allocate(args):
+    m, chunk_size = args
+    return [bytearray(PER_M * m) for _ in range(chunk_size)]
+
+
+def test_calibration_uses_the_traced_peak_per_task():
+    model = calibrate(allocate, 10, 100)
+    assert abs(model.per_trial_b - PER_M) < 0.05 * PER_M
+    # Per trial memory is not counted in the base
+    assert model.base < model.worker(100, 1)
+    assert model.worker(100, 10) - model.worker(100, 1) > 9 * 0.95 * PER_M * 100
+
+    workers, chunk_size = plan_workers(model.worker(100, 5) * 2.01 / MB, model, 100, 1000, 2)
+    assert (workers, chunk_size) == (2, 5)
+
+
+def test_record_separates_the_task_peak_from_the_worker_high_water_mark():
+    measure_call(allocate, (1000, 5), top=0)
+    _, record = measure_call(allocate, (10, 1), top=0)
+    # The RSS high-water mark still holds the earlier, larger task
+    assert record["traced_peak_mb"] < 1
+    assert record["worker_max_rss_mb"] > 45
+
+
+def test_streamed_memory_is_bounded_by_the_batch():
+    model = calibrate(allocate, 10, 100, batch_size=3)
+    assert model.worker(100, 1000) == model.worker(100, 3)
+    # A budget for a whole batch per worker leaves the chunk size to the trials per cell
+    workers, chunk_size = plan_workers(model.worker(100, 3) * 2.01 / MB, model, 100, 1000, 2)
+    assert (workers, chunk_size) == (2, 500)
+    # Below a batch the chunk size is still limited by memory
+    workers, chunk_size = plan_workers((model.base + 2.5 * model.per_trial(100)) / MB, model, 100, 1000, 1)
+    assert (workers, chunk_size) == (1, 2)
@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+
+from common.config import load_config, set_gate_noise
+from common.multifidelity import OutcomeModel, mfmc_estimate
+from common.noise_model import round_distribution
+from common.pipeline import ROOT
+
+CONFIG_PATH = os.path.join(ROOT, "config.yaml")
+
+
+def test_estimate_is_unbiased_when_the_model_is_wrong():
+    # The high fidelity level is a noisier model than the low fidelity one
+    config = load_config(CONFIG_PATH)
+    m, mu = 30, 0.272
+    low = OutcomeModel(round_distribution(config), m, mu)
+    high = OutcomeModel(round_distribution(set_gate_noise(config, 0.02)), m, mu)
+    rng = np.random.default_rng(0)
+
+    def trials(model, xs, uniforms):
+        return model.failures(xs, model.sender_codes(uniforms), rng)
+
+    truth = trials(high, *high.sample_inputs(200_000, rng)).mean()
+    estimates = []
+    for _ in range(300):
+        xs, uniforms = low.sample_inputs(100, rng)
+        y_hi, g_paired = trials(high, xs, uniforms), trials(low, xs, uniforms)
+        extra_sum = trials(low, *low.sample_inputs(5_000, rng)).sum()
+        estimates.append(mfmc_estimate(y_hi, g_paired, extra_sum, 5_000)[0])
+    assert abs(np.mean(estimates) - truth) < 4 * np.std(estimates) / np.sqrt(len(estimates)) + 3e-3
+    # The shared uniforms keep the levels correlated
+    xs, uniforms = low.sample_inputs(20_000, rng)
+    assert np.corrcoef(trials(high, xs, uniforms), trials(low, xs, uniforms))[0, 1] > 0.15
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from common import pipeline
+from common.planner import calibration_key
+
+
+def test_calibration_key_follows_the_grid():
+    key = calibration_key("no_faulty", [20, 100], [0.], 0.272, 0.94)
+    assert calibration_key("no_faulty", [100, 20], [0.], 0.272, 0.94) == key
+    assert calibration_key("no_faulty", [20, 300], [0.], 0.272, 0.94) != key
+    assert calibration_key("no_faulty", [20, 100], [0., 1e-4], 0.272, 0.94) != key
+    assert calibration_key("node1_faulty", [20, 100], [0.], 0.272, 0.94) != key
+
+
+def test_calibration_key_follows_the_formalism():
+    key = calibration_key("no_faulty", [20, 100], [0., 1e-4], 0.272, 0.94)
+    # By default the noiseless point runs in KET and the noisy one in DM
+    assert calibration_key("no_faulty", [20, 100], [0., 1e-4], 0.272, 0.94, "DM") != key
+    assert calibration_key("no_faulty", [20, 100], [0.], 0.272, 0.94, "KET") == \
+        calibration_key("no_faulty", [20, 100], [0.], 0.272, 0.94)
+
+
+@pytest.mark.parametrize("name", ["config.py", "trial_log.py", "routines.py"])
+def test_calibration_key_hashes_the_common_code(monkeypatch, name):
+    key = calibration_key("no_faulty", [20, 100], [0.], 0.272, 0.94)
+    file_digest = pipeline.file_digest
+    monkeypatch.setattr(pipeline, "file_digest",
+                        lambda path: "edited" if os.path.basename(path) == name else file_digest(path))
+    assert calibration_key("no_faulty", [20, 100], [0.], 0.272, 0.94) != key
@@ -0,0 +1,41 @@
+import cProfile
+import io
+import pstats
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from common.profiling import collapsed_stacks
+
+
+def profile_of_savefig(path):
+    """pstats of importing and saving a matplotlib figure, a few thousand functions."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    fig, ax = plt.subplots()
+    ax.errorbar(range(20), range(20), yerr=1, fmt="rx", capsize=5, label="Monte Carlo")
+    ax.set_title("$m$ sweep")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(io.BytesIO(), format="png", dpi=100)
+    plt.close(fig)
+    profiler.disable()
+    profiler.dump_stats(path)
+    return pstats.Stats(str(path))
+
+
+def test_collapsed_stacks_is_bounded_on_a_large_profile(tmp_path):
+    stats = profile_of_savefig(tmp_path / "savefig.prof")
+    assert len(stats.stats) > 1000
+
+    start = time.perf_counter()
+    lines = collapsed_stacks(stats)
+    assert time.perf_counter() - start < 30
+
+    # The folded stacks keep the total own time
+    own_time = sum(v[2] for v in stats.stats.values())
+    folded = sum(int(line.rsplit(" ", 1)[1]) for line in lines) / 1e6
+    assert abs(folded - own_time) < 0.01 * own_time + 1e-3 * len(lines)
+    assert all(len(line.rsplit(" ", 1)[0].split(";")) <= 40 for line in lines)
@@ -0,0 +1,54 @@
+import math
+
+import numpy as np
+
+from common.surface import Surface, decreasing_fit, refine, unimodal_fit, unresolved
+
+
+def brute_force_error(values, weights):
+    """Smallest error of a non-increasing, then non-decreasing fit over every split."""
+    return min(
+        np.sum(weights * (np.concatenate([
+            decreasing_fit(values[:k], weights[:k]),
+            decreasing_fit(values[k:][::-1], weights[k:][::-1])[::-1],
+        ]) - values) ** 2)
+        for k in range(len(values) + 1)
+    )
+
+
+def test_unimodal_fit_is_optimal():
+    rng = np.random.default_rng(1)
+    for _ in range(500):
+        n = rng.integers(1, 30)
+        runs = rng.integers(1, 2000, n).astype(float)
+        values = rng.binomial(runs.astype(int), rng.uniform(0, 0.2)) / runs
+        fit = unimodal_fit(values, runs)
+        turn = int(np.argmin(fit))
+        assert np.all(np.diff(fit[:turn + 1]) <= 1e-12) and np.all(np.diff(fit[turn:]) >= -1e-12)
+        assert np.sum(runs * (fit - values) ** 2) <= brute_force_error(values, runs) * (1 + 1e-9) + 1e-15
+
+
+def test_refine_stops_at_the_band_width():
+    surface = Surface()
+    for m, prob in zip(range(20, 220, 20), [0.3, 0.2, 0.12, 0.08, 0.06, 0.05, 0.03, 0.02, 0.02, 0.02]):
+        surface.add(m, 0., round(prob * 1000), 1000)
+    args = (surface, 0.05, (20, 200), 20, 1e-6, 200, 20000)
+    # A wide band of m* asks for more trials in it, a narrow one only for the bracket split
+    wide = refine(*args, bands={0.: ((90, 140), (math.inf, math.inf))}, band=20)
+    narrow = refine(*args, bands={0.: ((110, 120), (math.inf, math.inf))}, band=20)
+    assert {m for m, _, _ in wide} > {m for m, _, _ in narrow}
+    # Cells in the band double their trials, new cells between them start with as many
+    assert all(n == 1000 for _, _, n in wide)
+
+
+def test_a_noisy_dip_is_not_a_resolved_crossing():
+    # Every cell just above the target, one noisy cell below it
+    surface = Surface()
+    for m, failures in zip(range(266, 300, 4), [14, 12, 7, 14, 12, 12, 12, 10, 19]):
+        surface.add(m, 6e-5, failures, 200)
+    narrow = {6e-5: ((266, 290), (273, 293))}
+    assert unresolved(surface, 0.05, narrow, band=40) == {6e-5: ["m*", "m**"]}
+
+    # With the dip confirmed by enough trials the same bands are resolved
+    surface.add(274, 6e-5, 100, 19800)
+    assert unresolved(surface, 0.05, narrow, band=40) == {6e-5: []}
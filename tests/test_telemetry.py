@@ -0,0 +1,41 @@
+import time
+
+from common.surface import wilson_interval
+from common.telemetry import Telemetry, openmetrics
+
+
+def test_intervals_are_wilson_and_rates_windowed(tmp_path):
+    telemetry = Telemetry({("no_faulty", 20, 0.): 100, ("no_faulty", 300, 0.): 100}, path=str(tmp_path / "t"),
+                          window=0.2)
+    telemetry.record(("no_faulty", 20, 0.), 0, 50, dict(pid=1, busy=1., cpu=1.))
+    state = telemetry.snapshot()
+    cell = state["cells"][0]
+    # No failures still gives an interval of non-zero width
+    assert cell["ci"] == list(wilson_interval(0, 50))
+    assert cell["ci"][1] > 0.05
+    assert state["trials_per_second_by_m"]["no_faulty"]["20"] > 0
+
+    time.sleep(0.3)
+    telemetry.record(("no_faulty", 300, 0.), 1, 10, dict(pid=1, busy=1., cpu=1.))
+    state = telemetry.snapshot()
+    # The chunk at m = 20 has left the window, the lifetime average keeps it
+    assert state["trials_per_second_by_m"]["no_faulty"]["20"] == 0.
+    assert state["trials_per_second_by_m"]["no_faulty"]["300"] > 0
+    assert abs(state["trials_per_second_lifetime"] * state["elapsed_seconds"] - 60) < 1e-6
+    assert "sweep_trials_per_second_lifetime" in openmetrics(state)
+
+
+def test_openmetrics_families_are_contiguous(tmp_path):
+    cells = {("no_faulty", 20, 0.): 100, ("no_faulty", 300, 0.): 100}
+    telemetry = Telemetry(cells, path=str(tmp_path / "t"))
+    for cell in cells:
+        telemetry.record(cell, 1, 50, dict(pid=1, busy=1., cpu=1.))
+    families = []
+    for line in openmetrics(telemetry.snapshot()).splitlines():
+        if line.startswith("# TYPE "):
+            families.append(line.split()[2])
+        elif not line.startswith("#"):
+            name = line.split("{")[0].split()[0]
+            # Every sample follows the TYPE line of its own family
+            assert name in (families[-1], families[-1] + "_total")
+    assert families.count("sweep_failure_probability_ci") == 1